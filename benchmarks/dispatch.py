@@ -0,0 +1,52 @@
+"""Measure the per-command cost of SDG.dispatch.
+
+Usage: python -m benchmarks.dispatch [--number N]
+"""
+
+import argparse
+import logging
+import timeit
+
+from siglent_emulator.function_generator import sdg1032x
+
+COMMANDS = [
+    "*IDN?",
+    "*OPC?",
+    "BUZZ?",
+    "STL?",
+    "PACP C2,C1",
+    "C1:BSWV?",
+    "C2:OUTP?",
+    "C1:BSWV FRQ,1000",
+    "C2:BSWV OFST,0",
+    "C1:OUTP PLRT,NOR",
+    "C2:OUTP ON",
+    "XYZZY",
+]
+
+
+def main() -> None:
+    """Time dispatch() for each command and print nanoseconds per call."""
+    parser = argparse.ArgumentParser(prog="dispatch")
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    device = sdg1032x.new()
+    total = 0.0
+    for command in COMMANDS:
+        seconds = min(
+            timeit.repeat(
+                lambda cmd=command: device.dispatch(cmd),  # type: ignore[misc]
+                number=args.number,
+                repeat=5,
+            )
+        )
+        nsec = seconds / args.number * 1e9
+        total += nsec
+        print(f"{command:20} {nsec:8.0f} ns")
+    print(f"{'mean':20} {total / len(COMMANDS):8.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
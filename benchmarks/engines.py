@@ -0,0 +1,128 @@
+"""Compare the thread and asyncio serving engines under many concurrent clients.
+
+Each engine is run in its own emulator process. A single asyncio load generator
+opens the requested number of connections and every connection polls
+'C1:BSWV?' in a closed loop for the duration of the run.
+
+Usage: python -m benchmarks.engines [--connections N ...] [--duration S]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+QUERY = b"C1:BSWV?\n"
+
+
+def wait_for_listener(port: int, timeout: float = 10.0) -> None:
+    """Block until something accepts connections on the port."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def process_status(pid: int) -> Dict[str, str]:
+    """Return the Threads and VmRSS lines of /proc/<pid>/status (Linux only)."""
+    status: Dict[str, str] = {}
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+            for line in file:
+                key, _, val = line.partition(":")
+                if key in ["Threads", "VmRSS"]:
+                    status[key] = val.strip()
+    except OSError:
+        pass
+    return status
+
+
+async def poll(port: int, stop: float, counts: List[int], index: int) -> None:
+    """Open one connection and issue queries until the stop time."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.monotonic() < stop:
+            writer.write(QUERY)
+            await reader.readline()
+            counts[index] += 1
+    finally:
+        writer.close()
+
+
+async def load(
+    pid: int, port: int, connections: int, duration: float
+) -> Tuple[List[int], Dict[str, str]]:
+    """Run the closed-loop load.
+
+    Return the command count of every connection that completed and the
+    server's process status sampled halfway through the run.
+    """
+    counts = [0] * connections
+    stop = time.monotonic() + duration
+    tasks = asyncio.gather(
+        *[poll(port, stop, counts, i) for i in range(connections)],
+        return_exceptions=True,
+    )
+    await asyncio.sleep(duration / 2)
+    status = process_status(pid)
+    results = await tasks
+    served = [
+        count
+        for count, result in zip(counts, results)
+        if not isinstance(result, BaseException)
+    ]
+    return served, status
+
+
+def run(engine: str, port: int, connections: int, duration: float) -> None:
+    """Benchmark one engine at one connection count and print a result row."""
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+    env["PYTHONPATH"] = os.pathsep.join([src, env.get("PYTHONPATH", "")])
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "siglent_emulator.emulator", "sdg1032x"]
+        + ["--port", str(port), "--engine", engine],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_listener(port)
+        counts, status = asyncio.run(load(server.pid, port, connections, duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(counts)
+    print(
+        f"{engine:8} {connections:6} {len(counts):6} {total / duration:12.0f}"
+        f" {status.get('Threads', '?'):>8} {status.get('VmRSS', '?'):>12}"
+    )
+
+
+def main() -> None:
+    """Run the engine comparison."""
+    parser = argparse.ArgumentParser(prog="engines")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=21211)
+    args = parser.parse_args()
+
+    print(
+        f"{'engine':8} {'conns':>6} {'served':>6} {'cmds/sec':>12} {'threads':>8} {'rss':>12}"
+    )
+    for connections in args.connections:
+        for engine in ["thread", "asyncio"]:
+            run(engine, args.port, connections, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Microbenchmarks of the per-command path, checked against a stored baseline.
+
+Each case is timed with timeit and reported in nanoseconds per call (the best
+of several repeats). Results are printed as a table and optionally written as
+JSON. When a baseline is given, any case slower than the baseline by more than
+the threshold fails the run.
+
+Cases are compared relative to a fixed pure-Python reference workload timed in
+the same run, so a baseline recorded on one machine (or on a busy machine)
+still applies on another.
+
+Usage: python -m benchmarks.suite [--baseline FILE] [--threshold F]
+                                  [--output FILE] [--update-baseline]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import timeit
+from typing import Callable, Dict
+
+from siglent_emulator.function_generator import sdg1032x
+from siglent_emulator.function_generator import util
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+REFERENCE = "reference"
+
+
+def reference() -> int:
+    """A fixed workload that only depends on the interpreter and the machine."""
+    return sum(len(str(i)) for i in range(20))
+
+
+def cases() -> Dict[str, Callable[[], object]]:
+    """Return the benchmark cases by name."""
+    device = sdg1032x.new()
+    loads = itertools.cycle(["C1:OUTP LOAD,50", "C1:OUTP LOAD,HZ"])
+    frqs = itertools.cycle([f"C1:BSWV FRQ,{frq}" for frq in range(1, 1001)])
+    cycle = ["C2:BSWV AMP,3.3", "C2:BSWV?", "C2:OUTP LOAD,50", "C2:BSWV?"]
+    cycle += ["C2:OUTP LOAD,HZ", "C2:BSWV FRQ,1234", "C2:BSWV?"]
+    response = "C1:BSWV WVTP,SINE,FRQ,1000HZ,PERI,0.001S,AMP,4V,AMPVRMS,1.414Vrms"
+
+    return {
+        REFERENCE: reference,
+        "util.resize_verbs": lambda: util.resize_verbs(
+            "SYSTEM:COMMUNICATE:LAN:IPADDRESS?", util.Long_to_short
+        ),
+        "util.format_verbs": lambda: util.format_verbs.__wrapped__(response, "LONG"),
+        "util.divide": lambda: util.divide(n=19.99738, d=2),
+        "util.multiply": lambda: util.multiply(a=9.99869, b=2),
+        "process *IDN?": lambda: device.process("*IDN?"),
+        "process C1:BSWV?": lambda: device.process("C1:BSWV?"),
+        "process C1:BSWV FRQ": lambda: device.process(next(frqs)),
+        "process C1:OUTP LOAD": lambda: device.process(next(loads)),
+        "process PACP C2,C1": lambda: device.process("PACP C2,C1"),
+        "process set/query cycle": lambda: [device.process(cmd) for cmd in cycle],
+    }
+
+
+def run(number: int, repeat: int) -> Dict[str, float]:
+    """Time every case, return nanoseconds per call by case name."""
+    timers = {name: timeit.Timer(case) for name, case in cases().items()}
+    # Warm up caches (ours and the interpreter's) before timing
+    for timer in timers.values():
+        timer.timeit(number=number // 10)
+    # Interleave the cases so a burst of load on the machine hits every case
+    # in some rounds rather than one case in all of its rounds
+    best = {name: float("inf") for name in timers}
+    for _ in range(repeat):
+        for name, timer in timers.items():
+            best[name] = min(best[name], timer.timeit(number=number))
+    return {name: seconds / number * 1e9 for name, seconds in best.items()}
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], threshold: float
+) -> int:
+    """Print results next to the baseline. Return the number of regressions."""
+    regressions = 0
+    # Scale the baseline to the speed of this machine, right now
+    scale = results[REFERENCE] / baseline[REFERENCE] if REFERENCE in baseline else 1
+    print(f"{'case':28} {'ns/call':>10} {'baseline':>10} {'change':>8}")
+    for name, nsec in results.items():
+        if name not in baseline or name == REFERENCE:
+            print(f"{name:28} {nsec:10.0f} {'-':>10} {'-':>8}")
+            continue
+        change = nsec / (baseline[name] * scale) - 1
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(
+            f"{name:28} {nsec:10.0f} {baseline[name] * scale:10.0f} {change:+8.0%}{flag}"
+        )
+    return regressions
+
+
+def main() -> None:
+    """Run the suite."""
+    parser = argparse.ArgumentParser(prog="suite")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    results = run(number=args.number, repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        baseline = results
+    else:
+        try:
+            with open(args.baseline, encoding="utf-8") as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            baseline = {}
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions > 0:
+        print(
+            f"\n{regressions} case(s) slower than baseline by over {args.threshold:.0%}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
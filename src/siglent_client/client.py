@@ -1,31 +1,419 @@
-"""Connect to the bs_emulator in commandline mode for debugging."""
+"""Talk to a Siglent device or emulator from code, or interactively for debugging.
+
+Client sends commands and reads responses over one connection. Responses are
+split off a buffered stream of reads (see siglent_emulator.framing), so a
+response arriving in pieces, or several arriving in one read, cost nothing
+extra. query_many() pipelines: it sends a batch of queries before reading
+their responses. AsyncClient does the same on an asyncio event loop, and
+ConnectionPool keeps connections open for reuse, keyed by (host, port).
+
+Run from the command line it prompts for commands, or with --script sends a
+file of them (see Batch).
+
+A device only responds to queries, so write() never waits and query() always
+does. A query the device does not answer raises TimeoutError after timeout
+seconds. The connection cannot be trusted after that (the response may still
+arrive) and should be closed.
+"""
 
 # pylint: disable=unused-import,broad-except
 
+import argparse
+import asyncio
+import collections
+import contextlib
 import logging
 import readline  # magically provides command history for input()
 import socket
 import sys
+import threading
 import time
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from siglent_emulator import framing, metrics
+
+# Queries query_many() sends before reading their responses
+PIPELINE_DEPTH = 64
+
+# Seconds to wait for a connection or a response
+TIMEOUT = 10.0
+
+# Idle connections a pool keeps per (host, port)
+MAX_IDLE = 4
+
+
+def is_query(command: str) -> bool:
+    """Does the device respond to this command?"""
+    return command.split(" ")[0].endswith("?")
+
+
+def _text(response: Union[bytes, framing.Block], command: str) -> str:
+    """Return a text response, decoded."""
+    if isinstance(response, framing.Block):
+        raise ValueError(f"'{command}' returned a binary block, use query_block()")
+    return response.decode("utf-8")
+
+
+def _block(response: Union[bytes, framing.Block], command: str) -> framing.Block:
+    """Return a binary block response."""
+    if not isinstance(response, framing.Block):
+        raise ValueError(f"'{command}' did not return a binary block")
+    return response
+
+
+class Client:
+    """A connection to one device."""
+
+    host: str
+    port: int
+    sock: socket.socket
+    framer: framing.LineFramer
+    # Responses received but not yet returned
+    responses: Deque[Union[bytes, framing.Block]]
+
+    def __init__(self, host: str, port: int, timeout: float = TIMEOUT) -> None:
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        # Commands are small, send each one right away
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.framer = framing.LineFramer()
+        self.responses = collections.deque()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.sock.close()
+
+    def write(self, command: str) -> None:
+        """Send a command that has no response."""
+        self.sock.sendall(str.encode(command + "\n"))
+
+    def query(self, command: str) -> str:
+        """Send a command and return its response, without the line ending."""
+        self.write(command)
+        return _text(self.receive(), command)
+
+    def query_block(self, command: str) -> framing.Block:
+        """Send a command and return the binary block it responds with."""
+        self.write(command)
+        return _block(self.receive(), command)
+
+    def query_many(
+        self, commands: Sequence[str], depth: int = PIPELINE_DEPTH
+    ) -> List[str]:
+        """Send queries, depth at a time, and return their responses in order."""
+        responses: List[str] = []
+        for start in range(0, len(commands), depth):
+            batch = commands[start : start + depth]
+            self.sock.sendall(b"".join(str.encode(cmd + "\n") for cmd in batch))
+            responses += [_text(self.receive(), cmd) for cmd in batch]
+        return responses
+
+    def receive(self) -> Union[bytes, framing.Block]:
+        """Wait for the next response."""
+        while not self.responses:
+            if self.framer.recv_from(self.sock) == 0:
+                raise ConnectionError(f"{self.host}:{self.port} closed the connection")
+            self.responses.extend(self.framer.lines())
+        return self.responses.popleft()
+
+
+class _ClientProtocol(asyncio.BufferedProtocol):
+    """Hand the responses read by the event loop to the queries awaiting them."""
+
+    framer: framing.LineFramer
+    # One future per query sent, in the order they were sent
+    waiters: Deque["asyncio.Future[Union[bytes, framing.Block]]"]
+    transport: asyncio.Transport
+
+    def __init__(self) -> None:
+        self.framer = framing.LineFramer()
+        self.waiters = collections.deque()
+        self.closed: Optional[Exception] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Keep the transport to write to."""
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        """Return the buffer the next read should land in."""
+        return self.framer.buffer()
+
+    def buffer_updated(self, nbytes: int) -> None:
+        """Resolve the oldest waiting queries with the responses received."""
+        self.framer.received(nbytes)
+        for response in self.framer.lines():
+            while self.waiters and self.waiters[0].done():
+                # Its query timed out or was cancelled
+                self.waiters.popleft()
+            if not self.waiters:
+                errlog.error("Dropping unexpected response %r", response)
+                continue
+            self.waiters.popleft().set_result(response)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """Fail every waiting query."""
+        self.closed = ConnectionError("The device closed the connection")
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(self.closed)
+
+
+class AsyncClient:
+    """A connection to one device, for use on an asyncio event loop.
 
+    Create it with 'await AsyncClient.connect(host, port)'. Queries may be
+    awaited from several tasks at once, they are answered in the order sent.
+    """
 
-def connect(ip_addr: str, port: int) -> socket.socket:
+    host: str
+    port: int
+    timeout: float
+
+    def __init__(
+        self, host: str, port: int, timeout: float, protocol: _ClientProtocol
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.protocol = protocol
+
+    @classmethod
+    async def connect(
+        cls, host: str, port: int, timeout: float = TIMEOUT
+    ) -> "AsyncClient":
+        """Open a connection to a device."""
+        loop = asyncio.get_running_loop()
+        transport, protocol = await asyncio.wait_for(
+            loop.create_connection(_ClientProtocol, host, port), timeout
+        )
+        transport.get_extra_info("socket").setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        return cls(host, port, timeout, protocol)
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the connection."""
+        self.protocol.transport.close()
+
+    async def write(self, command: str) -> None:
+        """Send a command that has no response."""
+        self.protocol.transport.write(str.encode(command + "\n"))
+
+    async def query(self, command: str) -> str:
+        """Send a command and return its response, without the line ending."""
+        return _text(await self.send([command])[0], command)
+
+    async def query_block(self, command: str) -> framing.Block:
+        """Send a command and return the binary block it responds with."""
+        return _block(await self.send([command])[0], command)
+
+    async def query_many(
+        self, commands: Sequence[str], depth: int = PIPELINE_DEPTH
+    ) -> List[str]:
+        """Send queries, depth at a time, and return their responses in order."""
+        responses: List[str] = []
+        for start in range(0, len(commands), depth):
+            batch = commands[start : start + depth]
+            received = await asyncio.gather(*self.send(batch))
+            responses += [_text(r, cmd) for r, cmd in zip(received, batch)]
+        return responses
+
+    def send(
+        self, commands: Sequence[str]
+    ) -> List["asyncio.Future[Union[bytes, framing.Block]]"]:
+        """Send queries in one write. Return the future responses, in order."""
+        protocol = self.protocol
+        if protocol.closed is not None:
+            raise protocol.closed
+        loop = asyncio.get_running_loop()
+        waiters = [loop.create_future() for _ in commands]
+        protocol.waiters.extend(waiters)
+        protocol.transport.write(b"".join(str.encode(cmd + "\n") for cmd in commands))
+        return [
+            asyncio.ensure_future(asyncio.wait_for(waiter, self.timeout))
+            for waiter in waiters
+        ]
+
+
+class ConnectionPool:
+    """Keep connections open for reuse, keyed by (host, port).
+
+    A connection is used by one caller at a time. Connections that raised
+    while in use are closed rather than reused, as their responses may be
+    out of step.
+    """
+
+    timeout: float
+    max_idle: int
+    idle: Dict[Tuple[str, int], List[Client]]
+
+    def __init__(self, timeout: float = TIMEOUT, max_idle: int = MAX_IDLE) -> None:
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self, host: str, port: int) -> Iterator[Client]:
+        """Lend a connection to the device, opening one if none is idle."""
+        key = (host, port)
+        with self.lock:
+            idle = self.idle.get(key)
+            client = idle.pop() if idle else None
+        if client is None:
+            client = Client(host, port, timeout=self.timeout)
+        try:
+            yield client
+        except BaseException:
+            client.close()
+            raise
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(client)
+                return
+        client.close()
+
+    def query(self, host: str, port: int, command: str) -> str:
+        """Send a query on a pooled connection and return its response."""
+        with self.connection(host, port) as client:
+            return client.query(command)
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        with self.lock:
+            clients = [client for idle in self.idle.values() for client in idle]
+            self.idle.clear()
+        for client in clients:
+            client.close()
+
+
+class Batch:  # pylint: disable=too-many-instance-attributes
+    """Send a script of commands down one connection, pipelined.
+
+    Commands go out in batches, without waiting for responses, until depth
+    queries are in flight. Each query and its response are written out as
+    the response arrives, in the order the queries were sent.
+    """
+
+    device: Client
+    out: TextIO
+    depth: int
+    # Commands sent, and the latency of each query
+    commands: int
+    latency: metrics.Histogram
+    # Seconds spent running scripts
+    wall: float
+
+    def __init__(self, device: Client, out: TextIO, depth: int = PIPELINE_DEPTH):
+        self.device = device
+        self.out = out
+        self.depth = depth
+        self.commands = 0
+        self.latency = metrics.Histogram()
+        self.wall = 0.0
+        # Commands not sent yet, and the queries among them
+        self.batch: List[bytes] = []
+        self.unsent: List[str] = []
+        # Query and send time of each query in flight
+        self.pending: Deque[Tuple[str, float]] = collections.deque()
+
+    def run(self, script: Iterable[str]) -> None:
+        """Send every command in the script. Blank lines and # comments are skipped."""
+        began = time.perf_counter()
+        for line in script:
+            command = line.strip()
+            if command == "" or command.startswith("#"):
+                continue
+            if is_query(command):
+                if len(self.pending) + len(self.unsent) >= self.depth:
+                    self.send()
+                    self.receive()
+                self.unsent.append(command)
+            elif len(self.batch) >= self.depth:
+                self.send()
+            self.batch.append(str.encode(command + "\n"))
+            self.commands += 1
+        self.send()
+        while self.pending:
+            self.receive()
+        self.out.flush()
+        self.wall += time.perf_counter() - began
+
+    def send(self) -> None:
+        """Send the batched commands, the queries among them are then in flight."""
+        if self.batch:
+            self.device.sock.sendall(b"".join(self.batch))
+        sent = time.perf_counter()
+        self.pending.extend((query, sent) for query in self.unsent)
+        self.batch.clear()
+        self.unsent.clear()
+
+    def receive(self) -> None:
+        """Wait for the response to the oldest query in flight and write it out."""
+        if not self.device.responses:
+            # Let whoever reads the output see what has arrived so far
+            self.out.flush()
+        response = self.device.receive()
+        query, sent = self.pending.popleft()
+        self.latency.observe(time.perf_counter() - sent)
+        if isinstance(response, framing.Block):
+            text = f"{response.text.decode('utf-8')}<{len(response.data)} bytes>"
+        else:
+            text = response.decode("utf-8")
+        self.out.write(f"{query}\t{text}\n")
+
+    def summary(self) -> str:
+        """Return the throughput and query latency so far."""
+        summary = self.latency.summary()
+        rate = self.commands / self.wall if self.wall else 0.0
+        return (
+            f"{self.commands} commands ({summary['count']:.0f} queries) in "
+            f"{self.wall:.2f}s, {rate:.0f} commands/s, latency mean "
+            f"{summary['mean'] * 1e3:.2f}ms p50 <{summary['p50'] * 1e3:.2f}ms "
+            f"p99 <{summary['p99'] * 1e3:.2f}ms"
+        )
+
+
+def connect(ip_addr: str, port: int) -> Client:
     """Connect to the emulator."""
     print("Waiting for connection")
 
-    connected = False
-    while not connected:
+    while True:
         try:
-            connection = socket.create_connection((ip_addr, port))
-            connected = True
+            return Client(ip_addr, port)
         except socket.error as err:
             print(str(err))
             time.sleep(1)
 
-    return connection
 
-
-def interactive(emulator: socket.socket) -> None:
+def interactive(emulator: Client) -> None:
     """Interactive session with the emulator."""
     while True:
         try:
@@ -39,16 +427,11 @@ def interactive(emulator: socket.socket) -> None:
             continue
 
         try:
-            tokens = command.split(" ")
-            query = tokens[0].endswith("?")
-            command += "\n"
-            emulator.send(str.encode(command))
-            # If this is a query wait for a response
-            if query:
-                response = ""
-                while not response.endswith("\n"):
-                    response += emulator.recv(2048).decode("utf-8")
-                print(response)
+            # Only queries have a response to wait for
+            if is_query(command):
+                print(emulator.query(command))
+            else:
+                emulator.write(command)
         except Exception as err:
             errlog.exception(err)
             break
@@ -63,15 +446,32 @@ def main() -> None:
         level=logging.INFO,
     )
 
-    try:
-        ip_addr = sys.argv[1]
-        port = int(sys.argv[2])
-    except Exception as err:
-        errlog.exception(err)
-        errlog.error("Usage: client ip_addr port")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(prog="client")
+    parser.add_argument("ip_addr")
+    parser.add_argument("port", type=int)
+    parser.add_argument(
+        "--script",
+        metavar="FILE",
+        type=argparse.FileType("r"),
+        help="send the commands in FILE ('-' for stdin) instead of prompting",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=PIPELINE_DEPTH,
+        help="queries in flight at once (1 waits for every response)",
+    )
+    args = parser.parse_args()
+
+    if args.script is not None:
+        with args.script:
+            with Client(args.ip_addr, args.port) as device:
+                batch = Batch(device, out=sys.stdout, depth=args.depth)
+                batch.run(args.script)
+        errlog.info(batch.summary())
+        return
 
-    emulator = connect(ip_addr=ip_addr, port=port)
+    emulator = connect(ip_addr=args.ip_addr, port=args.port)
 
     print("Connected! For help, type: 'help?' or '?'. To exit, type 'exit'")
 
@@ -3,76 +3,229 @@
 # pylint: disable=broad-except
 
 
+import argparse
+import asyncio
+import collections
 import logging
 import socket
-import sys
 from _thread import start_new_thread
 import threading
-from typing import Any
+import time
+from typing import Any, Deque, List, Optional, Set, Tuple, Union
 
+from siglent_emulator import framing
+from siglent_emulator import journal
+from siglent_emulator import metrics
+from siglent_emulator import timing
+from siglent_emulator.function_generator import util
 from siglent_emulator.function_generator import sdg1032x
 from siglent_emulator.function_generator import sdg1062x
+from siglent_emulator.oscilloscope import sds1104xe
+from siglent_emulator.oscilloscope import sds1202xe
 
 EMULATORS = {
     "sdg1032x": sdg1032x,
     "sdg1062x": sdg1062x,
+    "sds1104xe": sds1104xe,
+    "sds1202xe": sds1202xe,
 }
 
+# Serving engines: one OS thread per client connection, or all connections
+# multiplexed on a single asyncio event loop.
+ENGINES = ["thread", "asyncio"]
+
+# Seconds between attempts to bind to a port that is in use
+BIND_RETRY_INTERVAL = 1.0
+
+# Largest piece of a response the asyncio engine hands the transport at once
+WRITE_CHUNK_SIZE = 256 * 1024
+
 
 class Emulator:
     """Emulate a Siglent test and measurement device over a socket."""
 
     device: Any
+    # Client connections currently open on the asyncio engine
+    transports: Set[asyncio.Transport]
+    metrics: metrics.Metrics
+    # Where the commands that change the device's state are logged, if anywhere
+    journal: Optional[journal.Journal]
+    # How long the instrument takes over commands, None to answer at once
+    timing: Optional[timing.Profile]
 
     def __init__(self, device: str) -> None:
         """Load the emulation code for this device."""
         self.device = EMULATORS[device.lower()].new()
+        self.transports = set()
+        self.metrics = metrics.Metrics()
+        self.journal = None
+        self.timing = None
+        # When the instrument is done with each command, see _timeline()
+        self.timeline: Optional[timing.Timeline] = None
+        self.timeline_lock = threading.Lock()
+
+    def respond(
+        self, line: Union[bytes, framing.Block], peer: str = ""
+    ) -> Union[bytes, framing.Block]:
+        """Process one command line from the client, return the response."""
+        # Only the text is decoded, binary block data is passed through as is
+        data: Optional[memoryview] = None
+        if isinstance(line, framing.Block):
+            text, data = line.text, line.data
+        else:
+            text = line
+        message = text.decode("utf-8").strip().upper()
+        if message == "":
+            return b""
+        error = False
+        parsed = util.parse_command(message)
+        log = self.journal
+        if parsed.header.endswith("?"):
+            log = None
+        compact = False
+        began = time.perf_counter()
+        try:
+            if log is not None:
+                # Logged under the command's locks, in the order it was applied
+                with self.device.lock_for(parsed):
+                    result = self.device.process(command=message, data=data)
+                    compact = log.record(message, data)
+            elif data is None:
+                result = self.device.process(command=message)
+            else:
+                result = self.device.process(command=message, data=data)
+        except Exception as err:
+            errlog.error("Failed to process '%s'", message)
+            errlog.exception(err)
+            error = True
+            result = ""
+        self.metrics.record(
+            header=parsed.header,
+            peer=peer,
+            seconds=time.perf_counter() - began,
+            error=error,
+        )
+        if compact:
+            assert log is not None
+            log.compact(self.device)
+        if isinstance(result, framing.Block):
+            return result
+        if result == "":
+            return b""
+        if not result.endswith("\n"):
+            result += "\n"
+        return str.encode(result)
+
+    def respond_all(
+        self, framer: framing.LineFramer, peer: str = ""
+    ) -> List[Union[bytes, memoryview]]:
+        """Process every complete command line buffered so far.
+
+        Return the buffers to send, in order.
+        """
+        return self.respond_lines(framer.lines(), peer)
+
+    def respond_lines(
+        self, lines: List[Union[bytes, framing.Block]], peer: str = ""
+    ) -> List[Union[bytes, memoryview]]:
+        """Process command lines. Return the buffers to send, in order."""
+        # Pipelined clients send many commands per read, answer them in one
+        # write. Block data is sent from where it is stored rather than copied
+        # into that write.
+        buffers: List[Union[bytes, memoryview]] = []
+        text: List[bytes] = []
+        for line in lines:
+            response = self.respond(line, peer)
+            if isinstance(response, framing.Block):
+                text += [response.text, framing.block_header(len(response.data))]
+                buffers += [b"".join(text), response.data]
+                text = [b"\n"]
+            elif response != b"":
+                text.append(response)
+        if text:
+            buffers.append(b"".join(text))
+        return buffers
 
     def client_handler(self, connection: socket.socket) -> None:
         """Receive a command from the client, process, and respond."""
+        framer = framing.LineFramer()
+        address = connection.getpeername()
+        peer = f"{address[0]}:{address[1]}"
+        self.metrics.connection_opened(peer)
+        timeline = _timeline(self)
+        limit = 0
+        if timeline is not None:
+            limit = timeline.profile.input_buffer
+            if limit:
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, limit)
         while True:
             try:
-                data = connection.recv(2048)
-                message = data.decode("utf-8").strip().upper()
-                if message == "":
+                if framer.recv_from(connection, limit) == 0:
+                    errlog.info("Client closed connection")
+                    break
+                if timeline is None:
+                    for response in self.respond_all(framer, peer):
+                        connection.sendall(response)
                     continue
-                # Sometimes messages come in so quickly they stack up
-                # before we can get back around to read them.
-                for msg in message.split("\n"):
-                    result = self.device.process(command=msg)
-                    if result != "":
-                        if not result.endswith("\n"):
-                            result += "\n"
-                        connection.sendall(str.encode(result))
+                # Nothing more is read until these are done
+                for line in framer.lines():
+                    done = timeline.schedule(line, time.monotonic())
+                    time.sleep(max(0.0, done - time.monotonic()))
+                    for response in self.respond_lines([line], peer):
+                        connection.sendall(response)
             except (ConnectionResetError, BrokenPipeError):
                 errlog.info("Client closed connection")
                 break
+        self.metrics.connection_closed(peer)
         connection.close()
 
+    def protocol(self) -> asyncio.BufferedProtocol:
+        """Return a protocol instance serving one client on the asyncio engine."""
+        return _EmulatorProtocol(emulator=self)
+
     def accept_connections(self, connection: socket.socket) -> None:
         """Accept a new connection from a client."""
         client, address = connection.accept()
         errlog.info("New connection from: %s:%s", address[0], address[1])
         start_new_thread(self.client_handler, (client,))
 
-    def bind(self, ip_addr: str = "127.0.0.1", port: int = 21111) -> socket.socket:
-        """Bind to a socket (retrying on failure). Return that socket."""
+    def bind(
+        self, ip_addr: str = "127.0.0.1", port: int = 21111, retry: bool = True
+    ) -> socket.socket:
+        """Bind to a socket (optionally retrying on failure). Return that socket.
+
+        Port 0 binds to any free port, see getsockname() for which.
+        """
         while True:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                # Allow a restarted server to reclaim its port right away
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 sock.bind((ip_addr, port))
-                break
-            except Exception as err:
-                if sock is not None:
-                    sock.close()
-                errlog.error("Failed to bind to %s:%s. Retrying...", ip_addr, port)
-                errlog.exception(err)
-        return sock
+                return sock
+            except OSError as err:
+                sock.close()
+                if not retry:
+                    raise
+                errlog.error(
+                    "Failed to bind to %s:%s (%s). Retrying in %.0fs...",
+                    ip_addr,
+                    port,
+                    err,
+                    BIND_RETRY_INTERVAL,
+                )
+                time.sleep(BIND_RETRY_INTERVAL)
 
-    def run(self, port: int) -> None:
-        """Listen for incoming connections."""
-        server_socket = self.bind(port=port)
-        errlog.info("Server is listing on port %d...", port)
+    def run(
+        self, port: int = 21111, server_socket: Optional[socket.socket] = None
+    ) -> None:
+        """Listen for incoming connections, one thread per client.
+
+        Listens on server_socket, if given, rather than binding to the port.
+        """
+        if server_socket is None:
+            server_socket = self.bind(port=port)
+        errlog.info("Server is listing on port %d...", server_socket.getsockname()[1])
         server_socket.listen()
 
         while True:
@@ -83,21 +236,246 @@ class Emulator:
                 break
         server_socket.close()
 
+    async def start_server(self, server_socket: socket.socket) -> asyncio.Server:
+        """Start serving clients of the bound socket on the running event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.create_server(
+            self.protocol, sock=server_socket, backlog=socket.SOMAXCONN
+        )
+
+    async def serve(
+        self, port: int = 21111, server_socket: Optional[socket.socket] = None
+    ) -> None:
+        """Listen for incoming connections, all clients on this event loop.
+
+        Listens on server_socket, if given, rather than binding to the port.
+        """
+        if server_socket is None:
+            server_socket = self.bind(port=port)
+        server = await self.start_server(server_socket)
+        errlog.info("Server is listing on port %d...", server_socket.getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    def run_asyncio(
+        self, port: int = 21111, server_socket: Optional[socket.socket] = None
+    ) -> None:
+        """Listen for incoming connections on a new asyncio event loop."""
+        asyncio.run(self.serve(port=port, server_socket=server_socket))
+
+
+class _EmulatorProtocol(  # pylint: disable=too-many-instance-attributes
+    asyncio.BufferedProtocol
+):
+    """Serve one client connection on the asyncio engine.
 
-def _run(device: str, port: int) -> None:
-    """Run the emulator."""
-    emulator = Emulator(device=device)
-    emulator.run(port=port)
+    The event loop reads straight into the framer's buffers. Responses are
+    handed to the transport WRITE_CHUNK_SIZE bytes at a time, and only while
+    it is not paused, so a large block is sent from where it is stored rather
+    than copied into the transport's buffer. The client is not read from
+    while responses are waiting to be sent.
 
+    With a timing profile, commands wait in their own queue until the
+    instrument would be done with them, with a timer set for the first. The
+    instrument's timeline is the emulator's, so commands from other
+    connections delay these. The client is not read from while the commands
+    waiting fill the instrument's input buffer.
+    """
+
+    emulator: Emulator
+    framer: framing.LineFramer
+    transport: asyncio.Transport
+    peer: str
+    # Response chunks not yet handed to the transport
+    outgoing: Deque[Union[bytes, memoryview]]
+    paused: bool
+    timeline: Optional[timing.Timeline]
+    # Commands not yet processed, with when they are done, and their bytes
+    waiting: Deque[Tuple[float, Union[bytes, framing.Block]]]
+    backlog: int
+    timer: Optional[asyncio.TimerHandle]
+    # The client has sent all it will, close once the commands waiting are done
+    # and their responses sent
+    ended: bool
+
+    def __init__(self, emulator: Emulator) -> None:
+        self.emulator = emulator
+        self.framer = framing.LineFramer()
+        self.outgoing = collections.deque()
+        self.paused = False
+        self.timeline = _timeline(emulator)
+        self.waiting = collections.deque()
+        self.backlog = 0
+        self.timer = None
+        self.ended = False
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Accept a new connection from a client."""
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+        self.emulator.transports.add(transport)
+        address = transport.get_extra_info("peername")
+        self.peer = f"{address[0]}:{address[1]}"
+        self.emulator.metrics.connection_opened(self.peer)
+        errlog.info("New connection from: %s:%s", address[0], address[1])
+        if self.timeline is not None and self.timeline.profile.input_buffer:
+            transport.get_extra_info("socket").setsockopt(
+                socket.SOL_SOCKET,
+                socket.SO_RCVBUF,
+                self.timeline.profile.input_buffer,
+            )
 
-def start(device: str, port: int = 21111, daemon: bool = False) -> None:
-    """Start the emulator inline or on a separate thread."""
+    def get_buffer(self, sizehint: int) -> memoryview:
+        """Return the buffer the next read should land in."""
+        return self.framer.buffer()
+
+    def buffer_updated(self, nbytes: int) -> None:
+        """Process the commands received from the client and respond."""
+        self.framer.received(nbytes)
+        if self.timeline is None:
+            self.send(self.emulator.respond_all(self.framer, self.peer))
+            return
+        now = asyncio.get_running_loop().time()
+        for line in self.framer.lines():
+            self.waiting.append((self.timeline.schedule(line, now), line))
+            self.backlog += timing.size(line)
+        if self.timer is None:
+            self.process_due()
+        else:
+            # These are done after the command the timer is set for, but may
+            # fill the input buffer
+            self.flush()
+
+    def process_due(self) -> None:
+        """Process the waiting commands that are done, set a timer for the next."""
+        self.timer = None
+        loop = asyncio.get_running_loop()
+        lines = []
+        while self.waiting and self.waiting[0][0] <= loop.time():
+            line = self.waiting.popleft()[1]
+            self.backlog -= timing.size(line)
+            lines.append(line)
+        if self.waiting:
+            self.timer = loop.call_at(self.waiting[0][0], self.process_due)
+        self.send(self.emulator.respond_lines(lines, self.peer))
+
+    def send(self, responses: List[Union[bytes, memoryview]]) -> None:
+        """Queue responses, in chunks, and flush them."""
+        for response in responses:
+            if len(response) <= WRITE_CHUNK_SIZE:
+                self.outgoing.append(response)
+                continue
+            view = memoryview(response)
+            for offset in range(0, len(view), WRITE_CHUNK_SIZE):
+                self.outgoing.append(view[offset : offset + WRITE_CHUNK_SIZE])
+        self.flush()
+
+    def backlogged(self) -> bool:
+        """Do the commands waiting fill the instrument's input buffer?"""
+        if self.timeline is None or not self.timeline.profile.input_buffer:
+            return False
+        return self.backlog >= self.timeline.profile.input_buffer
+
+    def flush(self) -> None:
+        """Hand queued chunks to the transport until it asks us to pause."""
+        while self.outgoing and not self.paused:
+            self.transport.write(self.outgoing.popleft())
+        if self.ended and not self.waiting and not self.outgoing:
+            self.transport.close()
+        elif self.outgoing or self.backlogged():
+            self.transport.pause_reading()
+        elif not self.transport.is_reading():
+            self.transport.resume_reading()
+
+    def eof_received(self) -> bool:
+        """The client has sent all it will, answer the commands waiting first.
+
+        The connection stays open until every response has been handed to the
+        transport, flush() then closes it.
+        """
+        self.ended = True
+        return bool(self.waiting or self.outgoing)
+
+    def pause_writing(self) -> None:
+        """The transport's buffer is full."""
+        self.paused = True
+
+    def resume_writing(self) -> None:
+        """The transport's buffer has drained."""
+        self.paused = False
+        self.flush()
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """Clean up after the client closed the connection."""
+        self.outgoing.clear()
+        if self.timer is not None:
+            self.timer.cancel()
+        self.waiting.clear()
+        self.emulator.transports.discard(self.transport)
+        self.emulator.metrics.connection_closed(self.peer)
+        errlog.info("Client closed connection")
+
+
+def _timeline(instance: Emulator) -> Optional[timing.Timeline]:
+    """Return the instrument's timeline, shared by all its connections.
+
+    None when the emulator has no timing profile. A new profile starts a new
+    timeline.
+    """
+    with instance.timeline_lock:
+        if instance.timing is None:
+            instance.timeline = None
+        elif (
+            instance.timeline is None
+            or instance.timeline.profile is not instance.timing
+        ):
+            instance.timeline = timing.Timeline(instance.timing)
+        return instance.timeline
+
+
+def _serve(instance: Emulator, server_socket: socket.socket, engine: str) -> None:
+    """Serve the clients of the bound socket on the engine."""
+    if engine == "asyncio":
+        instance.run_asyncio(server_socket=server_socket)
+    else:
+        instance.run(server_socket=server_socket)
+
+
+def start(  # pylint: disable=too-many-arguments
+    device: str,
+    port: int = 21111,
+    daemon: bool = False,
+    engine: str = "thread",
+    metrics_port: Optional[int] = None,
+    timed: bool = False,
+) -> Tuple[str, int]:
+    """Start the emulator inline or on a separate thread.
+
+    On a separate thread, return the address the emulator listens on once it
+    is listening, clients may connect right away. Port 0 listens on any free
+    port, a port that is taken raises OSError. Inline, binding retries until
+    the port is free, and the emulator serves until it is stopped.
+
+    If metrics_port is given, command metrics are served there for Prometheus.
+    If timed, commands take as long as on the instrument (see timing.py).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    instance = Emulator(device=device)
+    if timed:
+        instance.timing = timing.PROFILES[device.lower()]
+    server_socket = instance.bind(port=port, retry=not daemon)
+    server_socket.listen()
+    host, port = server_socket.getsockname()[:2]
+    if metrics_port is not None:
+        metrics.serve(port=metrics_port, render=instance.metrics.render)
     if daemon:
-        thread = threading.Thread(target=_run, args=(device, port))
+        thread = threading.Thread(target=_serve, args=(instance, server_socket, engine))
         thread.daemon = True
         thread.start()
     else:
-        _run(device=device, port=port)
+        _serve(instance=instance, server_socket=server_socket, engine=engine)
+    return host, port
 
 
 def main() -> None:
@@ -109,11 +487,25 @@ def main() -> None:
         level=logging.INFO,
     )
 
-    if len(sys.argv) != 2:
-        errlog.error("Usage: emulator device")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(prog="emulator")
+    parser.add_argument("device", choices=sorted(EMULATORS), type=str.lower)
+    parser.add_argument("--port", type=int, default=21111)
+    parser.add_argument("--engine", choices=ENGINES, default="thread")
+    parser.add_argument("--metrics-port", type=int)
+    parser.add_argument(
+        "--timed",
+        action="store_true",
+        help="take as long over commands as the instrument",
+    )
+    args = parser.parse_args()
 
-    start(port=21111, device=sys.argv[1])
+    start(
+        port=args.port,
+        device=args.device,
+        engine=args.engine,
+        metrics_port=args.metrics_port,
+        timed=args.timed,
+    )
 
 
 errlog = logging.getLogger(__name__)
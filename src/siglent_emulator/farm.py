@@ -0,0 +1,411 @@
+"""Host many independent emulated devices in one process, or in several.
+
+Every device gets its own listening port. All clients of all devices in a Farm
+are served by one asyncio event loop running on a background thread, so a
+farm of hundreds of devices costs one thread rather than one per connection.
+
+A single process only ever uses one core, though. ShardedFarm spreads the
+devices over a pool of worker processes, each running its own Farm, and
+supervises them.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.process
+import os
+import queue
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from siglent_emulator import emulator
+from siglent_emulator import journal
+from siglent_emulator import metrics
+from siglent_emulator import timing
+
+if TYPE_CHECKING:
+    from siglent_emulator import wiring
+
+
+class Farm:  # pylint: disable=too-many-instance-attributes
+    """A registry of emulated devices, each listening on its own port."""
+
+    ip_addr: str
+    instances: Dict[int, emulator.Emulator]
+    servers: Dict[int, asyncio.Server]
+    # Where device state is journaled, by port, if anywhere (see journal.py)
+    journal_dir: Optional[str]
+    # Do devices take as long over commands as the instruments (see timing.py)?
+    timed: bool
+
+    def __init__(
+        self,
+        ip_addr: str = "127.0.0.1",
+        journal_dir: Optional[str] = None,
+        timed: bool = False,
+    ) -> None:
+        self.ip_addr = ip_addr
+        self.journal_dir = journal_dir
+        self.timed = timed
+        self.instances = {}
+        self.servers = {}
+        self.lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def add(
+        self,
+        device: str,
+        port: int = 0,
+        server_socket: Optional[socket.socket] = None,
+    ) -> int:
+        """Start emulating a device on the port (0 for any). Return the port.
+
+        The device listens on server_socket, if given, already bound, rather
+        than on the port. With a journal_dir, the device starts in the state
+        it was journaled in on this port.
+        """
+        instance = emulator.Emulator(device=device)
+        if server_socket is None:
+            server_socket = instance.bind(ip_addr=self.ip_addr, port=port, retry=False)
+        port = server_socket.getsockname()[1]
+        if self.timed:
+            instance.timing = timing.PROFILES[device.lower()]
+        if self.journal_dir is not None and journal.supported(instance.device):
+            instance.journal = journal.Journal(self.journal_dir, key=str(port))
+            replayed = instance.journal.load(instance.device)
+            errlog.info("Restored port %d, replayed %d commands", port, replayed)
+        server = asyncio.run_coroutine_threadsafe(
+            instance.start_server(server_socket), self.loop
+        ).result()
+        with self.lock:
+            self.instances[port] = instance
+            self.servers[port] = server
+        errlog.info("Emulating %s on port %d", device, port)
+        return port
+
+    def add_range(self, devices: List[str], first_port: int) -> List[int]:
+        """Emulate each device on consecutive ports. Return the ports."""
+        return [self.add(device, first_port + i) for i, device in enumerate(devices)]
+
+    def remove(self, port: int) -> None:
+        """Stop emulating the device on the port and drop its clients."""
+        with self.lock:
+            instance = self.instances.pop(port)
+            server = self.servers.pop(port)
+        asyncio.run_coroutine_threadsafe(
+            _shutdown(instance, server), self.loop
+        ).result()
+        if instance.journal is not None:
+            instance.journal.close(instance.device)
+        errlog.info("Stopped emulating on port %d", port)
+
+    def ports(self) -> List[int]:
+        """Return the ports of all emulated devices."""
+        with self.lock:
+            return sorted(self.instances)
+
+    def __getitem__(self, port: int) -> emulator.Emulator:
+        """Return the emulator listening on the port."""
+        with self.lock:
+            return self.instances[port]
+
+    def connect(
+        self, generator: Tuple[int, int], scope: Tuple[int, int]
+    ) -> "wiring.Cable":
+        """Cable a generator output to a scope input, each given as (port, channel).
+
+        Return the cable, see wiring.py.
+        """
+        # Wiring renders signals with NumPy, only import it when it is used
+        from siglent_emulator import (  # pylint: disable=import-outside-toplevel
+            wiring,
+        )
+
+        source = self[generator[0]].device.channels[generator[1] - 1]
+        sink = self[scope[0]].device.channels[scope[1] - 1]
+        cable = wiring.Cable(generator=source, scope=sink)
+        errlog.info("Cabled %d:C%d to %d:C%d", *generator, *scope)
+        return cable
+
+    def render_metrics(self) -> str:
+        """Return the metrics of every device, labelled by port."""
+        with self.lock:
+            instances = list(self.instances.items())
+        return "".join(
+            instance.metrics.render(labels=f'port="{port}"')
+            for port, instance in instances
+        )
+
+    def close(self) -> None:
+        """Stop emulating all devices and stop the event loop."""
+        for port in self.ports():
+            self.remove(port)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+async def _shutdown(instance: emulator.Emulator, server: asyncio.Server) -> None:
+    """Stop listening and close all client connections."""
+    server.close()
+    for transport in list(instance.transports):
+        transport.close()
+    await server.wait_closed()
+
+
+class ShardedFarm:  # pylint: disable=too-many-instance-attributes
+    """Spread emulated devices over worker processes, sharded by port.
+
+    Device i listens on first_port + i, or on any free port if first_port is 0,
+    and is hosted by worker i % workers. The farm binds every port before the
+    workers start and keeps them through worker restarts, so clients may
+    connect at once and wait to be served.
+
+    A supervisor thread restarts workers that die and collects the stats each
+    worker reports every interval seconds. A worker that dies again before it
+    reports is restarted after twice as long each time, up to max_backoff
+    seconds, and only its first failure is logged.
+    """
+
+    ip_addr: str
+    journal_dir: Optional[str]
+    timed: bool
+    # Seconds between supervisor checks and between worker stats reports
+    interval: float = 1.0
+    # Longest wait before restarting a worker that keeps dying
+    max_backoff: float = 60.0
+    # The port of each device, in the order given
+    ports: List[int]
+    # The devices of each worker, with the sockets they listen on
+    shards: List[List[Tuple[str, socket.socket]]]
+    processes: List[multiprocessing.process.BaseProcess]
+    restarts: List[int]
+    # Deaths of each worker since it last reported, and when it may restart
+    failures: List[int]
+    restart_at: List[float]
+    worker_stats: Dict[int, Dict[str, int]]
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        devices: List[str],
+        first_port: int,
+        workers: int = 0,
+        ip_addr: str = "127.0.0.1",
+        journal_dir: Optional[str] = None,
+        timed: bool = False,
+    ) -> None:
+        workers = workers or os.cpu_count() or 1
+        self.ip_addr = ip_addr
+        self.journal_dir = journal_dir
+        self.timed = timed
+        self.shards = [[] for _ in range(min(workers, len(devices)))]
+        self.ports = []
+        for i, device in enumerate(devices):
+            port = first_port + i if first_port else 0
+            server_socket = socket.create_server(
+                (ip_addr, port), backlog=socket.SOMAXCONN
+            )
+            self.ports.append(server_socket.getsockname()[1])
+            self.shards[i % len(self.shards)].append((device, server_socket))
+        # Workers are spawned, forking a process that has threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.stats_queue: Any = self.context.Queue()
+        self.failures = [0] * len(self.shards)
+        self.restart_at = [0.0] * len(self.shards)
+        self.processes = [self.spawn(worker) for worker in range(len(self.shards))]
+        self.restarts = [0] * len(self.shards)
+        self.worker_stats = {}
+        self.stopping = threading.Event()
+        self.supervisor = threading.Thread(target=self.supervise, daemon=True)
+        self.supervisor.start()
+
+    def spawn(self, worker: int) -> multiprocessing.process.BaseProcess:
+        """Start the worker process hosting one shard."""
+        process = self.context.Process(
+            target=_worker,
+            args=(
+                worker,
+                self.shards[worker],
+                self.ip_addr,
+                self.stats_queue,
+                self.interval,
+                self.journal_dir,
+                self.timed,
+            ),
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def supervise(self) -> None:
+        """Restart dead workers and collect worker stats until stopped."""
+        while not self.stopping.is_set():
+            for worker, process in enumerate(self.processes):
+                if process.is_alive() or self.stopping.is_set():
+                    continue
+                if time.monotonic() < self.restart_at[worker]:
+                    continue
+                failures = self.failures[worker]
+                if failures == 0:
+                    errlog.error(
+                        "Worker %d exited with %s, restarting", worker, process.exitcode
+                    )
+                backoff = min(self.interval * 2**failures, self.max_backoff)
+                self.failures[worker] += 1
+                self.restart_at[worker] = time.monotonic() + backoff
+                self.restarts[worker] += 1
+                self.processes[worker] = self.spawn(worker)
+            deadline = time.monotonic() + self.interval
+            while time.monotonic() < deadline:
+                try:
+                    worker, stats = self.stats_queue.get(timeout=self.interval / 4)
+                except queue.Empty:
+                    continue
+                self.worker_stats[worker] = stats
+                # The running worker, not one that died since, is up
+                if stats["pid"] == self.processes[worker].pid:
+                    self.failures[worker] = 0
+                    self.restart_at[worker] = 0.0
+
+    def stats(self) -> Dict[int, Dict[str, int]]:
+        """Return the latest stats of each worker."""
+        return {
+            worker: {
+                **self.worker_stats.get(worker, {}),
+                "restarts": self.restarts[worker],
+            }
+            for worker in range(len(self.shards))
+        }
+
+    def close(self) -> None:
+        """Stop supervising and stop all workers."""
+        self.stopping.set()
+        self.supervisor.join()
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        for shard in self.shards:
+            for _, server_socket in shard:
+                server_socket.close()
+
+
+def _worker(  # pylint: disable=too-many-arguments
+    worker: int,
+    shard: List[Tuple[str, socket.socket]],
+    ip_addr: str,
+    stats_queue: Any,
+    interval: float,
+    journal_dir: Optional[str],
+    timed: bool,
+) -> None:
+    """Host one shard of devices and report stats (runs in a worker process)."""
+    farm = Farm(ip_addr=ip_addr, journal_dir=journal_dir, timed=timed)
+    for device, server_socket in shard:
+        farm.add(device=device, server_socket=server_socket)
+    while True:
+        instances = [farm[port] for port in farm.ports()]
+        stats_queue.put(
+            (
+                worker,
+                {
+                    "pid": os.getpid(),
+                    "devices": len(instances),
+                    "connections": sum(i.metrics.connections for i in instances),
+                    "commands": sum(i.metrics.total() for i in instances),
+                },
+            )
+        )
+        time.sleep(interval)
+
+
+def parse_spec(spec: str) -> Tuple[str, int]:
+    """Parse a 'device[:count]' command line argument."""
+    device, _, count = spec.partition(":")
+    return device, int(count) if count else 1
+
+
+def parse_cable(spec: str) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """Parse a 'port:channel=port:channel' command line argument."""
+    generator, _, scope = spec.partition("=")
+    ends = [end.split(":") for end in (generator, scope)]
+    (gen_port, gen_channel), (scope_port, scope_channel) = ends
+    return (int(gen_port), int(gen_channel)), (int(scope_port), int(scope_channel))
+
+
+def main() -> None:
+    """Start a farm of emulators (when invoked from the command line)."""
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s:%(name)s:%(message)s",
+        datefmt="%Y%m%dT%H%M%S%z",
+        level=logging.INFO,
+    )
+
+    parser = argparse.ArgumentParser(prog="farm")
+    parser.add_argument("devices", nargs="+", help="device[:count], e.g. sdg1032x:4")
+    parser.add_argument("--ip-addr", default="127.0.0.1")
+    parser.add_argument("--first-port", type=int, default=21111)
+    parser.add_argument("--metrics-port", type=int)
+    parser.add_argument(
+        "--cable",
+        action="append",
+        default=[],
+        help="generator output to scope input, e.g. 21111:1=21112:2",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="worker processes, 0 for one per core"
+    )
+    parser.add_argument(
+        "--journal", metavar="DIR", help="keep device state in DIR across restarts"
+    )
+    parser.add_argument(
+        "--timed",
+        action="store_true",
+        help="take as long over commands as the instruments",
+    )
+    args = parser.parse_args()
+
+    devices: List[str] = []
+    for spec in args.devices:
+        device, count = parse_spec(spec)
+        devices += [device] * count
+
+    if args.workers != 1:
+        if args.cable:
+            parser.error("--cable needs all devices in one process (--workers 1)")
+        sharded = ShardedFarm(
+            devices=devices,
+            first_port=args.first_port,
+            workers=args.workers,
+            ip_addr=args.ip_addr,
+            journal_dir=args.journal,
+            timed=args.timed,
+        )
+        try:
+            sharded.supervisor.join()
+        except KeyboardInterrupt:
+            sharded.close()
+        return
+
+    farm = Farm(ip_addr=args.ip_addr, journal_dir=args.journal, timed=args.timed)
+    farm.add_range(devices=devices, first_port=args.first_port)
+    for spec in args.cable:
+        generator, scope = parse_cable(spec)
+        farm.connect(generator=generator, scope=scope)
+    if args.metrics_port is not None:
+        metrics.serve(port=args.metrics_port, render=farm.render_metrics)
+    try:
+        farm.thread.join()
+    except KeyboardInterrupt:
+        farm.close()
+
+
+errlog = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Split a stream of client bytes into newline-terminated commands.
+
+A command may carry an IEEE 488.2 definite-length block (e.g., the waveform
+in 'C1:WVDT WVNM,wave1,WAVEDATA,#41024<1024 bytes>'): '#', one digit giving
+the number of length digits, the length, then that many bytes of arbitrary
+binary data. The data is passed through untouched and newlines in it do not
+end the command. A block is always an argument, so only a '#' directly after a
+comma starts one. Any other '#' is text (e.g., in 'WVNM,#3rd').
+"""
+
+import logging
+import socket
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+# Longest command line we are willing to buffer before giving up on it
+MAX_LINE_LENGTH = 64 * 1024
+
+# Largest binary block we are willing to receive before giving up on it
+MAX_BLOCK_LENGTH = 64 * 1024 * 1024
+
+# Size of the reusable buffer each read lands in
+CHUNK_SIZE = 64 * 1024
+
+
+class Block(NamedTuple):
+    """A command or response carrying a definite-length binary block."""
+
+    # The text before the block (e.g., b'C1:WVDT WVNM,wave1,WAVEDATA,')
+    text: bytes
+    # The data of the block, without its '#' header
+    data: memoryview
+
+
+def block_header(length: int) -> bytes:
+    """Return the '#' header of a definite-length block of this many bytes."""
+    digits = str(length)
+    return str.encode(f"#{len(digits)}{digits}")
+
+
+class LineFramer:  # pylint: disable=too-many-instance-attributes
+    """Reassemble newline-terminated lines from arbitrarily chunked reads.
+
+    Reads land in one reusable buffer and are appended to a pending bytearray.
+    Complete lines are sliced off the front of the pending data, a partial
+    line is kept until the rest of it arrives. A line that grows beyond
+    max_line_length is dropped, up to and including its terminating newline.
+
+    A block that has not fully arrived gets a buffer of its own, sized from
+    its header, and the rest of it is read straight into that buffer. The
+    buffer becomes the data of the Block returned, without further copies.
+    """
+
+    pending: bytearray
+    max_line_length: int
+    max_block_length: int
+    discarding: bool
+    # The block being read into its own buffer, the text before it, and how
+    # many bytes of it have arrived
+    block: Optional[bytearray]
+    block_text: bytes
+    filled: int
+    # Bytes of an over-long block still to be dropped
+    skipping: int
+    # Blocks completed since lines() was last called
+    ready: List[Block]
+
+    def __init__(
+        self,
+        max_line_length: int = MAX_LINE_LENGTH,
+        chunk_size: int = CHUNK_SIZE,
+        max_block_length: int = MAX_BLOCK_LENGTH,
+    ) -> None:
+        self.pending = bytearray()
+        self.max_line_length = max_line_length
+        self.max_block_length = max_block_length
+        self.discarding = False
+        self.block = None
+        self.block_text = b""
+        self.filled = 0
+        self.skipping = 0
+        self.ready = []
+        self._chunk = memoryview(bytearray(chunk_size))
+        self._block_view = memoryview(b"")
+
+    def buffer(self) -> memoryview:
+        """Return the buffer the next read should land in."""
+        if self.block is not None:
+            return self._block_view[self.filled :]
+        if self.skipping:
+            return self._chunk[: self.skipping]
+        return self._chunk
+
+    def received(self, count: int) -> None:
+        """Account for count bytes read into buffer()."""
+        if self.block is not None:
+            self.filled += count
+            if self.filled == len(self.block):
+                self._finish_block()
+        elif self.skipping:
+            self.skipping -= count
+            if not self.skipping:
+                self.discarding = True
+        else:
+            self.pending += self._chunk[:count]
+
+    def recv_from(self, connection: socket.socket, limit: int = 0) -> int:
+        """Read once from the connection, at most limit bytes if given.
+
+        Return the byte count (0 on EOF).
+        """
+        target = self.buffer()
+        if limit:
+            target = target[:limit]
+        count = connection.recv_into(target)
+        self.received(count)
+        return count
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Append data received by some other means."""
+        view = memoryview(data)
+        while view:
+            if self.block is None and not self.skipping:
+                self.pending += view
+                return
+            target = self.buffer()
+            count = min(len(target), len(view))
+            target[:count] = view[:count]
+            self.received(count)
+            view = view[count:]
+
+    def lines(self) -> List[Union[bytes, Block]]:
+        """Return each complete line (without its line ending) received so far.
+
+        Lines carrying a block are returned as a Block, the others as bytes.
+        """
+        complete: List[Union[bytes, Block]] = list(self.ready)
+        self.ready.clear()
+        pending = self.pending
+        start = 0
+        with memoryview(pending) as view:
+            while True:
+                end = pending.find(b"\n", start)
+                if not self.discarding:
+                    mark, header = self._find_block(start, end)
+                    if mark >= 0:
+                        if header is None:
+                            # The rest of the header has not arrived yet
+                            break
+                        data_start, length = header
+                        text = bytes(view[start:mark])
+                        start = self._start_block(text, data_start, length, complete)
+                        if self.block is not None or self.skipping:
+                            break
+                        continue
+                if end < 0:
+                    break
+                if self.discarding:
+                    self.discarding = False
+                elif end - start > self.max_line_length:
+                    errlog.error(
+                        "Discarding command longer than %d bytes", self.max_line_length
+                    )
+                else:
+                    stop = end - 1 if end > start and pending[end - 1] == 0x0D else end
+                    complete.append(bytes(view[start:stop]))
+                start = end + 1
+        # Drop everything consumed in one go rather than once per line
+        del pending[:start]
+
+        if len(pending) > self.max_line_length:
+            if not self.discarding:
+                errlog.error(
+                    "Discarding command longer than %d bytes", self.max_line_length
+                )
+            self.discarding = True
+            pending.clear()
+
+        return complete
+
+    def _find_block(
+        self, start: int, end: int
+    ) -> Tuple[int, Optional[Tuple[int, int]]]:
+        """Find the first block header in the line at pending[start:end].
+
+        end is -1 when the line's newline has not arrived. Return where the
+        '#' is (-1 if there is none) and what _parse_header() returned for it.
+        """
+        pending = self.pending
+        limit = end if end >= 0 else len(pending)
+        mark = pending.find(b",#", start, limit)
+        while mark >= 0:
+            header = self._parse_header(mark + 1)
+            if header is None or header[1] >= 0:
+                return (mark + 1, header)
+            mark = pending.find(b",#", mark + 2, limit)
+        return (-1, None)
+
+    def _parse_header(self, mark: int) -> Optional[Tuple[int, int]]:
+        """Parse the block header at pending[mark].
+
+        Return where the data starts and its length, None if the header is
+        incomplete, or a length of -1 if this '#' does not start a block.
+        """
+        pending = self.pending
+        if len(pending) < mark + 2:
+            return None
+        count = pending[mark + 1] - 0x30
+        if not 1 <= count <= 9:
+            return (mark, -1)
+        digits = pending[mark + 2 : mark + 2 + count]
+        if not digits.isdigit() and digits != b"":
+            return (mark, -1)
+        if len(digits) < count:
+            return None
+        return (mark + 2 + count, int(digits))
+
+    def _start_block(
+        self,
+        text: bytes,
+        data_start: int,
+        length: int,
+        complete: List[Union[bytes, Block]],
+    ) -> int:
+        """Take the block starting at pending[data_start]. Return where parsing resumes."""
+        pending = self.pending
+        available = min(len(pending) - data_start, length)
+        if length > self.max_block_length:
+            errlog.error(
+                "Discarding binary block longer than %d bytes", self.max_block_length
+            )
+            self.skipping = length - available
+            self.discarding = self.skipping == 0
+            return data_start + available
+        if available == length:
+            # Arrived whole, copy it out of the pending data
+            data = bytearray(pending[data_start : data_start + length])
+            complete.append(Block(text, memoryview(data)))
+            self.discarding = True
+            return data_start + length
+        # Read the rest straight into a buffer of the final size
+        self.block = bytearray(length)
+        self._block_view = memoryview(self.block)
+        self._block_view[:available] = pending[data_start:]
+        self.block_text = text
+        self.filled = available
+        return len(pending)
+
+    def _finish_block(self) -> None:
+        """The block being read has fully arrived."""
+        assert self.block is not None
+        self.ready.append(Block(self.block_text, self._block_view))
+        self.block = None
+        self._block_view = memoryview(b"")
+        # The block is followed by the newline that ends its command
+        self.discarding = True
+
+
+errlog = logging.getLogger(__name__)
@@ -0,0 +1,316 @@
+"""The built-in arbitrary waveforms listed by STL.
+
+Each waveform is generated the first time it is used and written to an
+on-disk cache. From then on it is memory-mapped read-only, so every device
+instance, and every process sharing the cache directory, reads the same pages
+and nothing is recomputed. Files are written under a temporary name and
+renamed into place, so processes racing to generate one never see it half
+written.
+
+Waveforms are POINTS little-endian 16-bit samples spanning -32767 to 32767.
+Mathematically defined waveforms (ExpRise, Sinc, Hamming, Duty25, ...) follow
+their definition. The others, mostly recordings the instrument ships with (ECG,
+Voice, Radar, ...), get a repeatable stand-in made of a few harmonics.
+"""
+
+import logging
+import math
+import mmap
+import os
+import re
+import tempfile
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+# Points in every waveform, as in the instrument
+POINTS = 16384
+
+# Bump when a waveform's definition changes so stale cache files are ignored
+VERSION = 1
+
+# Where waveforms are cached, unless SIGLENT_EMULATOR_CACHE says otherwise
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "siglent_emulator")
+
+Samples = npt.NDArray[np.float64]
+# A function from x (from 0 to 1) to the waveform at x
+Shape = Callable[[Samples], npt.NDArray[Any]]
+
+# Waveforms mapped so far in this process, by cache file path
+_mapped: Dict[str, memoryview] = {}
+_lock = threading.Lock()
+
+
+def cache_dir() -> str:
+    """Return the directory waveforms are cached in."""
+    return os.environ.get("SIGLENT_EMULATOR_CACHE", CACHE_DIR)
+
+
+def _span(low: float, high: float) -> Samples:
+    """Return POINTS evenly spaced values from low up to (but not including) high."""
+    return np.linspace(low, high, POINTS, endpoint=False)
+
+
+def _erf(val: Samples) -> Samples:
+    """Return the error function of each value."""
+    return np.asarray(np.frompyfunc(math.erf, 1, 1)(val), dtype=np.float64)
+
+
+def _erfinv(val: Samples) -> Samples:
+    """Return the inverse error function of each value (Winitzki's approximation)."""
+    a = 0.147
+    ln = np.log(1 - val * val)
+    first = 2 / (np.pi * a) + ln / 2
+    return np.asarray(
+        np.sign(val) * np.sqrt(np.sqrt(first * first - ln / a) - first),
+        dtype=np.float64,
+    )
+
+
+def _series(evaluate: Callable[..., Any], val: Samples, coefs: List[int]) -> Samples:
+    """Return a numpy.polynomial series (e.g., lagval) evaluated at each value."""
+    return np.asarray(evaluate(val, coefs), dtype=np.float64)
+
+
+def _pdf(name: str) -> Shape:
+    """Return the shape of a probability density on x from 0 to 1."""
+    densities: Dict[str, Shape] = {
+        "Weibull": lambda u: 2 * u * np.exp(-(u**2)),
+        "LogNormal": lambda u: np.exp(-(np.log(u) ** 2) / 0.5) / u,
+        "Maxwell": lambda u: u**2 * np.exp(-(u**2) / 2),
+        "Rayleigh": lambda u: u * np.exp(-(u**2) / 2),
+    }
+    density = densities[name]
+    return lambda x: density(x * 5 + 1e-3)
+
+
+def _window(name: str) -> Shape:
+    """Return a window function, x from 0 to 1 spanning the window."""
+    cosines = {
+        "BlackmanH": (0.35875, 0.48829, 0.14128, 0.01168),
+        "FlattopWin": (0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368),
+    }
+    if name in cosines:
+        terms = cosines[name]
+        return lambda x: sum(
+            (-1) ** k * a * np.cos(2 * np.pi * k * x) for k, a in enumerate(terms)
+        )
+    windows: Dict[str, Shape] = {
+        "Hamming": lambda x: 0.54 - 0.46 * np.cos(2 * np.pi * x),
+        "Hanning": lambda x: 0.5 - 0.5 * np.cos(2 * np.pi * x),
+        "Blackman": lambda x: 0.42
+        - 0.5 * np.cos(2 * np.pi * x)
+        + 0.08 * np.cos(4 * np.pi * x),
+        "kaiser": lambda x: np.i0(14 * np.sqrt(1 - (2 * x - 1) ** 2)) / np.i0(14),
+        "Bartlett": lambda x: 1 - np.abs(2 * x - 1),
+        "Triangle": lambda x: 1 - np.abs(2 * x - 1),
+        "Gausswin": lambda x: np.exp(-0.5 * (2.5 * (2 * x - 1)) ** 2),
+        "Bartlett-Hann": lambda x: 0.62
+        - 0.48 * np.abs(x - 0.5)
+        - 0.38 * np.cos(2 * np.pi * x),
+        "BohmanWin": lambda x: (1 - np.abs(2 * x - 1))
+        * np.cos(np.pi * np.abs(2 * x - 1))
+        + np.sin(np.pi * np.abs(2 * x - 1)) / np.pi,
+        "ParzenWin": lambda x: np.where(
+            np.abs(2 * x - 1) <= 0.5,
+            1 - 6 * (2 * x - 1) ** 2 * (1 - np.abs(2 * x - 1)),
+            2 * (1 - np.abs(2 * x - 1)) ** 3,
+        ),
+        "TukeyWin": lambda x: np.where(
+            np.abs(2 * x - 1) <= 0.5,
+            1.0,
+            0.5 * (1 + np.cos(2 * np.pi * (np.abs(2 * x - 1) - 0.5))),
+        ),
+    }
+    return windows[name]
+
+
+# Waveform name -> its shape on x from 0 (inclusive) to 1 (exclusive). The
+# result is scaled to full range afterwards, so only the shape matters.
+shapes: Dict[str, Shape] = {
+    "ExpFal": lambda x: np.exp(-5 * x),
+    "ExpRise": lambda x: 1 - np.exp(-5 * x),
+    "LogFall": lambda x: -np.log(x * 99 + 1),
+    "LogRise": lambda x: np.log(x * 99 + 1),
+    "Sqrt": np.sqrt,
+    "Root3": np.cbrt,
+    "X^2": lambda x: x**2,
+    "X^3": lambda x: x**3,
+    "Sinc": lambda x: np.sinc(20 * (x - 0.5)),
+    "Gaussian": lambda x: np.exp(-(((x - 0.5) / 0.1) ** 2) / 2),
+    "Lorentz": lambda x: 1 / (1 + (20 * (x - 0.5)) ** 2),
+    "Dlorentz": lambda x: -2 * (20 * (x - 0.5)) / (1 + (20 * (x - 0.5)) ** 2) ** 2,
+    "Cauchy": lambda x: 1 / (1 + (10 * (x - 0.5)) ** 2),
+    "Versiera": lambda x: 1 / (1 + (5 * (x - 0.5)) ** 2),
+    "Laplace": lambda x: np.exp(-10 * np.abs(x - 0.5)),
+    "Haversine": lambda x: (1 - np.cos(2 * np.pi * x)) / 2,
+    "Gauspuls": lambda x: np.cos(20 * np.pi * (x - 0.5))
+    * np.exp(-(((x - 0.5) / 0.15) ** 2)),
+    "Gmonopuls": lambda x: -(x - 0.5) * np.exp(-(((x - 0.5) / 0.1) ** 2)),
+    "Tripuls": lambda x: np.maximum(0, 1 - np.abs(x - 0.5) * 4),
+    "Square": lambda x: np.where(x < 0.5, 1.0, -1.0),
+    "Upramp": lambda x: x,
+    "Dnramp": lambda x: 1 - x,
+    "StairUp": lambda x: np.floor(x * 8),
+    "StairDn": lambda x: 7 - np.floor(x * 8),
+    "StairUD": lambda x: np.floor(4 - np.abs(x * 8 - 4)),
+    "Trapezia": lambda x: np.clip(4 - np.abs(x * 10 - 5), 0, 3),
+    "Ppulse": lambda x: np.where(x < 0.2, 1.0, 0.0),
+    "Npulse": lambda x: np.where(x < 0.2, -1.0, 0.0),
+    "Chirp": lambda x: np.sin(2 * np.pi * (2 * x + 10 * x**2)),
+    "Twotone": lambda x: np.sin(20 * np.pi * x) + np.sin(26 * np.pi * x),
+    "AM": lambda x: (1 + 0.5 * np.sin(2 * np.pi * x)) * np.sin(40 * np.pi * x),
+    "FM": lambda x: np.sin(40 * np.pi * x + 5 * np.sin(2 * np.pi * x)),
+    "PM": lambda x: np.sin(40 * np.pi * x + 2 * np.sin(2 * np.pi * x)),
+    "PWM": lambda x: np.where(
+        (x * 20) % 1 < 0.5 + 0.4 * np.sin(2 * np.pi * x), 1.0, -1.0
+    ),
+    "PFM": lambda x: np.where(
+        np.sin(40 * np.pi * x + 5 * np.sin(2 * np.pi * x)) > 0, 1.0, -1.0
+    ),
+    "DampedOsc": lambda x: np.exp(-5 * x) * np.sin(40 * np.pi * x),
+    "SwingOsc": lambda x: np.sin(np.pi * x) * np.sin(40 * np.pi * x),
+    "Discharge": lambda x: np.exp(-8 * x),
+    "StepResp": lambda x: 1 - np.exp(-8 * x) * np.cos(30 * x),
+    "RoundHalf": lambda x: np.sqrt(1 - (2 * x - 1) ** 2),
+    "Tan": lambda x: np.tan(_span(-1.4, 1.4)),
+    "Cot": lambda x: 1 / np.tan(_span(0.15, np.pi - 0.15)),
+    "Sec": lambda x: 1 / np.cos(_span(-1.4, 1.4)),
+    "Csc": lambda x: 1 / np.sin(_span(0.15, np.pi - 0.15)),
+    "Asin": lambda x: np.arcsin(2 * x - 1),
+    "Acos": lambda x: np.arccos(2 * x - 1),
+    "Atan": lambda x: np.arctan(10 * (2 * x - 1)),
+    "Acot": lambda x: np.pi / 2 - np.arctan(10 * (2 * x - 1)),
+    "CosH": lambda x: np.cosh(3 * (2 * x - 1)),
+    "SinH": lambda x: np.sinh(3 * (2 * x - 1)),
+    "TanH": lambda x: np.tanh(3 * (2 * x - 1)),
+    "SecH": lambda x: 1 / np.cosh(3 * (2 * x - 1)),
+    "CscH": lambda x: 1 / np.sinh(_span(0.1, 3)),
+    "CotH": lambda x: 1 / np.tanh(_span(0.1, 3)),
+    "ACosH": lambda x: np.arccosh(1 + 9 * x),
+    "ASecH": lambda x: np.arccosh(1 / _span(0.01, 1)),
+    "ASinH": lambda x: np.arcsinh(10 * (2 * x - 1)),
+    "ATanH": lambda x: np.arctanh(0.99 * (2 * x - 1)),
+    "ACsch": lambda x: np.arcsinh(1 / _span(0.05, 5)),
+    "ACoth": lambda x: np.arctanh(1 / _span(1.01, 10)),
+    "Erf": lambda x: _erf(3 * (2 * x - 1)),
+    "Erfc": lambda x: 1 - _erf(3 * (2 * x - 1)),
+    "ErfInv": lambda x: _erfinv(0.999 * (2 * x - 1)),
+    "ErfcInv": lambda x: _erfinv(1 - _span(0.001, 1.999)),
+    "Besselj": lambda x: np.mean(
+        np.cos(np.outer(20 * x, np.sin(_span(0, np.pi)[::256]))), axis=1
+    ),
+    "Laguerre": lambda x: _series(np.polynomial.laguerre.lagval, 16 * x, [0] * 4 + [1]),
+    "Legend": lambda x: _series(
+        np.polynomial.legendre.legval, 2 * x - 1, [0] * 5 + [1]
+    ),
+    "Gamma": lambda x: np.asarray(
+        np.frompyfunc(math.gamma, 1, 1)(_span(0.2, 5)), dtype=np.float64
+    ),
+    "SinInt": lambda x: np.cumsum(np.sinc(_span(0, 20) / np.pi)),
+    "CosInt": lambda x: np.cumsum(np.cos(_span(0.5, 20.5)) / _span(0.5, 20.5)),
+    "Dirichlet": lambda x: np.sin(7 * _span(-np.pi, np.pi) / 2)
+    / (7 * np.sin(_span(-np.pi, np.pi) / 2)),
+    "Weibull": _pdf("Weibull"),
+    "LogNormal": _pdf("LogNormal"),
+    "Maxwell": _pdf("Maxwell"),
+    "Rayleigh": _pdf("Rayleigh"),
+    **{
+        name: _window(name)
+        for name in ["Hamming", "Hanning", "Blackman", "BlackmanH", "FlattopWin"]
+        + ["kaiser", "Bartlett", "Triangle", "Gausswin", "Bartlett-Hann"]
+        + ["BohmanWin", "ParzenWin", "TukeyWin"]
+    },
+}
+
+# Waveforms named for their duty cycle in percent (e.g., 'Duty25')
+Duty_name = re.compile(r"DUTY([0-9]+)")
+
+
+def _stand_in(name: str) -> Shape:
+    """Return a repeatable shape for a waveform with no published definition."""
+    rng = np.random.default_rng(zlib.crc32(str.encode(name)))
+    amplitudes = rng.uniform(0.1, 1.0, 6) / np.arange(1, 7)
+    phases = rng.uniform(0, 2 * np.pi, 6)
+    return lambda x: sum(
+        amplitude * np.sin(2 * np.pi * (k + 1) * x + phase)
+        for k, (amplitude, phase) in enumerate(zip(amplitudes, phases))
+    )
+
+
+def _duty(fraction: float) -> Shape:
+    """Return a pulse that is high for this fraction of the period."""
+    return lambda x: np.where(x < fraction, 1.0, -1.0)
+
+
+# The shapes by upper-cased name, as commands arrive upper-cased
+_shapes_upper = {key.upper(): val for key, val in shapes.items()}
+
+
+def generate(name: str) -> bytes:
+    """Return the samples of a waveform, computed from its definition."""
+    duty = Duty_name.fullmatch(name.upper())
+    if duty:
+        shape = _duty(int(duty.group(1)) / 100)
+    else:
+        shape = _shapes_upper.get(name.upper()) or _stand_in(name.upper())
+
+    with np.errstate(all="ignore"):
+        values = np.asarray(shape(_span(0, 1)), dtype=np.float64)
+    # Poles (e.g., of Cot) read as zero
+    finite = np.isfinite(values)
+    if not finite.any():
+        raise ValueError(f"Waveform '{name}' has no finite samples")
+    values[~finite] = 0
+    # Scale to full range
+    values -= (values.max() + values.min()) / 2
+    peak = np.abs(values).max()
+    if peak > 0:
+        values /= peak
+    return bytes(np.round(values * 32767).astype("<i2").tobytes())
+
+
+def path(name: str, directory: Optional[str] = None) -> str:
+    """Return the cache file of a waveform."""
+    safe = re.sub(r"[^0-9A-Za-z_]", "_", name.upper())
+    return os.path.join(
+        directory or cache_dir(), f"waves-v{VERSION}", f"{safe}-{POINTS}.i16"
+    )
+
+
+def load(name: str, directory: Optional[str] = None) -> memoryview:
+    """Return a waveform's samples, read-only, generating and caching it if needed."""
+    file_path = path(name, directory)
+    with _lock:
+        view = _mapped.get(file_path)
+        if view is not None:
+            return view
+        if not os.path.exists(file_path):
+            _write(file_path, generate(name))
+        with open(file_path, "rb") as file:
+            # The mapping stays valid after the file is closed
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        _mapped[file_path] = view
+        return view
+
+
+def _write(file_path: str, data: bytes) -> None:
+    """Write a file atomically, readers see all of it or none of it."""
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        os.replace(temporary, file_path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    errlog.info("Cached built-in waveform %s", file_path)
+
+
+errlog = logging.getLogger(__name__)
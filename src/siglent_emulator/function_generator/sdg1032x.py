@@ -24,9 +24,9 @@ class SDG1032XChannel(sdg1000x_series.SDG1000XChannel):
 class SDG1032X(sdg1000x_series.SDG1000X):
     """Emulate a Siglent function generator."""
 
-    channels = [SDG1032XChannel(channel=1), SDG1032XChannel(channel=2)]
+    channel_class = SDG1032XChannel
 
-    def identification(self) -> str:
+    def identification(self, _: str) -> str:
         """Process the command, update state, optionally return a result."""
         return "Siglent Technologies,SDG1032X,SDG1XCBD5R6027,1.01.01.33R1B6"
 
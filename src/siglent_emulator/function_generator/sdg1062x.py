@@ -8,7 +8,7 @@ from siglent_emulator.function_generator import sdg1032x
 class SDG1062X(sdg1032x.SDG1032X):
     """Emulate a Siglent function generator."""
 
-    def identification(self) -> str:
+    def identification(self, _: str) -> str:
         """Process the command, update state, optionally return a result."""
         return "Siglent Technologies,SDG1062X,SDG1XCBD5R6027,1.01.01.33R1B6"
 
@@ -4,16 +4,29 @@ Command set is based on the SDG Series Programming Guide:
 https://siglentna.com//wp-content/uploads/dlm_uploads/2019/12/SDG_Programming-Guide_PG02-E04A.pdf
 
 TODO:
-* Honor the CHDR setting when returning responses.
 * Make sure derived classes override their appropriate methods.
 * Support parsing of incoming long commands as well as short commands.
 """
 
 from abc import ABC, abstractmethod
 import logging
-import re
-from typing import Dict, List
-
+import threading
+from types import MappingProxyType
+from typing import (
+    Callable,
+    ContextManager,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+
+from siglent_emulator import framing
 from siglent_emulator.function_generator import util
 
 # pylint: disable=line-too-long, broad-except, modified-iterating-dict
@@ -44,7 +57,7 @@ Commands: List[str] = [
     "COUP?",
     "VOLTPRT?",
     "STL?",
-    # Unknown why it hangs
+    # Returns a binary block rather than a line of text
     # "C1:WVDT? 0",
     # "C2:WVDT? 0",
     # "C1:WVDT? 59",
@@ -96,21 +109,176 @@ channel_defaults: Dict[str, str] = {
 }
 
 
-class SDGChannel(ABC):
-    """Emulate an SDG series function generator output channel."""
+class ChannelState:  # pylint: disable=too-many-instance-attributes
+    """The settings of one output channel, numbers held as floats.
+
+    Values are only converted to text when a query reports them. Each setting
+    is an attribute named after its lower-cased key in channel_defaults.
+    """
+
+    # Settings that hold numbers, the rest hold keywords (e.g., 'ON', 'SINE')
+    numeric = frozenset(
+        ["FRQ", "PERI", "AMP", "AMPVRMS", "AMPDBM", "OFST"]
+        + ["HLEV", "LLEV", "PHSE", "MAX_OUTPUT_AMP"]
+    )
+
+    __slots__ = [key.lower() for key in channel_defaults]
+
+    output: str
+    wvtp: str
+    frq: float
+    peri: float
+    amp: float
+    ampvrms: float
+    ampdbm: float
+    ofst: float
+    hlev: float
+    llev: float
+    phse: float
+    load: str
+    plrt: str
+    max_output_amp: float
+
+    def __init__(self, values: Dict[str, str]) -> None:
+        for key, val in values.items():
+            self.set(key, val)
+
+    def __contains__(self, key: str) -> bool:
+        """Is this the key of a setting?"""
+        return key in channel_defaults
+
+    def set(self, key: str, val: str) -> None:
+        """Set a setting from its text (ValueError if a number does not parse)."""
+        setattr(self, key.lower(), float(val) if key in self.numeric else val)
+
+    def copy(self) -> "ChannelState":
+        """Return an independent copy."""
+        # Spelled out, this is several times faster than copying in a loop.
+        # pylint: disable=no-member
+        other = ChannelState.__new__(ChannelState)
+        other.output = self.output
+        other.wvtp = self.wvtp
+        other.frq = self.frq
+        other.peri = self.peri
+        other.amp = self.amp
+        other.ampvrms = self.ampvrms
+        other.ampdbm = self.ampdbm
+        other.ofst = self.ofst
+        other.hlev = self.hlev
+        other.llev = self.llev
+        other.phse = self.phse
+        other.load = self.load
+        other.plrt = self.plrt
+        other.max_output_amp = self.max_output_amp
+        return other
+
+
+channel_state_defaults = ChannelState(channel_defaults)
+
+# The arbitrary waveform a channel starts out with
+ARWV_DEFAULT = "StairUp"
+
+
+class SDGChannel(ABC):  # pylint: disable=too-many-instance-attributes
+    """Emulate an SDG series function generator output channel.
+
+    Responses to the queries in query_dependencies are kept, already
+    formatted for the current CHDR mode. A kept response is dropped when a
+    setting it depends on changes, so handlers that change settings must report
+    them with changed(). Replacing cvals as a whole, or changing CHDR, drops
+    every kept response.
+
+    The channel's state is only read or changed with its lock held, see
+    SDG.lock_for().
+    """
 
-    cvals = channel_defaults.copy()
+    cvals: ChannelState
     channel: int
+    lock: threading.RLock
+
+    # Command header -> name of the method that processes it. Derived classes
+    # register additional commands by extending this table, and take over an
+    # existing one by overriding its method.
+    commands: Dict[str, str] = {
+        "OUTP": "outp",
+        "OUTP?": "outp",
+        "BSWV": "bswv",
+        "BSWV?": "bswv",
+        "ARWV": "arwv",
+        "ARWV?": "arwv",
+    }
+    handlers: Dict[str, Callable[[str], str]]
+    # Name of the selected arbitrary waveform, built-in or uploaded
+    arb_wave: str
+    # Uploaded waveforms by name, shared with the device and its other channels
+    waves: Dict[str, "Wave"]
+
+    # Query header -> the settings its response is rendered from
+    query_dependencies: Dict[str, FrozenSet[str]] = {
+        "OUTP?": frozenset(["OUTPUT", "LOAD", "PLRT"]),
+        "BSWV?": frozenset(
+            ["WVTP", "FRQ", "PERI", "AMP", "AMPVRMS", "AMPDBM", "OFST"]
+            + ["HLEV", "LLEV", "PHSE", "LOAD"]
+        ),
+    }
+    # Settings reported to changed() -> the query headers that depend on them
+    dependents: Dict[Tuple[str, ...], Tuple[str, ...]]
+    # Query header -> formatted response
+    responses: Dict[str, str]
+    # The settings object and the CHDR mode the kept responses were made for
+    rendered: ChannelState
+    mode: str
 
     def __init__(self, channel: int) -> None:
         self.channel = channel
+        self.cvals = channel_state_defaults.copy()
+        self.responses = {}
+        self.rendered = self.cvals
+        self.mode = ""
+        self.arb_wave = ARWV_DEFAULT
+        self.waves = {}
+        self.prefix = f"C{channel}:"
+        self.lock = threading.RLock()
+        self.handlers = {
+            header: getattr(self, name) for header, name in self.commands.items()
+        }
+        self.dependents = {}
+
+    def changed(self, *keys: str) -> None:
+        """Drop the kept responses that depend on these settings."""
+        responses = self.responses
+        if responses:
+            headers = self.dependents.get(keys)
+            if headers is None:
+                headers = self.dependents[keys] = tuple(
+                    header
+                    for header, depends in self.query_dependencies.items()
+                    if not depends.isdisjoint(keys)
+                )
+            for header in headers:
+                responses.pop(header, None)
+
+    def query(self, header: str, mode: str) -> str:
+        """Return the response to a query in query_dependencies, formatted for this CHDR mode."""
+        responses = self.responses
+        if self.rendered is not self.cvals or self.mode != mode:
+            # The settings were replaced as a whole (e.g., by PACP or *RST), or
+            # CHDR changed
+            responses.clear()
+            self.rendered = self.cvals
+            self.mode = mode
+        response = responses.get(header)
+        if response is None:
+            response = util.format_verbs(self.handlers[header](header), mode)
+            responses[header] = response
+        return response
 
     @abstractmethod
     def outp(self, command: str) -> str:
         """Proccess all variants of the OUTP command."""
         cvals = self.cvals
         if command == "OUTP?":
-            return f"C{self.channel}:OUTP {cvals['OUTPUT']},LOAD,{cvals['LOAD']},PLRT,{cvals['PLRT']}"
+            return f"C{self.channel}:OUTP {cvals.output},LOAD,{cvals.load},PLRT,{cvals.plrt}"
 
         if not command.startswith("OUTP "):
             errlog.error("Unknown command format: '%s'", command)
@@ -124,45 +292,49 @@ class SDGChannel(ABC):
             cmd = sub_cmds[i]
 
             if cmd in ["ON", "OFF"]:
-                cvals["OUTPUT"] = cmd
+                cvals.output = cmd
+                self.changed("OUTPUT")
                 i += 1
                 continue
 
             if cmd == "LOAD":
                 param = sub_cmds[i + 1]
                 i += 2
-                if cvals["LOAD"] == param:
+                if cvals.load == param:
                     # Value unchanged, nothing to do
                     break
-                cvals["LOAD"] = param
+                cvals.load = param
                 if param == "50":
                     # Derivative values
-                    cvals["AMP"] = util.div(n=cvals["AMP"], d="2")
-                    cvals["AMPVRMS"] = util.div(n=cvals["AMPVRMS"], d="2")
-                    cvals["AMPDBM"] = util.div(n=cvals["AMPDBM"], d="2")
-                    cvals["HLEV"] = util.div(n=cvals["HLEV"], d="2")
-                    cvals["LLEV"] = util.div(n=cvals["LLEV"], d="2")
+                    cvals.amp = util.divide(n=cvals.amp, d=2)
+                    cvals.ampvrms = util.divide(n=cvals.ampvrms, d=2)
+                    cvals.ampdbm = util.divide(n=cvals.ampdbm, d=2)
+                    cvals.hlev = util.divide(n=cvals.hlev, d=2)
+                    cvals.llev = util.divide(n=cvals.llev, d=2)
                 elif param == "HZ":
                     # Derivative values
-                    cvals["AMP"] = util.mul(a=cvals["AMP"], b="2")
-                    cvals["AMPVRMS"] = util.mul(a=cvals["AMPVRMS"], b="2")
-                    cvals["AMPDBM"] = util.mul(a=cvals["AMPDBM"], b="2")
-                    cvals["HLEV"] = util.mul(a=cvals["HLEV"], b="2")
-                    cvals["LLEV"] = util.mul(a=cvals["LLEV"], b="2")
+                    cvals.amp = util.multiply(a=cvals.amp, b=2)
+                    cvals.ampvrms = util.multiply(a=cvals.ampvrms, b=2)
+                    cvals.ampdbm = util.multiply(a=cvals.ampdbm, b=2)
+                    cvals.hlev = util.multiply(a=cvals.hlev, b=2)
+                    cvals.llev = util.multiply(a=cvals.llev, b=2)
                 else:
+                    self.changed("LOAD")
                     return ""
+                self.changed("LOAD", "AMP", "AMPVRMS", "AMPDBM", "HLEV", "LLEV")
                 break
 
-            for key in self.cvals:
-                if cmd == key:
-                    param = sub_cmds[i + 1]
-                    cvals[key] = param
-                    i += 2
-                    break
-            else:
+            if cmd not in cvals:
                 # This cmd is not suported
                 errlog.error("Unknown sub_command '%s' in command '%s'", cmd, command)
                 return ""
+            try:
+                cvals.set(cmd, sub_cmds[i + 1])
+            except ValueError:
+                errlog.error("Invalid value for '%s' in command '%s'", cmd, command)
+                return ""
+            self.changed(cmd)
+            i += 2
 
         return ""
 
@@ -172,9 +344,11 @@ class SDGChannel(ABC):
         cvals = self.cvals
 
         if command == "BSWV?":
-            if cvals["LOAD"] == "50":
-                return f"C{self.channel}:BSWV WVTP,{cvals['WVTP']},FRQ,{cvals['FRQ']}HZ,PERI,{cvals['PERI']}S,AMP,{cvals['AMP']}V,AMPVRMS,{cvals['AMPVRMS']}Vrms,AMPDBM,{cvals['AMPDBM']}dBm,OFST,{cvals['OFST']}V,HLEV,{cvals['HLEV']}V,LLEV,{cvals['LLEV']}V,PHSE,{cvals['PHSE']}"
-            return f"C{self.channel}:BSWV WVTP,{cvals['WVTP']},FRQ,{cvals['FRQ']}HZ,PERI,{cvals['PERI']}S,AMP,{cvals['AMP']}V,AMPVRMS,{cvals['AMPVRMS']}Vrms,OFST,{cvals['OFST']}V,HLEV,{cvals['HLEV']}V,LLEV,{cvals['LLEV']}V,PHSE,{cvals['PHSE']}"
+            # Settings take few distinct values, float_to_str() caches their text
+            fmt = util.float_to_str
+            if cvals.load == "50":
+                return f"C{self.channel}:BSWV WVTP,{cvals.wvtp},FRQ,{fmt(cvals.frq)}HZ,PERI,{fmt(cvals.peri)}S,AMP,{fmt(cvals.amp)}V,AMPVRMS,{fmt(cvals.ampvrms)}Vrms,AMPDBM,{fmt(cvals.ampdbm)}dBm,OFST,{fmt(cvals.ofst)}V,HLEV,{fmt(cvals.hlev)}V,LLEV,{fmt(cvals.llev)}V,PHSE,{fmt(cvals.phse)}"
+            return f"C{self.channel}:BSWV WVTP,{cvals.wvtp},FRQ,{fmt(cvals.frq)}HZ,PERI,{fmt(cvals.peri)}S,AMP,{fmt(cvals.amp)}V,AMPVRMS,{fmt(cvals.ampvrms)}Vrms,OFST,{fmt(cvals.ofst)}V,HLEV,{fmt(cvals.hlev)}V,LLEV,{fmt(cvals.llev)}V,PHSE,{fmt(cvals.phse)}"
 
         if not command.startswith("BSWV "):
             errlog.error("Unknown command format: '%s'", command)
@@ -186,54 +360,82 @@ class SDGChannel(ABC):
         cmd = sub_cmds[0]
 
         if cmd == "FRQ":
-            param = sub_cmds[1]
-            cvals[cmd] = f"{float(param):g}"
-            cvals["PERI"] = util.div(n="1", d=param)
+            frq = float(sub_cmds[1])
+            cvals.frq = util.round_sig(frq)
+            cvals.peri = util.divide(n=1, d=frq)
+            self.changed("FRQ", "PERI")
 
         elif cmd == "AMP":
-            param = sub_cmds[1]
-            amp = float(param)
+            amp = float(sub_cmds[1])
             # The function generator clamps the amplitude
             amp = max(amp, 0.002)
             amp = min(amp, 20)
-            cvals["AMP"] = util.float_to_str(amp)
+            cvals.amp = util.round_sig(amp)
             # Vrms = Vpp * 1/sqrt(2) / 2 = Vpp * .3535
-            cvals["AMPVRMS"] = util.mul(a=cvals["AMP"], b=".3535")
-            cvals["HLEV"] = util.div(n=cvals["AMP"], d="2")
-            cvals["LLEV"] = util.sub(a=cvals["HLEV"], b=cvals["AMP"])
+            cvals.ampvrms = util.multiply(a=cvals.amp, b=0.3535)
+            cvals.hlev = util.divide(n=cvals.amp, d=2)
+            cvals.llev = util.subtract(a=cvals.hlev, b=cvals.amp)
+            self.changed("AMP", "AMPVRMS", "HLEV", "LLEV")
 
-        else:
-            for key in self.cvals:
-                if cmd == key:
-                    param = sub_cmds[1]
-                    cvals[key] = param
-                    break
-            else:
-                # This cmd is not suported
-                errlog.error("Invalid sub_command '%s' in command '%s'", cmd, command)
+        elif cmd in cvals:
+            try:
+                cvals.set(cmd, sub_cmds[1])
+            except ValueError:
+                errlog.error("Invalid value for '%s' in command '%s'", cmd, command)
                 return ""
+            self.changed(cmd)
+
+        else:
+            # This cmd is not suported
+            errlog.error("Invalid sub_command '%s' in command '%s'", cmd, command)
+            return ""
 
         return ""
 
+    def arwv(self, command: str) -> str:
+        """Process all variants of the ARWV command."""
+        if command == "ARWV?":
+            index = builtin_indexes.get(self.arb_wave.upper())
+            if index is None:
+                return f"C{self.channel}:ARWV NAME,{self.arb_wave}"
+            return f"C{self.channel}:ARWV INDEX,{index[1:]},NAME,{self.arb_wave}"
+
+        # Command is of the form 'C1:ARWV INDEX,2' or 'C1:ARWV NAME,STAIRUP'
+        params = util.parse_command(command).params
+        if len(params) != 2:
+            errlog.error("Unknown command format: '%s'", command)
+            return ""
+        name = None
+        if params[0] == "INDEX":
+            name = builtin_waves.get(f"M{params[1]}")
+        elif params[0] == "NAME":
+            index = builtin_indexes.get(params[1])
+            if index is not None:
+                name = builtin_waves[index]
+            elif params[1] in self.waves:
+                name = params[1]
+        if name is None:
+            errlog.error("Unknown waveform in command '%s'", command)
+            return ""
+        self.arb_wave = name
+        return ""
+
     def reset(self) -> str:
         """Reset the channel to defaults."""
-        self.cvals = channel_defaults.copy()
+        self.cvals = channel_state_defaults.copy()
+        self.arb_wave = ARWV_DEFAULT
         return ""
 
     def dispatch(self, command: str) -> str:
         """Process the command, update state, optionally return a result."""
-        if not command.startswith(f"C{self.channel}:"):
+        parsed = util.parse_command(command)
+        if parsed.channel != self.prefix:
             return ""
 
-        sub_command = command[3:]
-
-        if sub_command.startswith("OUTP"):
-            return self.outp(command=sub_command)
-
-        if sub_command.startswith("BSWV"):
-            return self.bswv(command=sub_command)
-
-        return ""
+        handler = self.handlers.get(parsed.header)
+        if handler is None:
+            return ""
+        return handler(parsed.body)
 
 
 device_defaults: Dict[str, str] = {
@@ -244,20 +446,243 @@ device_defaults: Dict[str, str] = {
 }
 
 
-class SDG(ABC):
+# Built-in waveform index (e.g., 'M10') -> name (e.g., 'ExpFal'), as STL lists them
+builtin_waves: Dict[str, str] = dict(
+    zip(
+        device_defaults["STL"][4:].split(", ")[0::2],
+        device_defaults["STL"][4:].split(", ")[1::2],
+    )
+)
+# Upper-cased built-in waveform name -> index, as commands arrive upper-cased
+builtin_indexes: Dict[str, str] = {
+    name.upper(): index for index, name in builtin_waves.items()
+}
+
+# Settings of an uploaded waveform that were not given with it
+wave_defaults: Dict[str, str] = {
+    "FREQ": "1000",
+    "AMPL": "4",
+    "OFST": "0",
+    "PHASE": "0",
+}
+
+
+class Wave(NamedTuple):
+    """An arbitrary waveform uploaded with WVDT."""
+
+    # Settings uploaded with the waveform (e.g., 'FREQ': '2000')
+    settings: Dict[str, str]
+    # The samples exactly as uploaded, read-only
+    data: memoryview
+
+
+class ChannelSnapshot(NamedTuple):
+    """The state of one output channel, see SDG.snapshot()."""
+
+    # Never changed, restoring copies it
+    cvals: ChannelState
+    arb_wave: str
+
+
+class Snapshot(NamedTuple):
+    """The state of a device, see SDG.snapshot().
+
+    Restoring a snapshot leaves it unchanged, so it can be restored any number
+    of times, and shared by any number of devices of the same model.
+    """
+
+    dvals: Mapping[str, str]
+    channels: Tuple[ChannelSnapshot, ...]
+    # Waveforms are read-only, only the name -> waveform table is copied
+    waves: Mapping[str, Wave]
+
+
+# Snapshots a device keeps for EMU:SNAP, so clients cannot grow them without bound
+MAX_SNAPSHOTS = 64
+
+# The name EMU:SNAP and EMU:REST use when none is given
+SNAPSHOT_DEFAULT = "DEFAULT"
+
+
+class LockSet:
+    """Several locks held together, taken in order and released in reverse."""
+
+    def __init__(self, locks: List[threading.RLock]) -> None:
+        self.locks = locks
+        # Bound once, these are on the path of every command that holds them
+        self.acquires = [lock.acquire for lock in locks]
+        self.releases = [lock.release for lock in reversed(locks)]
+
+    def acquire(self) -> None:
+        """Take every lock, waiting for each in turn."""
+        for acquire in self.acquires:
+            acquire()
+
+    def release(self) -> None:
+        """Release every lock."""
+        for release in self.releases:
+            release()
+
+    def __enter__(self) -> None:
+        self.acquire()
+
+    def __exit__(self, *_: object) -> None:
+        self.release()
+
+
+class SDG(ABC):  # pylint: disable=too-many-instance-attributes
     """Emulate a Siglent SDG series function generator.
 
     There are several models in the Siglent family. Some support commands that
     others do not. For instance, not all support the CHDR command. This base
     class implements all common functionality and provides abstract methods for
     derived classes to implement specific functions.
+
+    Clients on different connections may send commands at the same time. A
+    command to one channel holds that channel's lock, so clients working on
+    different channels run in parallel. Other commands hold the device lock,
+    and those in exclusive_commands also hold every channel lock, so each
+    command is applied as a whole. Commands that only read the channels hold
+    the channel locks, and commands that only return constants hold a lock of
+    their own.
     """
 
+    channel_class: Type[SDGChannel]
+    channel_count: int = 2
     channels: List[SDGChannel]
-    dvals = device_defaults.copy()
+    dvals: Dict[str, str]
+
+    # Command header -> name of the method that processes it. Derived classes
+    # register additional commands by extending this table, and take over an
+    # existing one by overriding its method.
+    commands: Dict[str, str] = {
+        "*IDN?": "identification",
+        "*OPC": "operation_complete",
+        "*OPC?": "operation_complete",
+        "*RST": "reset",
+        "PACP": "parameter_copy",
+        "CHDR": "comm_header",
+        "CHDR?": "comm_header",
+        "BUZZ": "buzz",
+        "BUZZ?": "buzz",
+        "STL": "store_list",
+        "STL?": "store_list",
+        # Emulator extensions, no instrument has these
+        "EMU:SNAP": "save_snapshot",
+        "EMU:REST": "restore_snapshot",
+    }
+    handlers: Dict[str, Callable[[str], str]]
+    channel_prefixes: Dict[str, SDGChannel]
+    # Headers of the commands that read or change more than one channel, or
+    # the waveforms the channels share
+    exclusive_commands: FrozenSet[str] = frozenset(
+        ["*RST", "EMU:SNAP", "EMU:REST", "WVDT"]
+    )
+    # Headers of the commands that read or change channels, but no device
+    # settings or waveforms
+    channels_commands: FrozenSet[str] = frozenset(["PACP"])
+    # Headers of the commands that only return constants
+    constant_commands: FrozenSet[str] = frozenset(["*IDN?", "*OPC", "*OPC?"])
+    # Held for device commands, and first for exclusive commands
+    lock: threading.RLock
+    # The device lock and every channel lock, see locked()
+    all_locks: "LockSet"
+    # Command header -> the locks it is processed with. Commands not listed
+    # hold the lock in prefix_locks for their channel prefix, or the device lock.
+    command_locks: Dict[str, Union[threading.RLock, "LockSet"]]
+    # Channel prefix -> that channel's lock
+    prefix_locks: Dict[str, threading.RLock]
+
+    # As commands, for commands that carry or return a binary block. Their
+    # methods also get the block data sent with the command, if any.
+    block_commands: Dict[str, str] = {
+        "WVDT": "wave_data",
+        "WVDT?": "wave_data",
+    }
+    block_handlers: Dict[
+        str, Callable[[str, Optional[memoryview]], Union[str, framing.Block]]
+    ]
+    # Uploaded waveforms by name
+    waves: Dict[str, Wave]
+    # Snapshots saved with EMU:SNAP, by name
+    snapshots: Dict[str, Snapshot]
+
+    def __init__(self) -> None:
+        # All state is per instance so many devices can share one process
+        self.dvals = device_defaults.copy()
+        self.channels = [
+            self.channel_class(channel=i + 1) for i in range(self.channel_count)
+        ]
+        self.handlers = {
+            header: getattr(self, name) for header, name in self.commands.items()
+        }
+        self.channel_prefixes = {channel.prefix: channel for channel in self.channels}
+        self.block_handlers = {
+            header: getattr(self, name) for header, name in self.block_commands.items()
+        }
+        self.waves = {}
+        for channel in self.channels:
+            channel.waves = self.waves
+        self.snapshots = {}
+        self.lock = threading.RLock()
+        self.all_locks = LockSet([self.lock] + [ch.lock for ch in self.channels])
+        channel_locks = LockSet([channel.lock for channel in self.channels])
+        self.command_locks = {}
+        # Shared by constant commands only, so they never wait on other commands
+        constants_lock = threading.RLock()
+        for header in self.constant_commands:
+            self.command_locks[header] = constants_lock
+        for header in self.channels_commands:
+            self.command_locks[header] = channel_locks
+        for header in self.exclusive_commands:
+            self.command_locks[header] = self.all_locks
+        self.prefix_locks = {channel.prefix: channel.lock for channel in self.channels}
+
+    def locked(self) -> ContextManager[object]:
+        """Hold the device lock and every channel lock, taken in that order."""
+        return self.all_locks
+
+    def lock_for(self, parsed: util.ParsedCommand) -> ContextManager[object]:
+        """Return the locks the parsed command is processed with.
+
+        The locks are reentrant, callers may hold them around process() to
+        do more under the same locks (e.g., journal the command).
+        """
+        return self.command_locks.get(parsed.header) or self.prefix_locks.get(
+            parsed.channel, self.lock
+        )
+
+    def snapshot(self) -> Snapshot:
+        """Return the state of the device: settings, waveforms and selections.
+
+        Snapshots saved with EMU:SNAP are not part of it.
+        """
+        with self.locked():
+            return Snapshot(
+                dvals=MappingProxyType(self.dvals.copy()),
+                channels=tuple(
+                    ChannelSnapshot(
+                        cvals=channel.cvals.copy(), arb_wave=channel.arb_wave
+                    )
+                    for channel in self.channels
+                ),
+                waves=MappingProxyType(self.waves.copy()),
+            )
+
+    def restore(self, snapshot: Snapshot) -> None:
+        """Put the device back in the state it was in when snapshot() was taken."""
+        with self.locked():
+            self.dvals = dict(snapshot.dvals)
+            for channel, state in zip(self.channels, snapshot.channels):
+                # A new settings object, the channel drops its kept responses
+                channel.cvals = state.cvals.copy()
+                channel.arb_wave = state.arb_wave
+            # The channels share this table, it is refilled rather than replaced
+            self.waves.clear()
+            self.waves.update(snapshot.waves)
 
     @abstractmethod
-    def identification(self) -> str:
+    def identification(self, command: str) -> str:
         """Process the command, update state, optionally return a result."""
 
     def operation_complete(self, command: str) -> str:
@@ -267,7 +692,7 @@ class SDG(ABC):
             return "*OPC 1"
         return ""
 
-    def reset(self) -> str:
+    def reset(self, _: str) -> str:
         """Process the command, update state, optionally return a result."""
         self.dvals = device_defaults.copy()
         for channel in self.channels:
@@ -302,6 +727,7 @@ class SDG(ABC):
             errlog.exception(err)
             return ""
         self.channels[dest].cvals = self.channels[source].cvals.copy()
+        self.channels[dest].arb_wave = self.channels[source].arb_wave
         return ""
 
     def store_list(self, command: str) -> str:
@@ -314,7 +740,7 @@ class SDG(ABC):
         if params[1] == "BUILDIN":
             return self.dvals["STL"]
         if params[1] == "USER":
-            return self.dvals["STL USER"]
+            return ",".join([self.dvals["STL USER"], *self.waves])
         return ""
 
     def buzz(self, command: str) -> str:
@@ -329,47 +755,140 @@ class SDG(ABC):
         self.dvals["BUZZ"] = params[1]
         return ""
 
-    # pylint: disable=too-many-return-statements
+    def save_snapshot(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        # Command is of the form 'EMU:SNAP NAME' (NAME is optional)
+        params = command.split(" ")
+        if len(params) > 2:
+            return ""
+        name = params[1] if len(params) == 2 else SNAPSHOT_DEFAULT
+        if name not in self.snapshots and len(self.snapshots) >= MAX_SNAPSHOTS:
+            errlog.error("Too many snapshots, not saving '%s'", name)
+            return ""
+        self.snapshots[name] = self.snapshot()
+        return ""
+
+    def restore_snapshot(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        # Command is of the form 'EMU:REST NAME' (NAME is optional)
+        params = command.split(" ")
+        if len(params) > 2:
+            return ""
+        name = params[1] if len(params) == 2 else SNAPSHOT_DEFAULT
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            errlog.error("No snapshot named '%s'", name)
+            return ""
+        self.restore(snapshot)
+        return ""
+
+    def wave_data(
+        self, command: str, data: Optional[memoryview]
+    ) -> Union[str, framing.Block]:
+        """Process the command, update state, optionally return a result."""
+        parsed = util.parse_command(command)
+        params = parsed.params
+        if parsed.header == "WVDT?":
+            return self.wave_query(params)
+
+        # Command is of the form 'C1:WVDT WVNM,WAVE1,FREQ,2000,WAVEDATA,#41024...'
+        if data is None:
+            errlog.error("No binary block in command '%s'", command)
+            return ""
+        settings = dict(zip(params[0::2], params[1::2]))
+        name = settings.pop("WVNM", "")
+        settings.pop("WAVEDATA", None)
+        if name == "":
+            errlog.error("No waveform name in command '%s'", command)
+            return ""
+        # The block is kept as received, it is not copied or decoded
+        self.waves[name] = Wave(
+            settings={**wave_defaults, **settings}, data=data.toreadonly()
+        )
+        # Uploading to a channel also selects the waveform there
+        channel = self.channel_prefixes.get(parsed.channel)
+        if channel is not None:
+            channel.arb_wave = name
+        return ""
+
+    def wave_query(self, params: Tuple[str, ...]) -> Union[str, framing.Block]:
+        """Return the waveform a WVDT? query asks for."""
+        if len(params) == 1 and params[0] in builtin_waves:
+            # Query is of the form 'WVDT? M10'
+            return self.builtin_wave_data(params[0])
+        # Query is of the form 'WVDT? USER,WAVE1'
+        if len(params) != 2 or params[0] != "USER":
+            return ""
+        wave = self.waves.get(params[1])
+        if wave is None:
+            return ""
+        listed = ",".join(f"{key},{val}" for key, val in wave.settings.items())
+        text = f"WVDT WVNM,{params[1]},LENGTH,{len(wave.data)}B,{listed},WAVEDATA,"
+        return framing.Block(str.encode(text), wave.data)
+
+    def builtin_wave_data(self, index: str) -> framing.Block:
+        """Return a built-in waveform (e.g., 'M10') as WVDT? does."""
+        # Only built-in waveforms need NumPy, import it when they are first used
+        from siglent_emulator.function_generator import (  # pylint: disable=import-outside-toplevel
+            library,
+        )
+
+        name = builtin_waves[index]
+        data = library.load(name)
+        text = f"WVDT POS,{index},WVNM,{name},LENGTH,{len(data)}B,WAVEDATA,"
+        return framing.Block(str.encode(text), data)
+
     def dispatch(self, command: str) -> str:
         """Process the command, update state, optionally return a result."""
-        command = util.shorten_verbs(command)
+        return self.route(util.parse_command(command))
 
+    def route(self, parsed: util.ParsedCommand) -> str:
+        """Process the parsed command, update state, optionally return a result."""
         # Is this a device command?
-        if command == "*IDN?":
-            return self.identification()
-        if command.startswith("*OPC"):
-            return self.operation_complete(command=command)
-        if command.startswith("PACP"):
-            return self.parameter_copy(command=command)
-        if command == "*RST":
-            return self.reset()
-        if command.startswith("CHDR"):
-            return self.buzz(command=command)
-        if command.startswith("BUZZ"):
-            return self.buzz(command=command)
-        if command.startswith("STL"):
-            return self.store_list(command=command)
+        if parsed.channel == "":
+            handler = self.handlers.get(parsed.header)
+            if handler is not None:
+                return handler(parsed.command)
+            return ""
 
         # Is this is a channel command?
-        if re.match("C[1-2]:", command):
-            try:
-                channel = int(command[1])
-            except Exception as err:
-                errlog.exception(err)
-                return ""
-            channel -= 1
-            if channel < 0 or channel >= len(self.channels):
-                return ""
-            return self.channels[channel].dispatch(command=command)
+        channel = self.channel_prefixes.get(parsed.channel)
+        if channel is not None:
+            return channel.dispatch(command=parsed.command)
 
         # This was not a valid command
         return ""
 
-    def process(self, command: str) -> str:
-        """Normalize the command to the short version as it comes in and to the CHDR-specified format as it goes out."""
-        command = util.shorten_verbs(command)
-        response = self.dispatch(command)
-        return util.format_verbs(response, self.dvals["CHDR"])
+    def process(
+        self, command: str, data: Optional[memoryview] = None
+    ) -> Union[str, framing.Block]:
+        """Normalize the command to the short version as it comes in and to the CHDR-specified format as it goes out.
+
+        data is the binary block sent with the command, if any. Commands that
+        return a binary block return a framing.Block.
+        """
+        parsed = util.parse_command(command)
+        # As lock_for(), inline as this is on every command's path
+        lock = self.command_locks.get(parsed.header) or self.prefix_locks.get(
+            parsed.channel, self.lock
+        )
+        # Cheaper than a with statement, which costs about 0.3 us more here
+        lock.acquire()
+        try:
+            # Answer channel queries from their kept responses
+            if parsed.channel and parsed.header == parsed.body and data is None:
+                channel = self.channel_prefixes.get(parsed.channel)
+                if channel is not None and parsed.header in channel.query_dependencies:
+                    return channel.query(parsed.header, self.dvals["CHDR"])
+            block_handler = self.block_handlers.get(parsed.header)
+            if block_handler is not None:
+                return block_handler(parsed.command, data)
+            if data is not None:
+                errlog.error("Unexpected binary block in command '%s'", command)
+                return ""
+            return util.format_verbs(self.route(parsed), self.dvals["CHDR"])
+        finally:
+            lock.release()
 
 
 errlog = logging.getLogger(__name__)
@@ -1,10 +1,19 @@
 """Functions common across multiple Siglent devices."""
 
+import functools
 import logging
-from typing import Dict, List
+import math
+import re
+from typing import Dict, List, NamedTuple, Tuple
 
 # pylint: disable=broad-except
 
+# Number of distinct command strings (and responses) whose parse is remembered
+PARSE_CACHE_SIZE = 4096
+FORMAT_CACHE_SIZE = 4096
+
+Channel_prefix = re.compile(r"C[0-9]+:")
+
 
 Short_to_long: Dict[str, str] = {
     "*IDN?": "*IDN?",
@@ -62,6 +71,7 @@ def strip_verbs(command: str) -> str:
     return " ".join(params[1:])
 
 
+@functools.lru_cache(maxsize=FORMAT_CACHE_SIZE)
 def format_verbs(command: str, length: str) -> str:
     """Replace the command verb with its short form, long form, or none."""
     if length == "OFF":
@@ -71,6 +81,38 @@ def format_verbs(command: str, length: str) -> str:
     return shorten_verbs(command=command)
 
 
+class ParsedCommand(NamedTuple):
+    """A command broken into its parts (e.g., 'C1:BSWV FRQ,12')."""
+
+    # The whole command with short verbs (e.g., 'C1:BSWV FRQ,12')
+    command: str
+    # The channel prefix (e.g., 'C1:'), empty for device commands
+    channel: str
+    # The command with its channel prefix removed (e.g., 'BSWV FRQ,12')
+    body: str
+    # The command header (e.g., 'BSWV', 'BSWV?', '*IDN?')
+    header: str
+    # The comma separated parameters (e.g., ('FRQ', '12'))
+    params: Tuple[str, ...]
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_command(command: str) -> ParsedCommand:
+    """Normalize and split a command. Results are cached, see cache_info()."""
+    command = shorten_verbs(command)
+    prefix = Channel_prefix.match(command)
+    channel = prefix.group() if prefix else ""
+    body = command[len(channel) :]
+    header, _, params = body.partition(" ")
+    return ParsedCommand(
+        command=command,
+        channel=channel,
+        body=body,
+        header=header,
+        params=tuple(params.split(",")) if params else (),
+    )
+
+
 def channel_to_index(channel: str) -> int:
     """Given a string like 'C2' return the digit as an int (-1 on failure)."""
     try:
@@ -83,32 +125,39 @@ def channel_to_index(channel: str) -> int:
     return chan - 1
 
 
+@functools.lru_cache(maxsize=FORMAT_CACHE_SIZE)
 def float_to_str(val: float) -> str:
     """Convert a float to a string with some pretty formatting."""
-    if val == int(val):
-        val = int(val)
-    return f"{val:g}"
+    # Integral values already format without a fraction, adding 0.0 turns -0 into 0
+    return f"{val + 0.0:g}"
+
+
+def round_sig(val: float) -> float:
+    """Round to the six significant digits float_to_str() displays.
+
+    The result is the float that float_to_str()'s output would parse back to.
+    """
+    if val == 0 or not math.isfinite(val):
+        return val
+    return round(val, 5 - math.floor(math.log10(abs(val))))
 
 
-def sub(a: str, b: str) -> str:  # pylint: disable=invalid-name
-    """Return a-b. All values are strings."""
-    val = float(a) - float(b)
-    return float_to_str(val=val)
+def subtract(a: float, b: float) -> float:  # pylint: disable=invalid-name
+    """Return a-b, rounded with round_sig()."""
+    return round_sig(a - b)
 
 
-def mul(a: str, b: str) -> str:  # pylint: disable=invalid-name
-    """Return a*b. All values are strings."""
-    val = float(a) * float(b)
-    return float_to_str(val=val)
+def multiply(a: float, b: float) -> float:  # pylint: disable=invalid-name
+    """Return a*b, rounded with round_sig()."""
+    return round_sig(a * b)
 
 
-def div(n: str, d: str) -> str:  # pylint: disable=invalid-name
-    """Return n/d using high precision. All values are strings."""
-    if float(d) == 0:
-        return "inf"
+def divide(n: float, d: float) -> float:  # pylint: disable=invalid-name
+    """Return n/d using high precision, rounded with round_sig()."""
+    if d == 0:
+        return math.inf
     places = 1e10
-    val = (float(n) * places) / (float(d) * places)
-    return float_to_str(val=val)
+    return round_sig((n * places) / (d * places))
 
 
 errlog = logging.getLogger(__name__)
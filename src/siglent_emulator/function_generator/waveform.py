@@ -0,0 +1,131 @@
+"""Render the signal a function generator channel is set up to produce.
+
+Rendering works like the direct digital synthesis in the instrument: a phase
+accumulator steps through a table holding one period of the waveform. The
+table is scaled to the channel's amplitude and offset and kept until one of
+them (or the waveform type) changes, so steady-state rendering is one NumPy
+index operation per chunk. Frequency and phase only move the accumulator and
+take effect without rebuilding the table. Phase is continuous from one render
+to the next, including across frequency changes.
+
+The signal is rendered whatever the OUTP setting, and AMP and OFST are taken
+as reported by BSWV? (i.e., already adjusted for LOAD).
+"""
+
+import logging
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from siglent_emulator.function_generator.sdg_common import SDGChannel
+
+# Samples per second rendered when not specified
+SAMPLE_RATE = 1_000_000.0
+
+# Samples in each chunk stream() yields when not specified
+CHUNK_SIZE = 64 * 1024
+
+# Points in the one-period table, a power of two like the instrument's
+TABLE_SIZE = 1 << 16
+
+# Fraction of the period SQUARE and PULSE spend high, and RAMP spends rising
+SQUARE_DUTY = 0.5
+PULSE_DUTY = 0.5
+RAMP_SYMMETRY = 0.5
+
+# Waveform types that can be rendered
+WAVEFORMS = ("SINE", "SQUARE", "RAMP", "PULSE", "NOISE", "DC")
+
+Samples = npt.NDArray[np.float64]
+
+
+def shape(wvtp: str) -> Samples:
+    """Return one period of a waveform type, from -1 to 1, in TABLE_SIZE points."""
+    phase = np.arange(TABLE_SIZE, dtype=np.float64) / TABLE_SIZE
+    if wvtp == "SINE":
+        return np.asarray(np.sin(2 * np.pi * phase), dtype=np.float64)
+    if wvtp == "SQUARE":
+        return np.where(phase < SQUARE_DUTY, 1.0, -1.0)
+    if wvtp == "PULSE":
+        return np.where(phase < PULSE_DUTY, 1.0, -1.0)
+    if wvtp == "RAMP":
+        rising = 2 * phase / RAMP_SYMMETRY - 1
+        falling = 1 - 2 * (phase - RAMP_SYMMETRY) / (1 - RAMP_SYMMETRY)
+        return np.where(phase < RAMP_SYMMETRY, rising, falling)
+    if wvtp == "DC":
+        return np.zeros(TABLE_SIZE)
+    raise ValueError(f"Cannot render waveform type '{wvtp}'")
+
+
+class Generator:
+    """Render sample buffers from the live settings of one channel."""
+
+    channel: SDGChannel
+    sample_rate: float
+    # Position in the period, from 0 to 1, of the next sample
+    phase: float
+    # The settings the table was built from, and the table
+    key: Optional[Tuple[str, float, float]]
+    table: Samples
+
+    def __init__(
+        self,
+        channel: SDGChannel,
+        sample_rate: float = SAMPLE_RATE,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.channel = channel
+        self.sample_rate = sample_rate
+        self.phase = 0.0
+        self.key = None
+        self.table = np.zeros(0)
+        self.rng = np.random.default_rng(seed)
+
+    def period(self) -> Samples:
+        """Return one period of the current signal, in volts, in TABLE_SIZE points."""
+        cvals = self.channel.cvals
+        key = (cvals.wvtp, cvals.amp, cvals.ofst)
+        if key != self.key:
+            table = shape(cvals.wvtp) * (cvals.amp / 2) + cvals.ofst
+            table.flags.writeable = False
+            self.key, self.table = key, table
+        return self.table
+
+    def render(self, count: int) -> Samples:
+        """Return the next count samples of the signal, in volts."""
+        cvals = self.channel.cvals
+        if cvals.wvtp == "NOISE":
+            # Nearly all samples of the noise lie within the amplitude
+            return self.rng.normal(cvals.ofst, cvals.amp / 6, count)
+
+        table = self.period()
+        step = cvals.frq / self.sample_rate
+        start = self.phase + cvals.phse / 360
+        phase = np.arange(count, dtype=np.float64)
+        phase *= step
+        phase += start
+        # Whole cycles are dropped before indexing, the rest picks a table point
+        phase -= np.floor(phase)
+        index = (phase * TABLE_SIZE).astype(np.intp)
+        # Guard the one point rounding can push to the end of the table
+        np.minimum(index, TABLE_SIZE - 1, out=index)
+        self.phase = (self.phase + count * step) % 1.0
+        return table[index]
+
+    def stream(
+        self, chunk_size: int = CHUNK_SIZE, total: Optional[int] = None
+    ) -> Iterator[Samples]:
+        """Yield the signal chunk_size samples at a time, forever or up to total.
+
+        Each chunk reflects the settings at the time it is rendered.
+        """
+        remaining = total
+        while remaining is None or remaining > 0:
+            count = chunk_size if remaining is None else min(chunk_size, remaining)
+            yield self.render(count)
+            if remaining is not None:
+                remaining -= count
+
+
+errlog = logging.getLogger(__name__)
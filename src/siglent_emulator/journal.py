@@ -0,0 +1,294 @@
+"""Keep the state of emulated devices across restarts.
+
+A Journal appends every command that changes a device's state to a log file,
+as the command arrives on the wire (see framing.py). Every compact_every
+commands, and when the journal is closed, the device's snapshot (see
+SDG.snapshot()) is written to a state file and a new log is started. On
+startup the state file is restored in one step, and only the commands logged
+since are replayed.
+
+The files of a journal with key K, in generation N:
+
+* K.state: the state as of the start of generation N, written atomically.
+  It is a line of JSON followed by the uploaded waveforms' bytes.
+* K.N.log: the commands processed since.
+
+Each command is flushed to the operating system once it is logged, so the
+journal survives the emulator crashing. A crash while a command is being
+logged only loses that command: a partial command at the end of the log is
+not replayed. A crash while compacting leaves either the old state file and
+log, or the new state file, whose log is then empty.
+
+Only devices with snapshot() and restore() (the function generators) can be
+journaled, see supported().
+
+A command is logged with the device locks it was processed with still held
+(see SDG.lock_for()), so the log replays in the order commands were applied.
+Compacting takes every device lock before the journal's lock, as the device
+locks are always taken first.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from types import MappingProxyType
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from siglent_emulator import framing
+from siglent_emulator.function_generator import sdg_common
+
+# Commands logged before the journal is compacted. Compacting takes about as
+# long as replaying 200 commands, this bounds how many a restart replays.
+COMPACT_EVERY = 256
+
+# Bumped when the state file format changes
+STATE_VERSION = 1
+
+
+def supported(device: Any) -> bool:
+    """Can this device be journaled?"""
+    return isinstance(device, sdg_common.SDG)
+
+
+class Journal:
+    """The state file and command log of one device."""
+
+    directory: str
+    key: str
+    compact_every: int
+    generation: int
+    # Commands logged since the last compaction
+    logged: int
+    log: Optional[BinaryIO]
+
+    def __init__(
+        self, directory: str, key: str, compact_every: int = COMPACT_EVERY
+    ) -> None:
+        self.directory = directory
+        self.key = key
+        self.compact_every = compact_every
+        self.generation = 0
+        self.logged = 0
+        self.log = None
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def state_path(self) -> str:
+        """Return the path of the state file."""
+        return os.path.join(self.directory, f"{self.key}.state")
+
+    def log_path(self, generation: int) -> str:
+        """Return the path of the log of a generation."""
+        return os.path.join(self.directory, f"{self.key}.{generation}.log")
+
+    def load(self, device: sdg_common.SDG) -> int:
+        """Restore the device to its journaled state and start logging.
+
+        Return the count of commands replayed, they are then compacted. A state
+        file written by another model is ignored, the device then starts from
+        its defaults.
+        """
+        with device.locked(), self.lock:
+            self.generation = 0
+            state = _read_state(self.state_path())
+            if state is not None and state[0]["model"] == type(device).__name__:
+                header, body = state
+                self.generation = header["generation"]
+                device.restore(_decode(header["state"], body))
+                device.snapshots = {
+                    name: _decode(snapshot, body)
+                    for name, snapshot in header["snapshots"].items()
+                }
+            elif state is not None:
+                errlog.error("Ignoring the state of another model in %s", self.key)
+            replayed = self._replay(device)
+            self._remove_stale_log()
+            self.log = open(  # pylint: disable=consider-using-with
+                self.log_path(self.generation), "ab"
+            )
+            self.logged = 0
+            if replayed:
+                # The next restart need not replay them again
+                self._compact(device)
+        return replayed
+
+    def _replay(self, device: sdg_common.SDG) -> int:
+        """Process the commands in the log of the current generation."""
+        try:
+            with open(self.log_path(self.generation), "rb") as file:
+                logged = file.read()
+        except FileNotFoundError:
+            return 0
+        framer = framing.LineFramer()
+        framer.feed(logged)
+        # A partial command left by a crash stays in the framer
+        lines = framer.lines()
+        for line in lines:
+            try:
+                if isinstance(line, framing.Block):
+                    device.process(line.text.decode("utf-8"), data=line.data)
+                else:
+                    device.process(line.decode("utf-8"))
+            except Exception as err:  # pylint: disable=broad-except
+                errlog.error("Failed to replay %r in %s", line, self.key)
+                errlog.exception(err)
+        return len(lines)
+
+    def _remove_stale_log(self) -> None:
+        """Remove the previous generation's log, left by a crash while compacting."""
+        # Thousands of journals share the directory, it is not listed
+        if self.generation > 0:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.log_path(self.generation - 1))
+
+    def record(self, command: str, data: Optional[memoryview] = None) -> bool:
+        """Log a command the device has processed.
+
+        Return True when compacting is due. The caller then compacts, once it
+        no longer holds the command's locks.
+        """
+        record = [str.encode(command)]
+        if data is not None:
+            record += [framing.block_header(len(data)), data]
+        record.append(b"\n")
+        with self.lock:
+            if self.log is None:
+                return False
+            self.log.write(b"".join(record))
+            self.log.flush()
+            self.logged += 1
+            # Only the command reaching the threshold asks for compacting
+            return self.logged == self.compact_every
+
+    def compact(self, device: sdg_common.SDG) -> None:
+        """Write the device's state and start a new log."""
+        with device.locked(), self.lock:
+            if self.log is not None:
+                self._compact(device)
+
+    def _compact(self, device: sdg_common.SDG) -> None:
+        """As compact(), with the lock held."""
+        assert self.log is not None
+        generation = self.generation + 1
+        _write_state(self.state_path(), device, generation)
+        self.log.close()
+        self.log = open(  # pylint: disable=consider-using-with
+            self.log_path(generation), "ab"
+        )
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.log_path(self.generation))
+        self.generation = generation
+        self.logged = 0
+
+    def close(self, device: sdg_common.SDG) -> None:
+        """Compact and stop logging."""
+        with device.locked(), self.lock:
+            if self.log is not None:
+                self._compact(device)
+                self.log.close()
+                self.log = None
+
+
+def _encode(
+    snapshot: sdg_common.Snapshot, blobs: List[memoryview], offsets: Dict[int, int]
+) -> Dict[str, Any]:
+    """Return a snapshot as JSON. Waveform data goes to blobs, each once."""
+    waves: Dict[str, Any] = {}
+    for name, wave in snapshot.waves.items():
+        offset = offsets.get(id(wave.data))
+        if offset is None:
+            offset = offsets[id(wave.data)] = sum(len(blob) for blob in blobs)
+            blobs.append(wave.data)
+        waves[name] = {
+            "settings": wave.settings,
+            "offset": offset,
+            "length": len(wave.data),
+        }
+    return {
+        "dvals": dict(snapshot.dvals),
+        "channels": [
+            {
+                "cvals": {
+                    name: getattr(channel.cvals, name)
+                    for name in sdg_common.ChannelState.__slots__
+                },
+                "arb_wave": channel.arb_wave,
+            }
+            for channel in snapshot.channels
+        ],
+        "waves": waves,
+    }
+
+
+def _decode(encoded: Dict[str, Any], body: memoryview) -> sdg_common.Snapshot:
+    """Return the snapshot _encode() encoded. Waveform data is read from body."""
+    channels = []
+    for channel in encoded["channels"]:
+        cvals = sdg_common.ChannelState.__new__(sdg_common.ChannelState)
+        for name, val in channel["cvals"].items():
+            setattr(cvals, name, val)
+        channels.append(
+            sdg_common.ChannelSnapshot(cvals=cvals, arb_wave=channel["arb_wave"])
+        )
+    waves = {
+        name: sdg_common.Wave(
+            settings=wave["settings"],
+            data=body[wave["offset"] : wave["offset"] + wave["length"]],
+        )
+        for name, wave in encoded["waves"].items()
+    }
+    return sdg_common.Snapshot(
+        dvals=MappingProxyType(encoded["dvals"]),
+        channels=tuple(channels),
+        waves=MappingProxyType(waves),
+    )
+
+
+def _write_state(file_path: str, device: sdg_common.SDG, generation: int) -> None:
+    """Write the device's state file atomically, readers see all of it or none."""
+    blobs: List[memoryview] = []
+    offsets: Dict[int, int] = {}
+    header = {
+        "version": STATE_VERSION,
+        "model": type(device).__name__,
+        "generation": generation,
+        "state": _encode(device.snapshot(), blobs, offsets),
+        "snapshots": {
+            name: _encode(snapshot, blobs, offsets)
+            for name, snapshot in device.snapshots.items()
+        },
+    }
+    directory = os.path.dirname(file_path)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(str.encode(json.dumps(header, separators=(",", ":")) + "\n"))
+            for blob in blobs:
+                file.write(blob)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, file_path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _read_state(file_path: str) -> Optional[Tuple[Dict[str, Any], memoryview]]:
+    """Return the header of a state file and the waveform data after it."""
+    try:
+        with open(file_path, "rb") as file:
+            contents = file.read()
+    except FileNotFoundError:
+        return None
+    end = contents.index(b"\n")
+    header: Dict[str, Any] = json.loads(contents[:end])
+    if header.get("version") != STATE_VERSION:
+        errlog.error("Ignoring unsupported state file %s", file_path)
+        return None
+    return header, memoryview(contents)[end + 1 :]
+
+
+errlog = logging.getLogger(__name__)
@@ -0,0 +1,206 @@
+"""Talk to an emulator in the same process, without TCP.
+
+connect() returns a socket-like object (sendall, recv, recv_into, makefile,
+...) wired straight to an emulator. Code written against a socket runs
+unchanged at function call speed, no port or thread needed:
+
+    sock = loopback.connect("SDG1032X")
+    sock.sendall(b"C1:OUTP?\\n")
+    sock.recv(2048)
+
+What is sent is framed exactly as on a TCP connection (see framing.py): a
+command may be split across sends or several sent at once, and binary blocks
+are passed through. Every complete command is processed during the send, so
+its response is waiting by the time recv() is called. As nothing else can
+send a response later, recv() with nothing waiting raises socket.timeout
+straight away, where a socket would wait for its timeout to expire.
+"""
+
+import collections
+import io
+import itertools
+import logging
+import socket
+from typing import Any, Deque, Optional, Tuple, Union
+
+from siglent_emulator import emulator
+from siglent_emulator import framing
+
+# Loopback connections are reported in the metrics as loopback:<n>
+PEER = "loopback"
+_connection_ids = itertools.count(1)
+
+
+class Loopback:
+    """A socket-like connection straight to an emulator."""
+
+    instance: emulator.Emulator
+    framer: framing.LineFramer
+    # Responses not yet received, the first one partly received
+    outgoing: Deque[memoryview]
+    closed: bool
+
+    def __init__(self, instance: emulator.Emulator) -> None:
+        self.instance = instance
+        self.framer = framing.LineFramer()
+        self.outgoing = collections.deque()
+        self.closed = False
+        self.timeout: Optional[float] = None
+        self.peer = f"{PEER}:{next(_connection_ids)}"
+        instance.metrics.connection_opened(self.peer)
+
+    def __enter__(self) -> "Loopback":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection."""
+        if not self.closed:
+            self.closed = True
+            self.outgoing.clear()
+            self.instance.metrics.connection_closed(self.peer)
+
+    def _check_open(self) -> None:
+        """Fail like a closed socket does."""
+        if self.closed:
+            raise OSError(9, "Bad file descriptor")
+
+    def sendall(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Process every command completed by data, queue the responses."""
+        self._check_open()
+        self.framer.feed(data)
+        for response in self.instance.respond_all(self.framer, self.peer):
+            self.outgoing.append(memoryview(response))
+
+    def send(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        """Send all of data. Return its length."""
+        self.sendall(data)
+        return len(data)
+
+    def recv_into(self, buffer: Any, nbytes: int = 0, _flags: int = 0) -> int:
+        """Copy up to nbytes of the waiting responses into buffer."""
+        self._check_open()
+        if not self.outgoing:
+            raise socket.timeout("timed out")
+        target = memoryview(buffer).cast("B")
+        if nbytes:
+            target = target[:nbytes]
+        count = 0
+        while self.outgoing and count < len(target):
+            response = self.outgoing[0]
+            chunk = min(len(response), len(target) - count)
+            target[count : count + chunk] = response[:chunk]
+            count += chunk
+            if chunk == len(response):
+                self.outgoing.popleft()
+            else:
+                self.outgoing[0] = response[chunk:]
+        return count
+
+    def recv(self, bufsize: int, _flags: int = 0) -> bytes:
+        """Return up to bufsize bytes of the waiting responses."""
+        self._check_open()
+        if self.outgoing and len(self.outgoing[0]) >= bufsize:
+            # Most reads are of one response, or part of one
+            response = self.outgoing.popleft()
+            if len(response) > bufsize:
+                self.outgoing.appendleft(response[bufsize:])
+            return bytes(response[:bufsize])
+        buffer = bytearray(bufsize)
+        return bytes(buffer[: self.recv_into(buffer)])
+
+    def pending(self) -> int:
+        """Return the count of response bytes waiting to be received."""
+        return sum(len(response) for response in self.outgoing)
+
+    def makefile(  # pylint: disable=too-many-arguments
+        self,
+        mode: str = "r",
+        buffering: Optional[int] = None,
+        *,
+        encoding: Optional[str] = None,
+        errors: Optional[str] = None,
+        newline: Optional[str] = None,
+    ) -> Any:
+        """Return a file object reading and writing this connection, as a socket's."""
+        raw = _LoopbackIO(self, mode)
+        if buffering == 0:
+            return raw
+        size = buffering if buffering and buffering > 0 else io.DEFAULT_BUFFER_SIZE
+        buffer: Any
+        if raw.readable() and raw.writable():
+            buffer = io.BufferedRWPair(raw, raw, size)
+        elif raw.readable():
+            buffer = io.BufferedReader(raw, size)
+        else:
+            buffer = io.BufferedWriter(raw, size)
+        if "b" in mode:
+            return buffer
+        return io.TextIOWrapper(buffer, encoding, errors, newline)
+
+    # The rest of the socket interface drivers commonly call
+
+    def settimeout(self, value: Optional[float]) -> None:
+        """Keep the timeout, it never needs waiting out."""
+        self.timeout = value
+
+    def gettimeout(self) -> Optional[float]:
+        """Return the timeout."""
+        return self.timeout
+
+    def setblocking(self, flag: bool) -> None:
+        """Set the timeout as a socket does."""
+        self.timeout = None if flag else 0.0
+
+    def setsockopt(self, *_: Any) -> None:
+        """Ignore socket options, there is no socket."""
+
+    def getpeername(self) -> Tuple[str, int]:
+        """Return the address of the emulator."""
+        return (PEER, 0)
+
+    def getsockname(self) -> Tuple[str, int]:
+        """Return the address of this end."""
+        return (PEER, 0)
+
+    def shutdown(self, _how: int) -> None:
+        """Shutting down either direction closes the connection."""
+        self.close()
+
+
+class _LoopbackIO(io.RawIOBase):
+    """The raw file object under Loopback.makefile()."""
+
+    def __init__(self, sock: Loopback, mode: str) -> None:
+        super().__init__()
+        self.sock = sock
+        self.reading = "r" in mode
+        self.writing = "w" in mode
+
+    def readable(self) -> bool:
+        return self.reading
+
+    def writable(self) -> bool:
+        return self.writing
+
+    def readinto(self, buffer: Any) -> int:
+        """Read into buffer, 0 (end of file) when nothing is waiting."""
+        if not self.sock.outgoing:
+            return 0
+        return self.sock.recv_into(buffer)
+
+    def write(self, data: Any) -> int:
+        """Send all of data."""
+        return self.sock.send(data)
+
+
+def connect(device: Union[str, emulator.Emulator]) -> Loopback:
+    """Connect to an emulator of the device, or to an existing emulator."""
+    if isinstance(device, str):
+        device = emulator.Emulator(device=device)
+    return Loopback(device)
+
+
+errlog = logging.getLogger(__name__)
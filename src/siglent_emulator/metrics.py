@@ -0,0 +1,244 @@
+"""Count commands and measure their service time.
+
+Every command an emulator processes is recorded by header (e.g., 'BSWV?') and
+by client connection: a count, an error count and a latency histogram. The
+numbers can be read in-process with summary(), or scraped by Prometheus from
+the text served by serve().
+"""
+
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import math
+import threading
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS: Tuple[float, ...] = (
+    1e-6,
+    2.5e-6,
+    5e-6,
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    math.inf,
+)
+
+# Distinct headers tracked before the rest are lumped together, so a client
+# sending garbage cannot grow the metrics without bound
+MAX_HEADERS = 256
+OTHER = "OTHER"
+
+
+class Histogram:
+    """Count observations in fixed latency buckets."""
+
+    __slots__ = ("counts", "count", "errors", "total")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        """Record one observation."""
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, fraction: float) -> float:
+        """Return the upper bound of the bucket holding the given quantile."""
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def summary(self) -> Dict[str, float]:
+        """Return count, errors, mean, p50 and p99 (times in seconds)."""
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """Per-header and per-connection command metrics of one emulator."""
+
+    commands: Dict[str, Histogram]
+    peers: Dict[str, Histogram]
+    connections: int
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.peers = {}
+        self.connections = 0
+
+    def connection_opened(self, peer: str) -> None:
+        """Start tracking a client connection."""
+        with self.lock:
+            self.connections += 1
+            self.peers[peer] = Histogram()
+
+    def connection_closed(self, peer: str) -> None:
+        """Stop tracking a client connection."""
+        with self.lock:
+            self.peers.pop(peer, None)
+
+    def record(self, header: str, peer: str, seconds: float, error: bool) -> None:
+        """Record one processed command."""
+        with self.lock:
+            histogram = self.commands.get(header)
+            if histogram is None:
+                if len(self.commands) >= MAX_HEADERS:
+                    header = OTHER
+                histogram = self.commands.setdefault(header, Histogram())
+            histogram.observe(seconds, error)
+            if peer in self.peers:
+                self.peers[peer].observe(seconds, error)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the summary of every header seen, see Histogram.summary()."""
+        with self.lock:
+            return {header: h.summary() for header, h in self.commands.items()}
+
+    def peer_summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the summary of every open connection."""
+        with self.lock:
+            return {peer: h.summary() for peer, h in self.peers.items()}
+
+    def total(self) -> int:
+        """Return the number of commands processed."""
+        with self.lock:
+            return sum(h.count for h in self.commands.values())
+
+    def render(self, labels: str = "") -> str:
+        """Return the metrics in the Prometheus text exposition format.
+
+        labels (e.g., 'port="21111"') is added to every sample.
+        """
+        lines: List[str] = []
+        with self.lock:
+            lines.append(_sample("siglent_connections_total", labels, self.connections))
+            lines.append(_sample("siglent_connections_open", labels, len(self.peers)))
+            for header, histogram in sorted(self.commands.items()):
+                label = _join(f'header="{_escape(header)}"', labels)
+                lines.append(_sample("siglent_commands_total", label, histogram.count))
+                lines.append(
+                    _sample("siglent_command_errors_total", label, histogram.errors)
+                )
+                seen = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    seen += count
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(
+                        _sample(
+                            "siglent_command_seconds_bucket",
+                            _join(label, f'le="{le}"'),
+                            seen,
+                        )
+                    )
+                lines.append(
+                    _sample("siglent_command_seconds_sum", label, histogram.total)
+                )
+                lines.append(
+                    _sample("siglent_command_seconds_count", label, histogram.count)
+                )
+            for peer, histogram in sorted(self.peers.items()):
+                label = _join(f'peer="{_escape(peer)}"', labels)
+                lines.append(
+                    _sample("siglent_connection_commands_total", label, histogram.count)
+                )
+        return "".join(lines)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value, clients choose what command headers hold."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _join(*labels: str) -> str:
+    """Join label lists, skipping empty ones."""
+    return ",".join(label for label in labels if label)
+
+
+def _sample(name: str, labels: str, value: float) -> str:
+    """Format one sample line."""
+    if labels:
+        return f"{name}{{{labels}}} {value}\n"
+    return f"{name} {value}\n"
+
+
+HEADER = """# HELP siglent_connections_total Client connections accepted.
+# TYPE siglent_connections_total counter
+# HELP siglent_connections_open Client connections currently open.
+# TYPE siglent_connections_open gauge
+# HELP siglent_commands_total Commands processed.
+# TYPE siglent_commands_total counter
+# HELP siglent_command_errors_total Commands that raised an error.
+# TYPE siglent_command_errors_total counter
+# HELP siglent_command_seconds Command service time.
+# TYPE siglent_command_seconds histogram
+# HELP siglent_connection_commands_total Commands processed per open connection.
+# TYPE siglent_connection_commands_total counter
+"""
+
+
+def serve(
+    port: int, render: Callable[[], str], ip_addr: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    """Serve render()'s text over HTTP on a background thread. Return the server."""
+    handler = _handler(render)
+    server = ThreadingHTTPServer((ip_addr, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    errlog.info("Serving metrics on port %d", server.server_address[1])
+    return server
+
+
+def _handler(render: Callable[[], str]) -> Type[BaseHTTPRequestHandler]:
+    """Return a request handler class that responds with render()'s text."""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Respond to every GET with the metrics."""
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            """Send the metrics."""
+            body = str.encode(HEADER + render())
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            """Do not log every scrape."""
+
+    return Handler
+
+
+errlog = logging.getLogger(__name__)
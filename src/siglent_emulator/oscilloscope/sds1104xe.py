@@ -0,0 +1,28 @@
+"""Emulate an SDS1104X-E Siglent oscilloscope."""
+
+import logging
+
+from siglent_emulator.oscilloscope import sds_common
+
+
+class SDS1104XEChannel(sds_common.SDSChannel):
+    """Emulate an oscilloscope input channel."""
+
+
+class SDS1104XE(sds_common.SDS):
+    """Emulate a Siglent oscilloscope."""
+
+    channel_class = SDS1104XEChannel
+    channel_count = 4
+
+    def identification(self, _: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        return "Siglent Technologies,SDS1104X-E,SDSMMEBD5R0456,8.2.6.1.37R9"
+
+
+def new() -> SDS1104XE:
+    """Return an instance of this device."""
+    return SDS1104XE()
+
+
+errlog = logging.getLogger(__name__)
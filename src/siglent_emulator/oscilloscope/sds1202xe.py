@@ -0,0 +1,27 @@
+"""Emulate an SDS1202X-E Siglent oscilloscope."""
+
+import logging
+
+from siglent_emulator.oscilloscope import sds_common
+
+
+class SDS1202XEChannel(sds_common.SDSChannel):
+    """Emulate an oscilloscope input channel."""
+
+
+class SDS1202XE(sds_common.SDS):
+    """Emulate a Siglent oscilloscope."""
+
+    channel_class = SDS1202XEChannel
+
+    def identification(self, _: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        return "Siglent Technologies,SDS1202X-E,SDSMMEBX5R0123,8.2.6.1.37R9"
+
+
+def new() -> SDS1202XE:
+    """Return an instance of this device."""
+    return SDS1202XE()
+
+
+errlog = logging.getLogger(__name__)
@@ -0,0 +1,423 @@
+"""Emulate commands common to all Siglent oscilloscopes.
+
+Command set is based on the SDS1000X-E Series Programming Guide:
+https://siglentna.com/wp-content/uploads/dlm_uploads/2022/01/SDS1000-SeriesSDS2000XSDS2000X-E_ProgrammingGuide_EN11C.pdf
+
+Waveforms are read with 'C1:WF? DAT2' as a definite-length block of signed
+8-bit codes, one per point. A code converts to volts as
+code * VDIV / 25 - OFST. The acquisition is kept in memory and sent from
+there without being copied, so reading millions of points costs the emulator
+next to no CPU.
+
+TODO:
+* Support WF? DESC, the binary waveform descriptor.
+* Support triggering.
+"""
+
+from abc import ABC, abstractmethod
+import logging
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Type, Union
+
+from siglent_emulator import framing
+from siglent_emulator.function_generator import util
+
+# pylint: disable=line-too-long
+
+# Horizontal divisions on the screen, an acquisition spans all of them
+DIVISIONS = 14
+
+# Codes per vertical division
+CODES_PER_DIVISION = 25
+
+channel_defaults: Dict[str, str] = {
+    "TRA": "ON",
+    "VDIV": "1",
+    "OFST": "0",
+    "CPL": "D1M",
+}
+
+device_defaults: Dict[str, str] = {
+    "CHDR": "SHORT",
+    "TDIV": "0.001",
+    "TRMD": "AUTO",
+}
+
+# A number, an optional SI prefix and an optional unit (e.g., '500MV')
+Engineering = re.compile(r"([-+]?[0-9.]+(?:E[-+]?[0-9]+)?)([MUN]?)[VS]?")
+prefixes: Dict[str, float] = {"": 1, "M": 1e-3, "U": 1e-6, "N": 1e-9}
+
+# Flat acquisitions by length, shared by every channel of every device
+_flat: Dict[int, memoryview] = {}
+_flat_lock = threading.Lock()
+
+
+def flat(length: int) -> memoryview:
+    """Return length zero codes (a disconnected input), read-only."""
+    with _flat_lock:
+        view = _flat.get(length)
+        if view is None:
+            view = _flat[length] = memoryview(bytes(length))
+        return view
+
+
+def disconnected(count: int, _sample_rate: float) -> memoryview:
+    """Return what an input with nothing connected acquires."""
+    return flat(count)
+
+
+def to_engineering(val: float, unit: str) -> str:
+    """Format a value the way the oscilloscope reports it (e.g., '1.00E-03S')."""
+    return f"{val:.2E}{unit}"
+
+
+def from_engineering(val: str) -> float:
+    """Parse a value sent with or without its unit (e.g., '1E-3S', '500MV')."""
+    match = Engineering.fullmatch(val.upper())
+    if match is None:
+        raise ValueError(f"Not a value: '{val}'")
+    return float(match.group(1)) * prefixes[match.group(2)]
+
+
+class SDSChannel(ABC):
+    """Emulate an SDS series oscilloscope input channel."""
+
+    cvals: Dict[str, str]
+    channel: int
+
+    # Command header -> name of the method that processes it. Derived classes
+    # register additional commands by extending this table, and take over an
+    # existing one by overriding its method.
+    commands: Dict[str, str] = {
+        "TRA": "trace",
+        "TRA?": "trace",
+        "VDIV": "volt_div",
+        "VDIV?": "volt_div",
+        "OFST": "offset",
+        "OFST?": "offset",
+        "CPL": "coupling",
+        "CPL?": "coupling",
+    }
+    handlers: Dict[str, Callable[[str], str]]
+    # What the input is connected to (see wiring.py): returns count codes
+    # taken at sample_rate, as acquire() does
+    source: Callable[[int, float], memoryview]
+
+    def __init__(self, channel: int) -> None:
+        self.channel = channel
+        self.cvals = channel_defaults.copy()
+        self.source = disconnected
+        self.prefix = f"C{channel}:"
+        self.handlers = {
+            header: getattr(self, name) for header, name in self.commands.items()
+        }
+
+    def trace(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "TRA?":
+            return f"C{self.channel}:TRA {self.cvals['TRA']}"
+        params = command.split(" ")
+        if len(params) != 2 or params[1] not in ["ON", "OFF"]:
+            return ""
+        self.cvals["TRA"] = params[1]
+        return ""
+
+    def volt_div(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "VDIV?":
+            return (
+                f"C{self.channel}:VDIV {to_engineering(float(self.cvals['VDIV']), 'V')}"
+            )
+        # Acquisitions are scaled by 1 / VDIV
+        return self.set_number("VDIV", command, positive=True)
+
+    def offset(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "OFST?":
+            return (
+                f"C{self.channel}:OFST {to_engineering(float(self.cvals['OFST']), 'V')}"
+            )
+        return self.set_number("OFST", command)
+
+    def coupling(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "CPL?":
+            return f"C{self.channel}:CPL {self.cvals['CPL']}"
+        params = command.split(" ")
+        if len(params) != 2 or params[1] not in ["A1M", "A50", "D1M", "D50", "GND"]:
+            return ""
+        self.cvals["CPL"] = params[1]
+        return ""
+
+    def set_number(self, key: str, command: str, positive: bool = False) -> str:
+        """Set a numeric setting from a command (e.g., 'VDIV 500MV')."""
+        params = command.split(" ")
+        if len(params) != 2:
+            errlog.error("Unknown command format: '%s'", command)
+            return ""
+        try:
+            value = from_engineering(params[1])
+        except ValueError:
+            errlog.error("Invalid value for '%s' in command '%s'", key, command)
+            return ""
+        if positive and value <= 0:
+            errlog.error("Invalid value for '%s' in command '%s'", key, command)
+            return ""
+        self.cvals[key] = util.float_to_str(value)
+        return ""
+
+    def acquire(self, count: int, sample_rate: float) -> memoryview:
+        """Return the last acquisition: count codes, one byte each, read-only."""
+        return self.source(count, sample_rate)
+
+    def reset(self) -> None:
+        """Reset the channel to defaults."""
+        self.cvals = channel_defaults.copy()
+
+    def dispatch(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        parsed = util.parse_command(command)
+        if parsed.channel != self.prefix:
+            return ""
+
+        handler = self.handlers.get(parsed.header)
+        if handler is None:
+            return ""
+        return handler(parsed.body)
+
+
+class SDS(ABC):
+    """Emulate a Siglent SDS series oscilloscope.
+
+    Models differ in their channel count, memory depths and sample rate.
+    This base class implements all common functionality.
+    """
+
+    channel_class: Type[SDSChannel]
+    channel_count: int = 2
+    channels: List[SDSChannel]
+    dvals: Dict[str, str]
+    # Memory depths (MSIZ) the model supports, by name, in points
+    memory_depths: Dict[str, int] = {
+        "7K": 7_000,
+        "70K": 70_000,
+        "700K": 700_000,
+        "7M": 7_000_000,
+        "14M": 14_000_000,
+    }
+    memory_depth: str = "14M"
+    # Highest sample rate, in samples per second
+    max_sample_rate: float = 1e9
+
+    # Command header -> name of the method that processes it. Derived classes
+    # register additional commands by extending this table, and take over an
+    # existing one by overriding its method.
+    commands: Dict[str, str] = {
+        "*IDN?": "identification",
+        "*OPC?": "operation_complete",
+        "*RST": "reset",
+        "CHDR": "comm_header",
+        "CHDR?": "comm_header",
+        "TDIV": "time_div",
+        "TDIV?": "time_div",
+        "TRMD": "trig_mode",
+        "TRMD?": "trig_mode",
+        "MSIZ": "memory_size",
+        "MSIZ?": "memory_size",
+        "SARA?": "sample_rate",
+        "SANU?": "sample_number",
+        "WFSU": "waveform_setup",
+        "WFSU?": "waveform_setup",
+    }
+    handlers: Dict[str, Callable[[str], str]]
+    channel_prefixes: Dict[str, SDSChannel]
+
+    # As commands, for commands that return a binary block
+    block_commands: Dict[str, str] = {
+        "WF?": "waveform",
+    }
+    block_handlers: Dict[str, Callable[[str], Union[str, framing.Block]]]
+    # Sparsing, number of points and first point set by WFSU
+    setup: Tuple[int, int, int]
+
+    def __init__(self) -> None:
+        # All state is per instance so many devices can share one process
+        self.dvals = device_defaults.copy()
+        self.dvals["MSIZ"] = self.memory_depth
+        self.setup = (0, 0, 0)
+        self.channels = [
+            self.channel_class(channel=i + 1) for i in range(self.channel_count)
+        ]
+        self.handlers = {
+            header: getattr(self, name) for header, name in self.commands.items()
+        }
+        self.channel_prefixes = {channel.prefix: channel for channel in self.channels}
+        self.block_handlers = {
+            header: getattr(self, name) for header, name in self.block_commands.items()
+        }
+
+    @abstractmethod
+    def identification(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+
+    def operation_complete(self, _: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        return "*OPC 1"
+
+    def reset(self, _: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        self.dvals = device_defaults.copy()
+        self.dvals["MSIZ"] = self.memory_depth
+        self.setup = (0, 0, 0)
+        for channel in self.channels:
+            channel.reset()
+        return ""
+
+    def comm_header(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "CHDR?":
+            return f"CHDR {self.dvals['CHDR']}"
+        params = command.split(" ")
+        if len(params) != 2 or params[1] not in ["SHORT", "LONG", "OFF"]:
+            return ""
+        self.dvals["CHDR"] = params[1]
+        return ""
+
+    def time_div(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "TDIV?":
+            return f"TDIV {to_engineering(float(self.dvals['TDIV']), 'S')}"
+        params = command.split(" ")
+        if len(params) != 2:
+            return ""
+        try:
+            tdiv = from_engineering(params[1])
+        except ValueError:
+            errlog.error("Invalid value in command '%s'", command)
+            return ""
+        if tdiv <= 0:
+            return ""
+        self.dvals["TDIV"] = util.float_to_str(tdiv)
+        return ""
+
+    def trig_mode(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "TRMD?":
+            return f"TRMD {self.dvals['TRMD']}"
+        params = command.split(" ")
+        if len(params) != 2 or params[1] not in ["AUTO", "NORM", "SINGLE", "STOP"]:
+            return ""
+        self.dvals["TRMD"] = params[1]
+        return ""
+
+    def memory_size(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "MSIZ?":
+            return f"MSIZ {self.dvals['MSIZ']}"
+        params = command.split(" ")
+        if len(params) != 2 or params[1] not in self.memory_depths:
+            return ""
+        self.dvals["MSIZ"] = params[1]
+        return ""
+
+    def acquisition(self) -> Tuple[int, float]:
+        """Return the points in an acquisition and the sample rate they are taken at."""
+        span = float(self.dvals["TDIV"]) * DIVISIONS
+        points = min(
+            self.memory_depths[self.dvals["MSIZ"]],
+            int(self.max_sample_rate * span),
+        )
+        return max(points, 1), max(points, 1) / span
+
+    def sample_rate(self, _: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        return f"SARA {to_engineering(self.acquisition()[1], 'Sa/s')}"
+
+    def sample_number(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        # Command is of the form 'SANU? C1'
+        params = util.parse_command(command).params
+        if len(params) != 1 or f"{params[0]}:" not in self.channel_prefixes:
+            return ""
+        return f"SANU {to_engineering(self.acquisition()[0], '')}"
+
+    def waveform_setup(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        if command == "WFSU?":
+            sparsing, points, first = self.setup
+            return f"WFSU SP,{sparsing},NP,{points},FP,{first}"
+        # Command is of the form 'WFSU SP,4,NP,1000,FP,0'
+        params = util.parse_command(command).params
+        settings = dict(zip(params[0::2], params[1::2]))
+        sparsing, points, first = self.setup
+        try:
+            sparsing = int(settings.get("SP", sparsing))
+            points = int(settings.get("NP", points))
+            first = int(settings.get("FP", first))
+        except ValueError:
+            errlog.error("Invalid value in command '%s'", command)
+            return ""
+        if min(sparsing, points, first) < 0:
+            return ""
+        self.setup = (sparsing, points, first)
+        return ""
+
+    def waveform(self, command: str) -> Union[str, framing.Block]:
+        """Process the command, update state, optionally return a result."""
+        # Command is of the form 'C1:WF? DAT2'
+        parsed = util.parse_command(command)
+        channel = self.channel_prefixes.get(parsed.channel)
+        if channel is None or parsed.params != ("DAT2",):
+            errlog.error("Unsupported waveform query '%s'", command)
+            return ""
+        if channel.cvals["TRA"] != "ON":
+            return ""
+        data = channel.acquire(*self.acquisition())
+        sparsing, points, first = self.setup
+        data = data[first:]
+        if sparsing > 1:
+            # Every n-th point is not contiguous in memory, only this copies
+            data = memoryview(data[::sparsing].tobytes())
+        if points > 0:
+            data = data[:points]
+        text = util.format_verbs(f"C{channel.channel}:WF DAT2,", self.dvals["CHDR"])
+        return framing.Block(str.encode(text), data)
+
+    def dispatch(self, command: str) -> str:
+        """Process the command, update state, optionally return a result."""
+        parsed = util.parse_command(command)
+
+        # Is this a device command?
+        if parsed.channel == "":
+            handler = self.handlers.get(parsed.header)
+            if handler is not None:
+                return handler(parsed.command)
+            return ""
+
+        # Is this is a channel command?
+        channel = self.channel_prefixes.get(parsed.channel)
+        if channel is not None:
+            return channel.dispatch(command=parsed.command)
+
+        # This was not a valid command
+        return ""
+
+    def process(
+        self, command: str, data: Optional[memoryview] = None
+    ) -> Union[str, framing.Block]:
+        """Normalize the command to the short version as it comes in and to the CHDR-specified format as it goes out.
+
+        Commands that return a binary block return a framing.Block.
+        """
+        if data is not None:
+            errlog.error("Unexpected binary block in command '%s'", command)
+            return ""
+        parsed = util.parse_command(command)
+        block_handler = self.block_handlers.get(parsed.header)
+        if block_handler is not None:
+            return block_handler(parsed.command)
+        return util.format_verbs(self.dispatch(parsed.command), self.dvals["CHDR"])
+
+
+errlog = logging.getLogger(__name__)
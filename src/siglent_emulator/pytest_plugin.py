@@ -0,0 +1,69 @@
+"""pytest fixtures that emulate a device for each test, on a free port.
+
+Installing siglent_emulator registers this plugin with pytest. A test asks for
+the emulated_device fixture and gets the host and port of a device that is
+already listening. The device is removed when the test ends, along with any
+connections to it.
+
+    def test_amplitude(emulated_device):
+        device = siglent_device.Amplitude()
+        device.connect(ip_addr=emulated_device.host, port=emulated_device.port)
+
+The device is an SDG1032X unless the test is marked otherwise:
+
+    @pytest.mark.siglent_device("SDS1202XE")
+
+All devices of a session are served by one Farm. The operating system picks
+their ports, so parallel sessions (pytest-xdist workers) never collide.
+"""
+
+import logging
+from typing import Iterator, NamedTuple
+
+import pytest
+
+from siglent_emulator import emulator
+from siglent_emulator import farm
+
+# The device emulated unless a test is marked with another
+DEFAULT_DEVICE = "SDG1032X"
+
+
+class EmulatedDevice(NamedTuple):
+    """Where an emulated device is listening, and the emulator itself."""
+
+    host: str
+    port: int
+    emulator: emulator.Emulator
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    """Register the marker."""
+    config.addinivalue_line(
+        "markers",
+        f"siglent_device(name): the device emulated_device emulates ({DEFAULT_DEVICE})",
+    )
+
+
+@pytest.fixture(scope="session")
+def emulator_farm() -> Iterator[farm.Farm]:
+    """Serve the emulated devices of the session."""
+    bench = farm.Farm()
+    yield bench
+    bench.close()
+
+
+@pytest.fixture
+def emulated_device(
+    request: pytest.FixtureRequest, emulator_farm: farm.Farm
+) -> Iterator[EmulatedDevice]:
+    """Emulate a device for the test, listening on a free port."""
+    # pylint: disable=redefined-outer-name
+    marker = request.node.get_closest_marker("siglent_device")
+    device = marker.args[0] if marker is not None else DEFAULT_DEVICE
+    port = emulator_farm.add(device=device)
+    yield EmulatedDevice(emulator_farm.ip_addr, port, emulator_farm[port])
+    emulator_farm.remove(port)
+
+
+errlog = logging.getLogger(__name__)
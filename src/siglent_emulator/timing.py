@@ -0,0 +1,145 @@
+"""Take as long over commands as the instruments do.
+
+The emulator answers as fast as it can, where an instrument takes milliseconds
+per command and far longer to settle after *RST. A Profile gives how long a
+model takes over each command. When an Emulator has a profile
+(Emulator.timing), it keeps a Timeline for the instrument, and every command
+is processed, and its response sent, when the instrument would be done with
+it:
+
+* Commands are worked through one at a time, whichever connection they came
+  from, so *RST on one connection delays the commands on every other. A
+  command starts once it has arrived and the command before it is done.
+* Each command takes its service time, plus up to jitter seconds at random.
+* Only input_buffer bytes of commands are read ahead of the one being
+  processed. The connection is not read from beyond that, so once the
+  operating system's buffers fill up the client's sends block, as they do
+  against an instrument that is busy.
+
+Waiting for the instrument never holds up serving other connections or
+devices: the thread engine waits on the connection's own thread, the asyncio
+engine sets a timer.
+
+The figures in PROFILES are typical of these instruments on a LAN, rough
+guesses rather than measurements. Measure your own instrument (the verifier
+reports its query latency) and make a Profile from them.
+"""
+
+import logging
+import random
+import threading
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Union
+
+from siglent_emulator import framing
+from siglent_emulator.function_generator import util
+
+
+class Profile(NamedTuple):
+    """How long a model takes over commands, in seconds."""
+
+    # Time to process a query, or any other command, not listed in service
+    query: float = 0.0
+    command: float = 0.0
+    # Time to process particular commands, including any time to settle
+    # afterwards. Keyed by header (e.g., '*RST'), or by header and first
+    # parameter (e.g., 'OUTP LOAD'), which is looked up first.
+    service: Mapping[str, float] = MappingProxyType({})
+    # Up to this much more, at random, for each command
+    jitter: float = 0.0
+    # Bytes of commands read ahead of the one being processed, 0 for no limit
+    input_buffer: int = 0
+
+    def service_time(self, parsed: util.ParsedCommand) -> float:
+        """Return the time the parsed command takes, without jitter."""
+        if parsed.params:
+            seconds = self.service.get(f"{parsed.header} {parsed.params[0]}")
+            if seconds is not None:
+                return seconds
+        seconds = self.service.get(parsed.header)
+        if seconds is not None:
+            return seconds
+        if parsed.header.endswith("?"):
+            return self.query
+        return self.command
+
+
+_SDG = Profile(
+    query=0.004,
+    command=0.002,
+    service=MappingProxyType(
+        {
+            "*RST": 1.0,
+            # Output relays
+            "OUTP": 0.02,
+            "OUTP LOAD": 0.05,
+            "PACP": 0.01,
+            "ARWV": 0.02,
+            "WVDT": 0.2,
+        }
+    ),
+    jitter=0.001,
+    input_buffer=4096,
+)
+
+_SDS = Profile(
+    query=0.005,
+    command=0.005,
+    service=MappingProxyType(
+        {
+            "*RST": 2.0,
+            # Acquisition settings restart the acquisition
+            "TDIV": 0.05,
+            "MSIZ": 0.05,
+            "WF?": 0.05,
+        }
+    ),
+    jitter=0.002,
+    input_buffer=4096,
+)
+
+# Model (as emulator.EMULATORS names them) -> its profile
+PROFILES: Mapping[str, Profile] = MappingProxyType(
+    {
+        "sdg1032x": _SDG,
+        "sdg1062x": _SDG,
+        "sds1104xe": _SDS,
+        "sds1202xe": _SDS,
+    }
+)
+
+
+def size(line: Union[bytes, framing.Block]) -> int:
+    """Return how many bytes of the instrument's input buffer a line takes."""
+    if isinstance(line, framing.Block):
+        return len(line.text) + len(line.data)
+    return len(line)
+
+
+class Timeline:  # pylint: disable=too-few-public-methods
+    """When the instrument is done with each command, from any connection."""
+
+    profile: Profile
+    # When the last command scheduled is done
+    busy_until: float
+
+    def __init__(self, profile: Profile, seed: Optional[int] = None) -> None:
+        self.profile = profile
+        self.busy_until = 0.0
+        self.random = random.Random(seed)
+        # Connections on the thread engine schedule from their own threads
+        self.lock = threading.Lock()
+
+    def schedule(self, line: Union[bytes, framing.Block], now: float) -> float:
+        """Return when a command line that arrived at now is done."""
+        text = line.text if isinstance(line, framing.Block) else line
+        parsed = util.parse_command(text.decode("utf-8").strip().upper())
+        seconds = self.profile.service_time(parsed)
+        with self.lock:
+            if self.profile.jitter:
+                seconds += self.random.uniform(0.0, self.profile.jitter)
+            self.busy_until = max(now, self.busy_until) + seconds
+            return self.busy_until
+
+
+errlog = logging.getLogger(__name__)
@@ -0,0 +1,115 @@
+"""Cable function generator outputs to oscilloscope inputs in one process.
+
+A cabled scope channel captures the signal the generator channel is set up to
+produce at the moment the waveform is read, rather than a disconnected input.
+Nothing goes through a socket: the signal is rendered (see
+function_generator/waveform.py) straight into a new acquisition buffer, in
+chunks so a full-depth acquisition never needs more than one chunk of
+floating-point samples. Acquisitions start at the trigger point (phase 0), so
+one rendered from unchanged settings is the same as the last and is sent
+again without re-rendering. NOISE is rendered afresh for every acquisition.
+
+What the scope sees follows both ends of the cable:
+
+* OUTP OFF: 0 V.
+* LOAD: the generator reports AMP into the load it was told about. The open
+  circuit voltage is twice that with LOAD 50. A 50 ohm input (CPL D50 or
+  A50) sees half the open circuit voltage.
+* PLRT INVT: the signal is inverted.
+* CPL A1M or A50 drops the DC offset, CPL GND reads 0 V.
+"""
+
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from siglent_emulator.function_generator import waveform
+from siglent_emulator.function_generator.sdg_common import SDGChannel
+from siglent_emulator.oscilloscope import sds_common
+from siglent_emulator.oscilloscope.sds_common import SDSChannel
+
+# Points rendered at a time into an acquisition buffer
+CHUNK_SIZE = 1 << 18
+
+# Input couplings and the fraction of the open circuit voltage they see
+INPUT_SCALE = {"D1M": 1.0, "A1M": 1.0, "D50": 0.5, "A50": 0.5}
+
+
+class Cable:
+    """Carry the signal of one generator channel to one scope channel."""
+
+    generator: SDGChannel
+    scope: SDSChannel
+    # The settings the last acquisition was rendered from, and the acquisition
+    key: Optional[Tuple[object, ...]]
+    acquisition: memoryview
+
+    def __init__(self, generator: SDGChannel, scope: SDSChannel) -> None:
+        self.generator = generator
+        self.scope = scope
+        self.key = None
+        self.acquisition = memoryview(b"")
+        self.signal = waveform.Generator(generator)
+        scope.source = self.acquire
+
+    def unplug(self) -> None:
+        """Disconnect the scope input."""
+        if getattr(self.scope.source, "__self__", None) is self:
+            self.scope.source = sds_common.disconnected
+
+    def acquire(self, count: int, sample_rate: float) -> memoryview:
+        """Return count codes of the signal taken at sample_rate, read-only."""
+        gen = self.generator.cvals
+        scope = self.scope.cvals
+        key: Tuple[object, ...] = (
+            gen.output,
+            gen.wvtp,
+            gen.frq,
+            gen.amp,
+            gen.ofst,
+            gen.phse,
+        )
+        key += (gen.load, gen.plrt, scope["VDIV"], scope["OFST"], scope["CPL"])
+        key += (count, sample_rate)
+        if key == self.key and gen.wvtp != "NOISE":
+            return self.acquisition
+
+        scale = INPUT_SCALE.get(scope["CPL"], 0.0)
+        if gen.output != "ON" or gen.wvtp not in waveform.WAVEFORMS:
+            scale = 0.0
+        if gen.load == "50":
+            scale *= 2
+        if gen.plrt == "INVT":
+            scale = -scale
+        # Volts to codes
+        gain = scale * sds_common.CODES_PER_DIVISION / float(scope["VDIV"])
+        shift = (
+            sds_common.CODES_PER_DIVISION * float(scope["OFST"]) / float(scope["VDIV"])
+        )
+        if scope["CPL"] in ["A1M", "A50"]:
+            # Blocking the DC component removes the generator's offset
+            shift -= gain * gen.ofst
+
+        codes = np.empty(count, dtype=np.int8)
+        if gain == 0:
+            codes.fill(np.clip(round(shift), -128, 127))
+        else:
+            self.signal.sample_rate = sample_rate
+            # The scope triggers at the start of the period
+            self.signal.phase = 0.0
+            for start in range(0, count, CHUNK_SIZE):
+                chunk = self.signal.render(min(CHUNK_SIZE, count - start))
+                chunk *= gain
+                chunk += shift
+                np.rint(chunk, out=chunk)
+                np.clip(chunk, -128, 127, out=chunk)
+                codes[start : start + len(chunk)] = chunk
+        codes.flags.writeable = False
+        # The buffer is never written again, responses still being sent from
+        # an earlier acquisition are left untouched
+        self.key, self.acquisition = key, codes.data.cast("B")
+        return self.acquisition
+
+
+errlog = logging.getLogger(__name__)
@@ -1,12 +1,20 @@
 """Verify Siglent function generator emulator responses are identical to the hardware."""
 
+import argparse
+import collections
+import concurrent.futures
+import gzip
+import json
 import logging
 import socket
 import sys
 import time
-from typing import List, Tuple
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Tuple
 
 import siglent_emulator.emulator
+from siglent_emulator import farm
+from siglent_emulator import framing
+from siglent_emulator import metrics
 
 # pylint: disable=broad-except
 
@@ -59,6 +67,19 @@ states: List[str] = [
 ]
 
 
+# Queries sent to a target before waiting for the oldest one's response
+PIPELINE_DEPTH = 32
+
+# Seconds to wait for a response before giving up on a target
+TIMEOUT = 10.0
+
+# Bump when the transcript file format changes
+TRANSCRIPT_VERSION = 1
+
+# A command and the state queries whose responses must match after it
+Test = Tuple[str, List[str]]
+
+
 def open_socket(ip_addr: str, port: int) -> socket.socket:
     """Open a socket on localhost."""
     print("Waiting for connection...")
@@ -66,7 +87,10 @@ def open_socket(ip_addr: str, port: int) -> socket.socket:
     connected: bool = False
     while not connected:
         try:
-            connection = socket.create_connection((ip_addr, port))
+            connection = socket.create_connection((ip_addr, port), timeout=TIMEOUT)
+            # Send each batch of commands right away rather than coalescing
+            # it with the next one while waiting for an acknowledgement
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             connected = True
         except socket.error as err:
             print(str(err))
@@ -84,35 +108,168 @@ def filter_response(response: str) -> str:
     return response
 
 
-def send_command(sock: socket.socket, command: str) -> str:
-    """Send a command and return the response (if any)."""
-    tokens = command.split(" ")
-    query = tokens[0].endswith("?")
+def is_query(command: str) -> bool:
+    """Does the device respond to this command?"""
+    return command.split(" ")[0].endswith("?")
+
+
+class Target:
+    """A device under test: its connection and how long it takes to respond."""
+
+    name: str
+    sock: socket.socket
+    # Time from sending each query to receiving its response
+    latency: metrics.Histogram
+    # Seconds spent running scripts
+    wall: float
+
+    def __init__(self, name: str, sock: socket.socket) -> None:
+        self.name = name
+        self.sock = sock
+        self.latency = metrics.Histogram()
+        self.wall = 0.0
+        # Received bytes not yet split into responses
+        self.buffer = bytearray()
+
+    def send_command(self, command: str) -> str:
+        """Send a command and return the response (if any)."""
+        return self.run([command], depth=1)[0]
+
+    def run(self, script: List[str], depth: int = PIPELINE_DEPTH) -> List[str]:
+        """Send every command, return the responses in order.
+
+        Up to depth queries are in flight at once. Commands are sent in
+        batches, a batch goes out when a response has to be waited for.
+        """
+        began = time.perf_counter()
+        responses: List[str] = []
+        # Index in responses and send time of each query in flight
+        pending: Deque[Tuple[int, float]] = collections.deque()
+        # Commands not sent yet, and the indexes of the queries among them
+        batch: List[bytes] = []
+        unsent: List[int] = []
+        for command in script:
+            if is_query(command) and len(pending) + len(unsent) >= depth:
+                self.send(batch, unsent, pending)
+                self.receive(responses, pending)
+            batch.append(str.encode(command + "\n"))
+            if is_query(command):
+                unsent.append(len(responses))
+                responses.append("")
+            else:
+                responses.append("No response expected")
+        self.send(batch, unsent, pending)
+        while pending:
+            self.receive(responses, pending)
+        self.wall += time.perf_counter() - began
+        return responses
+
+    def send(
+        self, batch: List[bytes], unsent: List[int], pending: Deque[Tuple[int, float]]
+    ) -> None:
+        """Send the batched commands, the queries among them are then in flight."""
+        if batch:
+            self.sock.sendall(b"".join(batch))
+        sent = time.perf_counter()
+        pending.extend((index, sent) for index in unsent)
+        batch.clear()
+        unsent.clear()
+
+    def receive(self, responses: List[str], pending: Deque[Tuple[int, float]]) -> None:
+        """Wait for the response to the oldest query in flight."""
+        end = self.buffer.find(b"\n")
+        while end < 0:
+            data = self.sock.recv(65536)
+            if data == b"":
+                raise ConnectionError(f"{self.name} closed the connection")
+            self.buffer += data
+            end = self.buffer.find(b"\n")
+        index, sent = pending.popleft()
+        self.latency.observe(time.perf_counter() - sent)
+        # Line endings are kept, they are compared too
+        responses[index] = filter_response(self.buffer[: end + 1].decode("utf-8"))
+        del self.buffer[: end + 1]
+
+    def report(self) -> None:
+        """Log the wall time and query latency so far."""
+        summary = self.latency.summary()
+        errlog.info(
+            "%s: %d queries in %.2fs, latency mean %.2fms p50 <%.2fms p99 <%.2fms",
+            self.name,
+            summary["count"],
+            self.wall,
+            summary["mean"] * 1e3,
+            summary["p50"] * 1e3,
+            summary["p99"] * 1e3,
+        )
 
-    command += "\n"
-    sock.send(str.encode(command))
 
-    # If this is a query wait for a response
-    if query:
-        response = ""
-        while not response.endswith("\n"):
-            response += sock.recv(2048).decode("utf-8")
-        response = filter_response(response)
-        return response
+def reset_state(target: Target) -> None:
+    """Reset the device to a known state so we can compare state in each test."""
+    target.run(state_defaults)
 
-    return "No response expected"
 
+def run_test(emulator: Target, hardware: Target, cmd: str) -> bool:
+    """Run a single test. Verify system states match."""
+    return run_suite(emulator=emulator, hardware=hardware, tests=[(cmd, [])])[1] == 0
 
-def reset_state(sock: socket.socket) -> None:
-    """Reset the device to a known state so we can compare state in each test."""
-    for default in state_defaults:
-        send_command(sock=sock, command=default)
 
+def run_suite(
+    emulator: Target,
+    hardware: Target,
+    tests: List[Test],
+    depth: int = PIPELINE_DEPTH,
+) -> Tuple[int, int]:
+    """Run tests on both targets at once. Return the attempts and failures.
 
-def run_test(emulator: socket.socket, hardware: socket.socket, cmd: str) -> bool:
-    """Run a single test. Verify system states match."""
-    emulator_response = send_command(sock=emulator, command=cmd)
-    hardware_response = send_command(sock=hardware, command=cmd)
+    Each target is sent the whole suite, pipelined, on its own thread. The
+    responses are compared afterwards, see check().
+    """
+    script = flatten(tests)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            running = [pool.submit(t.run, script, depth) for t in (emulator, hardware)]
+            emulator_responses, hardware_responses = [r.result() for r in running]
+    except Exception as err:
+        errlog.error("Caught excpetion. Aborting tests.")
+        errlog.exception(err)
+        return 0, 1
+    return check(tests, emulator_responses, hardware_responses)
+
+
+def flatten(tests: List[Test]) -> List[str]:
+    """Return the commands of the tests in the order they are sent."""
+    return [command for cmd, checks in tests for command in [cmd, *checks]]
+
+
+def check(
+    tests: List[Test], emulator_responses: List[str], hardware_responses: List[str]
+) -> Tuple[int, int]:
+    """Compare the responses to flatten(tests). Return the attempts and failures.
+
+    Comparing stops at the first state mismatch, as the states diverge from
+    there on.
+    """
+    attempts: int = 0
+    failures: int = 0
+    responses = iter(zip(flatten(tests), emulator_responses, hardware_responses))
+    for cmd, checks in tests:
+        attempts += 1
+        print(f"Testing: '{cmd}'")
+        if not compare(*next(responses)):
+            failures += 1
+        # Compare internal states
+        for _ in checks:
+            if not compare(*next(responses)):
+                failures += 1
+                errlog.error("State mismatch after '%s'! Aborting tests.", cmd)
+                return attempts, failures
+
+    return attempts, failures
+
+
+def compare(cmd: str, emulator_response: str, hardware_response: str) -> bool:
+    """Log a mismatch between the emulator's and the hardware's response."""
     if emulator_response != hardware_response:
         errlog.error(
             "Response mismatch for '%s'\n  emulator: '%s'\n  hardware: '%s'",
@@ -125,102 +282,195 @@ def run_test(emulator: socket.socket, hardware: socket.socket, cmd: str) -> bool
     return True
 
 
-def run_tests(emulator: socket.socket, hardware: socket.socket) -> Tuple[int, int]:
-    """Run all tests."""
-    attempts: int = 0
-    failures: int = 0
+def command_tests() -> List[Test]:
+    """Return every command, each followed by a check of the whole state."""
+    return [(cmd, states) for cmd in commands]
 
-    try:
-        for cmd in commands:
-            attempts += 1
-            print(f"Testing: '{cmd}'")
-            success = run_test(emulator=emulator, hardware=hardware, cmd=cmd)
-            if not success:
-                failures += 1
-            # Compare internal states
-            for state in states:
-                match = run_test(emulator=emulator, hardware=hardware, cmd=state)
-                if not match:
-                    failures += 1
-                    errlog.error("State mismatch after '%s'! Aborting tests.", cmd)
-                    return attempts, failures
-    except Exception as err:
-        errlog.error("Caught excpetion. Aborting tests.")
-        errlog.exception(err)
-        failures += 1
 
-    return attempts, failures
+def frq_tests() -> List[Test]:
+    """Return rounding tests on FRQ values."""
+    known_failures = [202, 223, 438, 743]
+
+    return [
+        (f"C1:BSWV FRQ,{val}", ["C1:BSWV?"])
+        for val in range(0, 1000, 1)
+        if val not in known_failures
+    ]
+
+
+def amp_tests() -> List[Test]:
+    """Return rounding tests on AMP values."""
+    return [
+        (f"C1:BSWV AMP,{val}.{frac}", ["C1:BSWV?"])
+        for val in range(0, 22)
+        for frac in range(0, 10)
+    ]
+
+
+# Suite name -> its tests, in the order they are run. Each suite starts in
+# the state the one before it left the device in.
+suites: Dict[str, Callable[[], List[Test]]] = {
+    "rounding_tests_amp": amp_tests,
+    "rounding_tests_frq": frq_tests,
+    "run_tests": command_tests,
+}
+
+
+def run_tests(
+    emulator: Target, hardware: Target, depth: int = PIPELINE_DEPTH
+) -> Tuple[int, int]:
+    """Run all tests."""
+    return run_suite(emulator, hardware, command_tests(), depth)
 
 
 def rounding_tests_frq(
-    emulator: socket.socket, hardware: socket.socket
+    emulator: Target, hardware: Target, depth: int = PIPELINE_DEPTH
 ) -> Tuple[int, int]:
     """Run rounding tests on FRQ values."""
-    attempts: int = 0
-    failures: int = 0
+    return run_suite(emulator, hardware, frq_tests(), depth)
 
-    known_failures = [202, 223, 438, 743]
 
-    try:
-        for val in range(0, 1000, 1):
-            if val in known_failures:
-                continue
-            cmd = f"C1:BSWV FRQ,{val}"
-            attempts += 1
-            print(f"Testing: '{cmd}'")
-            success = run_test(emulator=emulator, hardware=hardware, cmd=cmd)
-            if not success:
-                failures += 1
-            # Compare internal states
-            state = "C1:BSWV?"
-            match = run_test(emulator=emulator, hardware=hardware, cmd=state)
-            if not match:
-                failures += 1
-                errlog.error("State mismatch after '%s'! Aborting tests.", cmd)
-                return attempts, failures
-    except Exception as err:
-        errlog.error("Caught excpetion. Aborting tests.")
-        errlog.exception(err)
-        failures += 1
+def rounding_tests_amp(
+    emulator: Target, hardware: Target, depth: int = PIPELINE_DEPTH
+) -> Tuple[int, int]:
+    """Run rounding tests on AMP values."""
+    return run_suite(emulator, hardware, amp_tests(), depth)
 
-    return attempts, failures
 
+def verify(hardware: Target, depth: int = PIPELINE_DEPTH) -> Tuple[int, int]:
+    """Check an emulator against live hardware. Return the attempts and failures."""
+    # Any free port, the farm is listening on it once add() returns
+    bench = farm.Farm()
+    emulator_port = bench.add(device="SDG1032X")
+    emulator = Target("emulator", open_socket(ip_addr="127.0.0.1", port=emulator_port))
+
+    # In case the emulator or hardware is not at default state, reset it.
+    reset_state(target=emulator)
+    reset_state(target=hardware)
 
-def rounding_tests_amp(
-    emulator: socket.socket, hardware: socket.socket
-) -> Tuple[int, int]:
-    """Run rounding tests on FRQ values."""
     attempts: int = 0
     failures: int = 0
-
-    try:
-        for val in range(0, 22):
-            for frac in range(0, 10):
-                cmd = f"C1:BSWV AMP,{val}.{frac}"
-                attempts += 1
-                print(f"Testing: '{cmd}'")
-                success = run_test(emulator=emulator, hardware=hardware, cmd=cmd)
-                if not success:
-                    failures += 1
-                # Compare internal states
-                state = "C1:BSWV?"
-                match = run_test(emulator=emulator, hardware=hardware, cmd=state)
-                if not match:
-                    failures += 1
-                    errlog.error("State mismatch after '%s'! Aborting tests.", cmd)
-                    return attempts, failures
-    except Exception as err:
-        errlog.error("Caught excpetion. Aborting tests.")
-        errlog.exception(err)
-        failures += 1
-
+    for suite in suites.values():
+        suite_attempts, suite_failures = run_suite(emulator, hardware, suite(), depth)
+        attempts += suite_attempts
+        failures += suite_failures
+
+    emulator.report()
+    hardware.report()
+    bench.close()
     return attempts, failures
 
 
-def usage() -> None:
-    """Print usage message and exit with error."""
-    errlog.error("Usage: %s hw_ip, hw_port", sys.argv[0])
-    sys.exit(1)
+class Transcript(NamedTuple):
+    """The responses of a device to every suite, as recorded."""
+
+    # The device's response to *IDN?
+    identification: str
+    # Suite name -> its tests and the responses to flatten(tests), in the
+    # order the suites were run
+    suites: Dict[str, Tuple[List[Test], List[str]]]
+
+
+def record(hardware: Target, depth: int = PIPELINE_DEPTH) -> Transcript:
+    """Run every suite on the hardware and return its responses."""
+    reset_state(target=hardware)
+    identification = hardware.send_command("*IDN?")
+    recorded: Dict[str, Tuple[List[Test], List[str]]] = {}
+    for name, suite in suites.items():
+        tests = suite()
+        recorded[name] = (tests, hardware.run(flatten(tests), depth))
+    return Transcript(identification=identification, suites=recorded)
+
+
+def save_transcript(path: str, transcript: Transcript) -> None:
+    """Write a transcript as gzipped JSON.
+
+    Every distinct command and response is stored once, in a string table
+    that the suites refer to by index. Suites are looked up by name.
+    """
+    strings: Dict[str, int] = {}
+
+    def index(string: str) -> int:
+        """Return the index of a string in the table, adding it if new."""
+        return strings.setdefault(string, len(strings))
+
+    body: Dict[str, Any] = {
+        "version": TRANSCRIPT_VERSION,
+        "identification": transcript.identification,
+        "suites": {
+            name: {
+                "tests": [
+                    [index(cmd), [index(c) for c in checks]] for cmd, checks in tests
+                ],
+                "responses": [index(response) for response in responses],
+            }
+            for name, (tests, responses) in transcript.suites.items()
+        },
+    }
+    body["strings"] = list(strings)
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        json.dump(body, file, separators=(",", ":"))
+
+
+def load_transcript(path: str) -> Transcript:
+    """Read a transcript written by save_transcript()."""
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        body = json.load(file)
+    if body.get("version") != TRANSCRIPT_VERSION:
+        raise ValueError(f"Unsupported transcript version in '{path}'")
+    strings: List[str] = body["strings"]
+    recorded: Dict[str, Tuple[List[Test], List[str]]] = {}
+    for name, suite in body["suites"].items():
+        tests: List[Test] = [
+            (strings[cmd], [strings[check] for check in checks])
+            for cmd, checks in suite["tests"]
+        ]
+        recorded[name] = (tests, [strings[i] for i in suite["responses"]])
+    return Transcript(identification=body["identification"], suites=recorded)
+
+
+def emulate(emulator: siglent_emulator.emulator.Emulator, command: str) -> str:
+    """Process a command on an in-process emulator, respond as a Target does."""
+    response = emulator.respond(str.encode(command))
+    if not is_query(command):
+        return "No response expected"
+    if isinstance(response, framing.Block):
+        response = response.text
+    return filter_response(response.decode("utf-8"))
+
+
+def emulated_model(identification: str) -> str:
+    """Return the emulator (see emulator.EMULATORS) for the model in an *IDN? response.
+
+    Raise ValueError if the model is not emulated.
+    """
+    # e.g., 'Siglent Technologies,SDS1104X-E,SDSMMEBD5R0456,8.2.6.1.37R9'
+    fields = identification.split(",")
+    model = fields[1].strip().replace("-", "").lower() if len(fields) > 1 else ""
+    if model not in siglent_emulator.emulator.EMULATORS:
+        raise ValueError(f"No emulator for the device that answered '{identification}'")
+    return model
+
+
+def replay(transcript: Transcript) -> Tuple[int, int]:
+    """Check an in-process emulator of the recorded model against a transcript.
+
+    Return the attempts and failures. Raise ValueError if the model is not
+    emulated.
+    """
+    device = emulated_model(transcript.identification)
+    emulator = siglent_emulator.emulator.Emulator(device=device)
+    for default in state_defaults:
+        emulate(emulator, default)
+
+    attempts: int = 0
+    failures: int = 0
+    for tests, recorded in transcript.suites.values():
+        responses = [emulate(emulator, command) for command in flatten(tests)]
+        suite_attempts, suite_failures = check(tests, responses, recorded)
+        attempts += suite_attempts
+        failures += suite_failures
+    return attempts, failures
 
 
 def main() -> None:
@@ -231,28 +481,37 @@ def main() -> None:
         level=logging.INFO,
     )
 
-    if len(sys.argv) != 3:
-        usage()
-
-    try:
-        hardware_ip_addr: str = sys.argv[1]
-        hardware_port: int = int(sys.argv[2])
-    except Exception as err:
-        errlog.exception(err)
-        usage()
-
-    emulator_port = 21111
-    siglent_emulator.emulator.start(device="SDG1032X", port=emulator_port, daemon=True)
-    emulator = open_socket(ip_addr="127.0.0.1", port=emulator_port)
-    hardware = open_socket(ip_addr=hardware_ip_addr, port=hardware_port)
-
-    # In case the emulator or hardware is not at default state, reset it.
-    reset_state(sock=emulator)
-    reset_state(sock=hardware)
+    parser = argparse.ArgumentParser(prog="siglent_emulator_verifier")
+    parser.add_argument("hw_ip", nargs="?")
+    parser.add_argument("hw_port", nargs="?", type=int)
+    # A depth of 1 waits for every response before sending on
+    parser.add_argument("pipeline_depth", nargs="?", type=int, default=PIPELINE_DEPTH)
+    parser.add_argument(
+        "--record", metavar="FILE", help="save the hardware's responses"
+    )
+    parser.add_argument(
+        "--replay", metavar="FILE", help="check the emulator against a recording"
+    )
+    args = parser.parse_args()
 
-    attempts, failures = rounding_tests_amp(emulator=emulator, hardware=hardware)
-    attempts, failures = rounding_tests_frq(emulator=emulator, hardware=hardware)
-    attempts, failures = run_tests(emulator=emulator, hardware=hardware)
+    if args.replay is not None:
+        try:
+            attempts, failures = replay(load_transcript(args.replay))
+        except ValueError as err:
+            parser.error(str(err))
+    elif args.hw_ip is None or args.hw_port is None:
+        parser.error("hw_ip and hw_port are required unless replaying")
+    else:
+        hardware = Target(
+            "hardware", open_socket(ip_addr=args.hw_ip, port=args.hw_port)
+        )
+        if args.record is not None:
+            transcript = record(hardware=hardware, depth=args.pipeline_depth)
+            save_transcript(args.record, transcript)
+            hardware.report()
+            errlog.info("Recorded '%s' to %s", transcript.identification, args.record)
+            return
+        attempts, failures = verify(hardware=hardware, depth=args.pipeline_depth)
 
     if failures > 0:
         errlog.error("\n%d of %d tests failed", failures, attempts)
@@ -0,0 +1,168 @@
+"""Tests."""
+
+import asyncio
+import io
+import logging
+import socket
+import threading
+import unittest
+
+from siglent_client import client
+from siglent_emulator import farm
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+def connect(port: int) -> client.Client:
+    """Connect to the emulated device on the port."""
+    return client.Client("127.0.0.1", port)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    bench: farm.Farm
+    # Ports of the devices: a generator, a scope, and a generator to sweep
+    generator: int
+    scope: int
+    sweep: int
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.bench = farm.Farm()
+        cls.generator = cls.bench.add(device="SDG1032X")
+        cls.scope = cls.bench.add(device="SDS1202XE")
+        cls.sweep = cls.bench.add(device="SDG1032X")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.bench.close()
+
+    def test_0_query(self) -> None:
+        """Writes have no response, queries return theirs without the line ending."""
+        with connect(self.generator) as device:
+            device.write("C1:OUTP ON")
+            self.assertEqual(device.query("C1:OUTP?"), "C1:OUTP ON,LOAD,HZ,PLRT,NOR")
+            device.write("C1:OUTP OFF")
+
+    def test_1_query(self) -> None:
+        """A query that gets no response times out."""
+        with client.Client("127.0.0.1", self.generator, timeout=0.2) as device:
+            with self.assertRaises(socket.timeout):
+                device.query("C1:OUTP")
+
+    def test_0_query_block(self) -> None:
+        """Binary blocks are returned whole, text queries refuse them."""
+        with connect(self.scope) as device:
+            block = device.query_block("C1:WF? DAT2")
+            self.assertEqual(block.text, b"C1:WF DAT2,")
+            self.assertEqual(len(block.data), 14_000_000)
+            with self.assertRaises(ValueError):
+                device.query("C2:WF? DAT2")
+
+    def test_0_query_many(self) -> None:
+        """Pipelined responses come back in the order the queries were sent."""
+        with connect(self.generator) as device:
+            queries = ["C1:OUTP?", "C2:OUTP?", "*IDN?"] * 50
+            responses = device.query_many(queries, depth=16)
+            self.assertEqual(len(responses), 150)
+            self.assertEqual(responses[1], "C2:OUTP OFF,LOAD,HZ,PLRT,NOR")
+            self.assertTrue(responses[149].startswith("SIGLENT TECHNOLOGIES,"))
+
+    def test_0_async(self) -> None:
+        """Queries awaited from several tasks at once each get their own response."""
+
+        async def run() -> None:
+            async with await client.AsyncClient.connect(
+                "127.0.0.1", self.generator
+            ) as device:
+                await device.write("C2:OUTP ON")
+                responses = await asyncio.gather(
+                    device.query("C2:OUTP?"),
+                    device.query_many(["C1:OUTP?", "*IDN?"] * 20, depth=8),
+                )
+                self.assertEqual(responses[0], "C2:OUTP ON,LOAD,HZ,PLRT,NOR")
+                self.assertEqual(responses[1][38], "C1:OUTP OFF,LOAD,HZ,PLRT,NOR")
+                await device.write("C2:OUTP OFF")
+                self.assertEqual(
+                    await device.query("C2:OUTP?"), "C2:OUTP OFF,LOAD,HZ,PLRT,NOR"
+                )
+
+        asyncio.run(run())
+
+    def test_1_async(self) -> None:
+        """Binary blocks are read on the event loop too."""
+
+        async def run() -> None:
+            async with await client.AsyncClient.connect(
+                "127.0.0.1", self.scope
+            ) as device:
+                block = await device.query_block("C2:WF? DAT2")
+                self.assertEqual(block.text, b"C2:WF DAT2,")
+                self.assertEqual(len(block.data), 14_000_000)
+
+        asyncio.run(run())
+
+    def test_0_pool(self) -> None:
+        """Connections are reused per (host, port) and shared between threads."""
+        pool = client.ConnectionPool(max_idle=2)
+        with pool.connection("127.0.0.1", self.generator) as first:
+            pass
+        with pool.connection("127.0.0.1", self.generator) as second:
+            self.assertIs(second, first)
+            with pool.connection("127.0.0.1", self.scope) as other:
+                self.assertIsNot(other, first)
+
+        responses = []
+
+        def query() -> None:
+            for _ in range(20):
+                responses.append(pool.query("127.0.0.1", self.generator, "C1:OUTP?"))
+
+        threads = [threading.Thread(target=query) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(responses, ["C1:OUTP OFF,LOAD,HZ,PLRT,NOR"] * 80)
+        self.assertLessEqual(len(pool.idle[("127.0.0.1", self.generator)]), 2)
+        pool.close()
+        self.assertEqual(pool.idle, {})
+
+    def test_1_pool(self) -> None:
+        """A connection that raised is closed rather than lent again."""
+        pool = client.ConnectionPool(timeout=0.2)
+        with self.assertRaises(socket.timeout):
+            with pool.connection("127.0.0.1", self.generator) as device:
+                device.query("C1:OUTP")
+        self.assertEqual(device.sock.fileno(), -1)
+        self.assertEqual(pool.idle, {})
+
+    def test_0_batch(self) -> None:
+        """Every query in a script is written out with its response, in order."""
+        script = ["# sweep", "C1:OUTP ON", ""]
+        script += [f"C1:BSWV FRQ,{frq}\nC1:BSWV?" for frq in range(1, 101)]
+        script += ["C1:OUTP?", "C1:OUTP OFF", "*RST"]
+        out = io.StringIO()
+        with connect(self.sweep) as device:
+            batch = client.Batch(device, out=out, depth=8)
+            batch.run("\n".join(script).splitlines())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 101)
+        self.assertTrue(lines[0].startswith("C1:BSWV?\tC1:BSWV WVTP,SINE,FRQ,1HZ,"))
+        self.assertTrue(lines[99].startswith("C1:BSWV?\tC1:BSWV WVTP,SINE,FRQ,100HZ,"))
+        self.assertEqual(lines[100], "C1:OUTP?\tC1:OUTP ON,LOAD,HZ,PLRT,NOR")
+        self.assertEqual(batch.commands, 204)
+        self.assertEqual(batch.latency.count, 101)
+        self.assertTrue(batch.summary().startswith("204 commands (101 queries) in "))
+
+    def test_1_batch(self) -> None:
+        """Binary block responses are written out as their length."""
+        out = io.StringIO()
+        with connect(self.scope) as device:
+            client.Batch(device, out=out).run(["WFSU NP,10", "C2:WF? DAT2", "*RST"])
+        self.assertEqual(out.getvalue(), "C2:WF? DAT2\tC2:WF DAT2,<10 bytes>\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,11 @@
 """Tests."""
 
 import logging
+import socket
 import unittest
 
 from siglent_emulator import emulator
+from siglent_emulator import framing
 
 logging.basicConfig(level=logging.CRITICAL)
 
@@ -12,14 +14,110 @@ class Test(unittest.TestCase):
     """Test cases."""
 
     def test_0___init__(self) -> None:
-        """Can start a supported emulator."""
-        emulator.start(device="SDG1032X", daemon=True)
+        """Can start a supported emulator, it is listening once started."""
+        host, port = emulator.start(device="SDG1032X", port=0, daemon=True)
+        with socket.create_connection((host, port), timeout=10.0) as client:
+            client.sendall(b"*IDN?\n")
+            self.assertTrue(client.recv(2048).startswith(b"SIGLENT TECHNOLOGIES,"))
 
     def test_1___init__(self) -> None:
         """Fails to start an unsupported emulator."""
         with self.assertRaises(KeyError):
             emulator.start(device="ABC1000", daemon=False)
 
+    def test_2___init__(self) -> None:
+        """Fails to start an unsupported engine."""
+        with self.assertRaises(ValueError):
+            emulator.start(device="SDG1032X", daemon=False, engine="fork")
+
+    def test_0_asyncio(self) -> None:
+        """Serves several concurrent clients on the asyncio engine."""
+        address = emulator.start(
+            device="SDG1032X", port=0, daemon=True, engine="asyncio"
+        )
+        clients = [socket.create_connection(address, timeout=10.0) for _ in range(3)]
+        for client in clients:
+            client.sendall(b"*IDN?\n")
+        for client in clients:
+            self.assertTrue(client.recv(2048).startswith(b"SIGLENT TECHNOLOGIES,"))
+            client.close()
+
+    def test_0_pipelining(self) -> None:
+        """Every command of a burst split at arbitrary points gets a response."""
+        address = emulator.start(device="SDG1032X", port=0, daemon=True)
+        client = socket.create_connection(address, timeout=10.0)
+        burst = b"C1:OUTP?\n" * 1000
+        for i in range(0, len(burst), 7):
+            client.sendall(burst[i : i + 7])
+        expected = b"C1:OUTP OFF,LOAD,HZ,PLRT,NOR\n" * 1000
+        received = b""
+        while len(received) < len(expected):
+            received += client.recv(65536)
+        self.assertEqual(received, expected)
+        client.close()
+
+    def test_0_blocks(self) -> None:
+        """Multi-megabyte waveforms round trip on both engines."""
+        data = bytes(range(256)) * 16384
+        for engine in emulator.ENGINES:
+            address = emulator.start(
+                device="SDG1032X", port=0, daemon=True, engine=engine
+            )
+            client = socket.create_connection(address, timeout=10.0)
+            client.sendall(
+                b"C1:WVDT WVNM,BIG,WAVEDATA,"
+                + framing.block_header(len(data))
+                + data
+                + b"\nWVDT? USER,BIG\n*IDN?\n"
+            )
+            text = b"WVDT WVNM,BIG,LENGTH,4194304B,FREQ,1000,AMPL,4,OFST,0,PHASE,0,"
+            expected = text + b"WAVEDATA,#74194304" + data + b"\nSIGLENT"
+            received = bytearray()
+            while len(received) < len(expected):
+                received += client.recv(1 << 20)
+            self.assertEqual(received[: len(expected)], expected)
+            client.close()
+
+    def test_1_blocks(self) -> None:
+        """A client that has stopped sending still gets the whole block."""
+        data = bytes(range(256)) * 16384
+        for engine in emulator.ENGINES:
+            address = emulator.start(
+                device="SDG1032X", port=0, daemon=True, engine=engine
+            )
+            client = socket.create_connection(address, timeout=10.0)
+            client.sendall(
+                b"C1:WVDT WVNM,BIG,WAVEDATA,"
+                + framing.block_header(len(data))
+                + data
+                + b"\nWVDT? USER,BIG\n"
+            )
+            client.shutdown(socket.SHUT_WR)
+            received = bytearray()
+            while True:
+                chunk = client.recv(1 << 20)
+                if not chunk:
+                    break
+                received += chunk
+            self.assertTrue(received.endswith(b"WAVEDATA,#74194304" + data + b"\n"))
+            client.close()
+
+    def test_0_waveform(self) -> None:
+        """Full-depth oscilloscope waveforms are read on both engines."""
+        for engine in emulator.ENGINES:
+            address = emulator.start(
+                device="SDS1202XE", port=0, daemon=True, engine=engine
+            )
+            client = socket.create_connection(address, timeout=10.0)
+            client.sendall(b"C1:WF? DAT2\nC2:WF? DAT2\n*IDN?\n")
+            block = b"C1:WF DAT2,#814000000" + bytes(14_000_000) + b"\n"
+            expected = block + block.replace(b"C1", b"C2") + b"SIGLENT"
+            received = bytearray()
+            while len(received) < len(expected):
+                received += client.recv(1 << 20)
+            self.assertEqual(received[: len(expected)], expected)
+            client.close()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,138 @@
+"""Tests."""
+
+import array
+import logging
+import socket
+import time
+import unittest
+from typing import Any
+
+from siglent_emulator import farm
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+def query(port: int, command: str) -> str:
+    """Send one query to the device on the port and return the response."""
+    with socket.create_connection(("127.0.0.1", port), timeout=10.0) as sock:
+        sock.sendall(str.encode(command + "\n"))
+        response = b""
+        while not response.endswith(b"\n"):
+            response += sock.recv(2048)
+    return response.decode("utf-8")
+
+
+class DeadWorker:
+    """A worker process that has already exited."""
+
+    exitcode = 1
+    pid = 0
+
+    def is_alive(self) -> bool:
+        """Never alive."""
+        return False
+
+    def terminate(self) -> None:
+        """Nothing to stop."""
+
+    def join(self) -> None:
+        """Nothing to wait for."""
+
+
+class FailingFarm(farm.ShardedFarm):
+    """A sharded farm whose workers all die at once."""
+
+    interval = 0.01
+    max_backoff = 0.08
+
+    def spawn(self, worker: int) -> Any:
+        return DeadWorker()
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_add(self) -> None:
+        """Devices in one farm have independent state."""
+        bench = farm.Farm()
+        first, second = bench.add("SDG1032X"), bench.add("SDG1062X")
+        self.assertEqual(bench.ports(), sorted([first, second]))
+        self.assertIn("SDG1032X", query(first, "*IDN?"))
+        self.assertIn("SDG1062X", query(second, "*IDN?"))
+
+        bench[first].device.process("C1:BSWV FRQ,123")
+        self.assertIn("FRQ,123HZ", query(first, "C1:BSWV?"))
+        self.assertIn("FRQ,1000HZ", query(second, "C1:BSWV?"))
+        bench.close()
+
+    def test_0_remove(self) -> None:
+        """A removed device stops listening."""
+        bench = farm.Farm()
+        port = bench.add("SDG1032X")
+        bench.remove(port)
+        self.assertEqual(bench.ports(), [])
+        with self.assertRaises(ConnectionRefusedError):
+            query(port, "*IDN?")
+        bench.close()
+
+    def test_0_connect(self) -> None:
+        """A cabled scope captures what the generator is set to over the network."""
+        bench = farm.Farm()
+        generator, scope = bench.add("SDG1032X"), bench.add("SDS1202XE")
+        bench.connect(generator=(generator, 1), scope=(scope, 2))
+        query(generator, "C1:OUTP ON\n*IDN?")
+        query(scope, "MSIZ 7K\n*IDN?")
+        with socket.create_connection(("127.0.0.1", scope), timeout=10.0) as sock:
+            sock.sendall(b"C2:WF? DAT2\n")
+            expected = len(b"C2:WF DAT2,#47000") + 7000 + 1
+            response = b""
+            while len(response) < expected:
+                response += sock.recv(8192)
+        codes = array.array("b", response[17:-1])
+        self.assertEqual((max(codes), min(codes)), (50, -50))
+        bench.close()
+
+    def test_0_sharded_farm(self) -> None:
+        """Devices are spread over workers, a dead worker is restarted."""
+        sharded = farm.ShardedFarm(
+            devices=["SDG1032X", "SDG1062X", "SDG1032X"], first_port=0, workers=2
+        )
+        self.assertEqual(len(sharded.shards), 2)
+        # Listening already, clients wait for the workers to start
+        self.assertIn("SDG1062X", query(sharded.ports[1], "*IDN?"))
+        self.assertIn("SDG1032X", query(sharded.ports[2], "*IDN?"))
+
+        sharded.processes[1].kill()
+        sharded.processes[1].join()
+        self.assertIn("SDG1062X", query(sharded.ports[1], "*IDN?"))
+        self.assertEqual(sharded.stats()[1]["restarts"], 1)
+
+        deadline = time.monotonic() + 10
+        while sharded.stats()[0].get("commands", 0) < 1:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.1)
+        self.assertEqual(sharded.stats()[0]["devices"], 2)
+        sharded.close()
+
+    def test_1_sharded_farm(self) -> None:
+        """A worker that keeps dying is restarted ever more slowly, logged once."""
+        with self.assertLogs("siglent_emulator.farm", level=logging.ERROR) as logs:
+            sharded = FailingFarm(devices=["SDG1032X"], first_port=0, workers=1)
+            time.sleep(1.0)
+            sharded.close()
+        # Without backing off, about one restart every interval
+        self.assertTrue(3 < sharded.restarts[0] < 30, sharded.restarts[0])
+        self.assertEqual(len(logs.records), 1)
+
+    def test_0_parse_spec(self) -> None:
+        """Device specs with and without a count."""
+        self.assertEqual(farm.parse_spec("sdg1032x:4"), ("sdg1032x", 4))
+        self.assertEqual(farm.parse_spec("sdg1062x"), ("sdg1062x", 1))
+
+    def test_0_parse_cable(self) -> None:
+        """Cable specs name both ends by port and channel."""
+        self.assertEqual(farm.parse_cable("21111:1=21112:2"), ((21111, 1), (21112, 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
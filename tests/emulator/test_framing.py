@@ -0,0 +1,136 @@
+"""Tests."""
+
+import logging
+import socket
+import unittest
+
+from siglent_emulator import framing
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_lines(self) -> None:
+        """Several lines in one chunk."""
+        framer = framing.LineFramer()
+        framer.feed(b"*IDN?\nC1:BSWV?\n")
+        self.assertEqual(framer.lines(), [b"*IDN?", b"C1:BSWV?"])
+
+    def test_1_lines(self) -> None:
+        """A line split across chunks is reassembled."""
+        framer = framing.LineFramer()
+        framer.feed(b"C1:BSWV FR")
+        self.assertEqual(framer.lines(), [])
+        framer.feed(b"Q,12\nC1:OU")
+        self.assertEqual(framer.lines(), [b"C1:BSWV FRQ,12"])
+        framer.feed(b"TP?\n")
+        self.assertEqual(framer.lines(), [b"C1:OUTP?"])
+
+    def test_2_lines(self) -> None:
+        """CRLF line endings are stripped."""
+        framer = framing.LineFramer()
+        framer.feed(b"*RST\r\n\r\n")
+        self.assertEqual(framer.lines(), [b"*RST", b""])
+
+    def test_3_lines(self) -> None:
+        """An over-long line is dropped up to its newline, later lines survive."""
+        framer = framing.LineFramer(max_line_length=8)
+        framer.feed(b"C1:BSWV FRQ")
+        self.assertEqual(framer.lines(), [])
+        framer.feed(b",1234567")
+        self.assertEqual(framer.lines(), [])
+        framer.feed(b"89\n*IDN?\n")
+        self.assertEqual(framer.lines(), [b"*IDN?"])
+
+    def test_4_lines(self) -> None:
+        """An over-long line received whole is dropped."""
+        framer = framing.LineFramer(max_line_length=8)
+        framer.feed(b"C1:BSWV FRQ,123456789\n*RST\n")
+        self.assertEqual(framer.lines(), [b"*RST"])
+
+    def test_0_blocks(self) -> None:
+        """A block received whole is returned with the commands around it."""
+        framer = framing.LineFramer()
+        framer.feed(b"*IDN?\nC1:WVDT WVNM,W,WAVEDATA,#15a\n#\nb\n*RST\n")
+        lines = framer.lines()
+        self.assertEqual(lines[0], b"*IDN?")
+        block = lines[1]
+        assert isinstance(block, framing.Block)
+        self.assertEqual(block.text, b"C1:WVDT WVNM,W,WAVEDATA,")
+        self.assertEqual(bytes(block.data), b"a\n#\nb")
+        self.assertEqual(lines[2:], [b"*RST"])
+
+    def test_1_blocks(self) -> None:
+        """A block split across reads is read into its own buffer."""
+        framer = framing.LineFramer(chunk_size=16)
+        data = bytes(range(256)) * 4
+        stream = (
+            b"WVDT WAVEDATA," + framing.block_header(len(data)) + data + b"\n*RST\n"
+        )
+        for i in range(0, len(stream), 5):
+            framer.feed(stream[i : i + 5])
+            if framer.block is not None:
+                # The rest of the block lands in the block, not the pending data
+                self.assertEqual(framer.pending, b"")
+        lines = framer.lines()
+        self.assertEqual(len(lines), 2)
+        block = lines[0]
+        assert isinstance(block, framing.Block)
+        self.assertEqual(block.text, b"WVDT WAVEDATA,")
+        self.assertEqual(bytes(block.data), data)
+        self.assertEqual(lines[1], b"*RST")
+
+    def test_2_blocks(self) -> None:
+        """Block data is read from a socket straight into the block buffer."""
+        server, client = socket.socketpair()
+        framer = framing.LineFramer()
+        data = b"\x00\x01" * 100_000
+        client.sendall(b"WVDT WAVEDATA," + framing.block_header(len(data)))
+        framer.recv_from(server)
+        self.assertEqual(framer.lines(), [])
+        client.sendall(data + b"\n")
+        while not framer.ready:
+            framer.recv_from(server)
+        lines = framer.lines()
+        self.assertEqual(bytes(lines[0][1]), data)
+        server.close()
+        client.close()
+
+    def test_3_blocks(self) -> None:
+        """An over-long block is dropped, later lines survive."""
+        framer = framing.LineFramer(max_block_length=4)
+        framer.feed(b"WVDT WAVEDATA,#18abc")
+        self.assertEqual(framer.lines(), [])
+        framer.feed(b"\ndefg\n*RST\n")
+        self.assertEqual(framer.lines(), [b"*RST"])
+
+    def test_4_blocks(self) -> None:
+        """A '#' that does not start a block is ordinary text."""
+        framer = framing.LineFramer()
+        framer.feed(b"A#B\n#")
+        self.assertEqual(framer.lines(), [b"A#B"])
+        framer.feed(b"\n")
+        self.assertEqual(framer.lines(), [b"#"])
+
+    def test_5_blocks(self) -> None:
+        """Only a '#' after a comma starts a block, others in a line are text."""
+        framer = framing.LineFramer()
+        framer.feed(b"C1:WVDT WVNM,#3rd try,FREQ,#3,WAVEDATA,#13abc\n")
+        framer.feed(b"C1:ARWV NAME,WAVE #3123\n*IDN?\n")
+        lines = framer.lines()
+        block = lines[0]
+        assert isinstance(block, framing.Block)
+        self.assertEqual(block.text, b"C1:WVDT WVNM,#3rd try,FREQ,#3,WAVEDATA,")
+        self.assertEqual(bytes(block.data), b"abc")
+        self.assertEqual(lines[1:], [b"C1:ARWV NAME,WAVE #3123", b"*IDN?"])
+
+    def test_0_block_header(self) -> None:
+        """Headers give the number of length digits, then the length."""
+        self.assertEqual(framing.block_header(5), b"#15")
+        self.assertEqual(framing.block_header(1048576), b"#71048576")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+"""Tests."""
+
+import logging
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from siglent_emulator import emulator
+from siglent_emulator import farm
+from siglent_emulator import framing
+from siglent_emulator import journal
+
+logging.basicConfig(level=logging.CRITICAL)
+
+# Commands that leave a device in a state unlike its defaults
+SETUP = [
+    b"C1:BSWV FRQ,123.456789",
+    b"C2:OUTP ON",
+    b"C1:OUTP LOAD,50",
+    b"BUZZ OFF",
+    b"EMU:SNAP BEFORE",
+    b"C2:ARWV INDEX,10",
+]
+
+
+def start(directory: str, compact_every: int = 1000) -> emulator.Emulator:
+    """Return an emulator journaled in directory, in its journaled state."""
+    instance = emulator.Emulator(device="SDG1032X")
+    instance.journal = journal.Journal(directory, "dev", compact_every)
+    instance.journal.load(instance.device)
+    return instance
+
+
+def state(instance: emulator.Emulator) -> bytes:
+    """Return the device's responses to queries covering its whole state."""
+    queries = [b"C1:BSWV?", b"C2:BSWV?", b"C1:OUTP?", b"C2:OUTP?", b"C2:ARWV?"]
+    queries += [b"BUZZ?", b"STL? USER"]
+    responses = [instance.respond(query) for query in queries]
+    assert all(isinstance(response, bytes) for response in responses)
+    return b"".join(responses)  # type: ignore[arg-type]
+
+
+def crash(instance: emulator.Emulator) -> None:
+    """Stop journaling as if the emulator died, without compacting."""
+    assert instance.journal is not None and instance.journal.log is not None
+    instance.journal.log.close()
+    instance.journal.log = None
+
+
+def close(*instances: emulator.Emulator) -> None:
+    """Stop journaling."""
+    for instance in instances:
+        assert instance.journal is not None
+        instance.journal.close(instance.device)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_load(self) -> None:
+        """A restarted device is in the state it was journaled in."""
+        with tempfile.TemporaryDirectory() as directory:
+            instance = start(directory)
+            for command in SETUP:
+                instance.respond(command)
+            data = memoryview(bytes(range(256)))
+            instance.respond(framing.Block(b"C1:WVDT WVNM,W1,WAVEDATA,", data))
+            instance.respond(b"C1:BSWV?")
+            expected = state(instance)
+            crash(instance)
+
+            restarted = emulator.Emulator(device="SDG1032X")
+            restarted.journal = journal.Journal(directory, "dev")
+            self.assertEqual(restarted.journal.load(restarted.device), 7)
+            self.assertEqual(state(restarted), expected)
+            self.assertEqual(restarted.device.waves["W1"].data, data)
+            restarted.respond(b"EMU:REST BEFORE")
+            self.assertIn(b"ARWV INDEX,2,", restarted.respond(b"C2:ARWV?"))
+            close(restarted)
+
+    def test_1_load(self) -> None:
+        """Compacting writes the state, only later commands are replayed."""
+        with tempfile.TemporaryDirectory() as directory:
+            instance = start(directory, compact_every=4)
+            for command in SETUP:
+                instance.respond(command)
+            data = memoryview(b"\x01\x02")
+            instance.respond(framing.Block(b"C1:WVDT WVNM,W1,WAVEDATA,", data))
+            instance.respond(b"EMU:SNAP AFTER")
+            self.assertEqual(instance.journal.generation, 2)  # type: ignore[union-attr]
+            instance.respond(b"C1:BSWV AMP,1.5")
+            expected = state(instance)
+            crash(instance)
+
+            restarted = start(directory, compact_every=4)
+            self.assertEqual(restarted.journal.generation, 3)  # type: ignore[union-attr]
+            self.assertEqual(state(restarted), expected)
+            self.assertEqual(
+                bytes(restarted.device.snapshots["AFTER"].waves["W1"].data), b"\x01\x02"
+            )
+            self.assertEqual(sorted(os.listdir(directory)), ["dev.3.log", "dev.state"])
+            close(restarted)
+
+    def test_2_load(self) -> None:
+        """A command cut short by a crash and logs left by compacting are dropped."""
+        with tempfile.TemporaryDirectory() as directory:
+            instance = start(directory)
+            instance.respond(b"BUZZ OFF")
+            assert instance.journal is not None
+            instance.journal.compact(instance.device)
+            # The log compacted into the state, as if it had not been removed
+            with open(os.path.join(directory, "dev.0.log"), "wb") as file:
+                file.write(b"BUZZ OFF\nBUZZ ON\n")
+            instance.respond(b"C1:OUTP ON")
+            instance.journal.log.write(b"C1:OUTP OF")  # type: ignore[union-attr]
+            instance.journal.log.flush()  # type: ignore[union-attr]
+            crash(instance)
+
+            restarted = start(directory)
+            self.assertIn(b"OUTP ON", restarted.respond(b"C1:OUTP?"))
+            self.assertIn(b"BUZZ OFF", restarted.respond(b"BUZZ?"))
+            self.assertEqual(sorted(os.listdir(directory)), ["dev.2.log", "dev.state"])
+            close(restarted)
+
+    def test_3_load(self) -> None:
+        """The state of another model is not loaded."""
+        with tempfile.TemporaryDirectory() as directory:
+            instance = start(directory)
+            instance.respond(b"C1:OUTP ON")
+            close(instance)
+            other = emulator.Emulator(device="SDG1062X")
+            other.journal = journal.Journal(directory, "dev")
+            self.assertEqual(other.journal.load(other.device), 0)
+            self.assertIn(b"OUTP OFF", other.respond(b"C1:OUTP?"))
+            close(other)
+
+    def test_0_record(self) -> None:
+        """Clients compacting the journal at once replay to the state they left."""
+        with tempfile.TemporaryDirectory() as directory:
+            instance = start(directory, compact_every=16)
+
+            def client(channel: int) -> None:
+                for i in range(300):
+                    instance.respond(str.encode(f"C{channel}:BSWV FRQ,{i}"))
+                    instance.respond(str.encode(f"PACP C{3 - channel},C{channel}"))
+
+            threads = [threading.Thread(target=client, args=[ch]) for ch in (1, 2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            expected = state(instance)
+            crash(instance)
+
+            restarted = start(directory)
+            self.assertEqual(state(restarted), expected)
+            close(restarted)
+
+    def test_0_farm(self) -> None:
+        """A farm restarted with the same journal restores its devices by port."""
+        with tempfile.TemporaryDirectory() as directory:
+            bench = farm.Farm(journal_dir=directory)
+            port = bench.add("SDG1032X")
+            scope = bench.add("SDS1202XE")
+            self.assertIsNone(bench[scope].journal)
+            with socket.create_connection(("127.0.0.1", port), timeout=10.0) as sock:
+                sock.sendall(b"C2:BSWV FRQ,77\nC2:BSWV?\n")
+                self.assertIn(b"FRQ,77HZ", sock.recv(4096))
+            bench.close()
+
+            bench = farm.Farm(journal_dir=directory)
+            bench.add("SDG1032X", port=port)
+            self.assertIn(b"FRQ,77HZ", bench[port].respond(b"C2:BSWV?"))
+            bench.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests."""
+
+import logging
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from siglent_emulator.function_generator import library
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_generate(self) -> None:
+        """Waveforms have POINTS samples spanning the full range."""
+        for name in ["StairUp", "Sinc", "ExpRise", "HammingWin", "ECG1"]:
+            samples = np.frombuffer(library.generate(name), dtype="<i2")
+            self.assertEqual(len(samples), library.POINTS)
+            self.assertEqual(max(samples.max(), -samples.min()), 32767)
+
+    def test_1_generate(self) -> None:
+        """Duty cycle waveforms are high for the named percentage of the period."""
+        samples = np.frombuffer(library.generate("Duty25"), dtype="<i2")
+        self.assertEqual(np.count_nonzero(samples > 0), library.POINTS // 4)
+
+    def test_2_generate(self) -> None:
+        """Waveforms with no definition get the same stand-in every time."""
+        self.assertEqual(library.generate("Voice"), library.generate("VOICE"))
+        self.assertNotEqual(library.generate("Voice"), library.generate("Radar"))
+
+    def test_0_load(self) -> None:
+        """A waveform is cached on first use and mapped once per process."""
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = library.path("ExpFal", directory)
+            self.assertFalse(os.path.exists(file_path))
+            data = library.load("ExpFal", directory)
+            self.assertTrue(os.path.exists(file_path))
+            self.assertTrue(data.readonly)
+            self.assertEqual(bytes(data), library.generate("ExpFal"))
+            self.assertIs(library.load("ExpFal", directory), data)
+            self.assertEqual(
+                os.listdir(os.path.dirname(file_path)), ["EXPFAL-16384.i16"]
+            )
+            library._mapped.clear()  # pylint: disable=protected-access
+
+    def test_1_load(self) -> None:
+        """A cached waveform is read rather than generated again."""
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = library.path("Sinc", directory)
+            os.makedirs(os.path.dirname(file_path))
+            with open(file_path, "wb") as file:
+                file.write(b"\x01\x00\x02\x00")
+            self.assertEqual(
+                bytes(library.load("Sinc", directory)), b"\x01\x00\x02\x00"
+            )
+            library._mapped.clear()  # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    unittest.main()
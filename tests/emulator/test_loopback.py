@@ -0,0 +1,82 @@
+"""Tests."""
+
+import logging
+import socket
+import unittest
+
+from siglent_emulator import emulator
+from siglent_emulator import framing
+from siglent_emulator import loopback
+
+from ..examples import siglent_device
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_recv(self) -> None:
+        """Commands split across sends are answered as on a socket."""
+        with loopback.connect("SDG1032X") as sock:
+            burst = b"C1:OUTP?\n" * 100
+            for i in range(0, len(burst), 7):
+                sock.sendall(burst[i : i + 7])
+            expected = b"C1:OUTP OFF,LOAD,HZ,PLRT,NOR\n" * 100
+            self.assertEqual(sock.pending(), len(expected))
+            received = b""
+            while sock.pending():
+                received += sock.recv(2048)
+            self.assertEqual(received, expected)
+
+    def test_1_recv(self) -> None:
+        """Waiting on a query with no response times out at once."""
+        with loopback.connect("SDG1032X") as sock:
+            sock.sendall(b"C1:OUTP ON\n")
+            with self.assertRaises(socket.timeout):
+                sock.recv(2048)
+        with self.assertRaises(OSError):
+            sock.sendall(b"*IDN?\n")
+
+    def test_2_recv(self) -> None:
+        """Binary blocks round trip unchanged."""
+        data = bytes(range(256)) * 64
+        with loopback.connect("SDG1032X") as sock:
+            sock.sendall(
+                b"C1:WVDT WVNM,W,WAVEDATA,"
+                + framing.block_header(len(data))
+                + data
+                + b"\nWVDT? USER,W\n*IDN?\n"
+            )
+            received = bytearray(sock.pending())
+            view = memoryview(received)
+            while view:
+                view = view[sock.recv_into(view, 1000) :]
+            self.assertIn(b"WAVEDATA,#516384" + data + b"\nSIGLENT", received)
+
+    def test_0_makefile(self) -> None:
+        """Responses can be read a line at a time through a file."""
+        with loopback.connect("SDG1032X") as sock:
+            file = sock.makefile("rw", encoding="utf-8")
+            file.write("C2:OUTP ON\nC2:OUTP?\n*IDN?\n")
+            file.flush()
+            self.assertEqual(file.readline(), "C2:OUTP ON,LOAD,HZ,PLRT,NOR\n")
+            self.assertTrue(file.readline().startswith("SIGLENT TECHNOLOGIES,"))
+            self.assertEqual(file.readline(), "")
+
+    def test_0_driver(self) -> None:
+        """A socket-based driver runs unchanged, sharing the emulator's state."""
+        instance = emulator.Emulator(device="SDG1032X")
+        device = siglent_device.Amplitude()
+        sock = loopback.connect(instance)
+        device.sock = sock  # type: ignore[assignment]
+        device.set_amplitude(channel=1, amplitude=13.67)
+        self.assertEqual(device.get_amplitude(channel=1), 13.67)
+        self.assertEqual(instance.metrics.peer_summary()[sock.peer]["count"], 2)
+        device.close()
+        self.assertEqual(instance.device.channels[0].cvals.amp, 13.67)
+        self.assertEqual(instance.metrics.peer_summary(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Tests."""
+
+import logging
+import unittest
+import urllib.request
+
+from siglent_emulator import emulator
+from siglent_emulator import metrics
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_quantile(self) -> None:
+        """Quantiles are reported as bucket upper bounds."""
+        histogram = metrics.Histogram()
+        for _ in range(98):
+            histogram.observe(0.00002)
+        histogram.observe(0.003)
+        histogram.observe(0.003, error=True)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["p50"], 2.5e-5)
+        self.assertEqual(summary["p99"], 5e-3)
+
+    def test_0_record(self) -> None:
+        """Commands are recorded by header and by connection."""
+        emu = emulator.Emulator(device="SDG1032X")
+        emu.metrics.connection_opened("127.0.0.1:1234")
+        emu.respond(b"C1:BSWV?", peer="127.0.0.1:1234")
+        emu.respond(b"C2:BSWV?", peer="127.0.0.1:1234")
+        emu.respond(b"*IDN?")
+        self.assertEqual(emu.metrics.summary()["BSWV?"]["count"], 2)
+        self.assertEqual(emu.metrics.summary()["*IDN?"]["count"], 1)
+        self.assertEqual(emu.metrics.peer_summary()["127.0.0.1:1234"]["count"], 2)
+        self.assertEqual(emu.metrics.total(), 3)
+
+    def test_0_render(self) -> None:
+        """Render the Prometheus text format."""
+        stats = metrics.Metrics()
+        stats.record(header="*IDN?", peer="", seconds=0.00002, error=False)
+        text = stats.render(labels='port="1"')
+        self.assertIn('siglent_commands_total{header="*IDN?",port="1"} 1\n', text)
+        self.assertIn(
+            'siglent_command_seconds_bucket{header="*IDN?",port="1",le="2.5e-05"} 1\n',
+            text,
+        )
+        self.assertIn(
+            'siglent_command_seconds_bucket{header="*IDN?",port="1",le="+Inf"} 1\n',
+            text,
+        )
+
+    def test_1_render(self) -> None:
+        """Label values chosen by clients cannot break the format."""
+        stats = metrics.Metrics()
+        stats.connection_opened('"')
+        stats.record(header='A"B\\C\nD', peer='"', seconds=0.00002, error=False)
+        text = stats.render()
+        self.assertIn('siglent_commands_total{header="A\\"B\\\\C\\nD"} 1\n', text)
+        self.assertIn('siglent_connection_commands_total{peer="\\""} 1\n', text)
+        # Every line is still a comment or a sample
+        for line in text.splitlines():
+            self.assertTrue(line.startswith(("#", "siglent_")), line)
+
+    def test_0_serve(self) -> None:
+        """Metrics can be scraped over HTTP."""
+        stats = metrics.Metrics()
+        stats.record(header="*RST", peer="", seconds=0.001, error=True)
+        server = metrics.serve(port=0, render=stats.render)
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=10) as response:
+            text = response.read().decode("utf-8")
+        server.shutdown()
+        self.assertIn("# TYPE siglent_command_seconds histogram", text)
+        self.assertIn('siglent_command_errors_total{header="*RST"} 1', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
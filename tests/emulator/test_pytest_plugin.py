@@ -0,0 +1,73 @@
+"""Tests."""
+
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+logging.basicConfig(level=logging.CRITICAL)
+
+# Tests run by pytest with the plugin loaded
+TESTS = """
+import socket
+
+import pytest
+
+ports = []
+
+
+def query(device, command):
+    with socket.create_connection((device.host, device.port), timeout=10.0) as sock:
+        sock.sendall(command + b"\\n")
+        return sock.recv(4096)
+
+
+def test_default(emulated_device):
+    assert b",SDG1032X," in query(emulated_device, b"*IDN?")
+    ports.append(emulated_device.port)
+
+
+@pytest.mark.siglent_device("SDS1202XE")
+def test_marker(emulated_device):
+    assert b",SDS1202X-E," in query(emulated_device, b"*IDN?")
+    assert emulated_device.port not in ports
+
+
+def test_removed(emulated_device):
+    with pytest.raises(ConnectionRefusedError):
+        socket.create_connection((emulated_device.host, ports[0]), timeout=10.0)
+    assert emulated_device.emulator.metrics.total() == 0
+"""
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_plugin(self) -> None:
+        """Each test gets a listening device of its own, removed afterwards."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test_devices.py")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(TESTS)
+            result = subprocess.run(
+                [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+                + ["-p", "siglent_emulator.pytest_plugin", "--rootdir", directory]
+                + [path],
+                capture_output=True,
+                check=False,
+                # Installed, the plugin is also loaded from its entry point
+                env={
+                    **os.environ,
+                    "PYTHONPATH": os.pathsep.join(sys.path),
+                    "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+                },
+                text=True,
+            )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("3 passed", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,340 @@
+"""Tests."""
+
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import unittest
+from typing import List
+
+from siglent_emulator import framing
+from siglent_emulator.function_generator import sdg1032x
+from siglent_emulator.function_generator import sdg_common
+
+logging.basicConfig(level=logging.CRITICAL)
+
+# The levels in a BSWV? response
+LEVELS = re.compile(r"AMP,([^V]+)V,.*HLEV,([^V]+)V,LLEV,([^V]+)V")
+
+
+def consistent(response: str) -> bool:
+    """Were the levels in a BSWV? response all set by the same AMP?"""
+    match = LEVELS.search(response)
+    assert match is not None
+    amp, hlev, llev = (float(level) for level in match.groups())
+    return hlev == amp / 2 and llev == -amp / 2
+
+
+class Test(unittest.TestCase):  # pylint: disable=too-many-public-methods
+    """Test cases."""
+
+    def test_0_dispatch(self) -> None:
+        """Device commands reach their handlers."""
+        device = sdg1032x.new()
+        self.assertTrue(device.dispatch("*IDN?").startswith("Siglent Technologies"))
+        self.assertEqual(device.dispatch("BUZZ?"), "BUZZ ON")
+
+    def test_1_dispatch(self) -> None:
+        """Handlers overridden by a model are the ones called."""
+        device = sdg1032x.new()
+        # The SDG1000X series implements neither of these
+        self.assertEqual(device.dispatch("*OPC?"), "")
+        self.assertEqual(device.dispatch("CHDR?"), "")
+
+    def test_2_dispatch(self) -> None:
+        """Channel commands reach their channel."""
+        device = sdg1032x.new()
+        self.assertEqual(device.dispatch("C2:OUTP?")[:8], "C2:OUTP ")
+
+    def test_3_dispatch(self) -> None:
+        """Unknown commands and channels are ignored."""
+        device = sdg1032x.new()
+        self.assertEqual(device.dispatch("XYZZY"), "")
+        self.assertEqual(device.dispatch("*IDN"), "")
+        self.assertEqual(device.dispatch("C3:OUTP?"), "")
+        self.assertEqual(device.dispatch("C1:XYZZY?"), "")
+
+    def test_0_state(self) -> None:
+        """Each device instance has its own state."""
+        first, second = sdg1032x.new(), sdg1032x.new()
+        first.dispatch("C1:BSWV FRQ,123")
+        first.dispatch("BUZZ OFF")
+        self.assertIn("FRQ,1000HZ", second.dispatch("C1:BSWV?"))
+        self.assertEqual(second.dispatch("BUZZ?"), "BUZZ ON")
+
+    def test_0_channel_state(self) -> None:
+        """Settings are held as numbers, keywords as text."""
+        state = sdg_common.ChannelState(sdg_common.channel_defaults)
+        self.assertEqual(state.amp, 4.0)
+        self.assertEqual(state.wvtp, "SINE")
+        state.set("OFST", "0.25")
+        self.assertEqual(state.ofst, 0.25)
+        with self.assertRaises(ValueError):
+            state.set("OFST", "ABC")
+
+    def test_1_channel_state(self) -> None:
+        """Copies are independent."""
+        state = sdg_common.channel_state_defaults.copy()
+        for name in sdg_common.ChannelState.__slots__:
+            self.assertEqual(
+                getattr(state, name), getattr(sdg_common.channel_state_defaults, name)
+            )
+        state.amp = 1.5
+        self.assertEqual(sdg_common.channel_state_defaults.amp, 4.0)
+
+    def test_0_bswv(self) -> None:
+        """Derived values are recomputed when LOAD changes."""
+        device = sdg1032x.new()
+        device.dispatch("C1:BSWV AMP,3.3")
+        self.assertIn(
+            "AMP,3.3V,AMPVRMS,1.16655Vrms,OFST,0V,HLEV,1.65V,LLEV,-1.65V",
+            device.dispatch("C1:BSWV?"),
+        )
+        device.dispatch("C1:OUTP LOAD,50")
+        self.assertIn(
+            "AMP,1.65V,AMPVRMS,0.583275Vrms,AMPDBM,9.99869dBm,OFST,0V,HLEV,0.825V",
+            device.dispatch("C1:BSWV?"),
+        )
+
+    def test_1_bswv(self) -> None:
+        """Invalid numbers are rejected."""
+        device = sdg1032x.new()
+        device.dispatch("C1:BSWV OFST,ABC")
+        self.assertIn("OFST,0V", device.dispatch("C1:BSWV?"))
+
+    def test_2_bswv(self) -> None:
+        """A zero frequency has an infinite period."""
+        device = sdg1032x.new()
+        device.dispatch("C1:BSWV FRQ,0")
+        self.assertIn("FRQ,0HZ,PERI,infS", device.dispatch("C1:BSWV?"))
+
+    def test_0_query_cache(self) -> None:
+        """Repeated queries are answered from the kept response."""
+        device = sdg1032x.new()
+        first = device.process("C1:BSWV?")
+        self.assertIs(device.process("C1:BSWV?"), first)
+        device.process("C1:OUTP ON")
+        # OUTP ON does not change anything BSWV? reports
+        self.assertIs(device.process("C1:BSWV?"), first)
+        self.assertIn("OUTP ON", device.process("C1:OUTP?"))
+
+    def test_1_query_cache(self) -> None:
+        """Kept responses are dropped when a setting they report changes."""
+        device = sdg1032x.new()
+        device.process("C1:BSWV?")
+        device.process("C2:BSWV?")
+        device.process("C1:BSWV FRQ,123")
+        self.assertIn("FRQ,123HZ,PERI,0.00813008S", device.process("C1:BSWV?"))
+        self.assertIn("FRQ,1000HZ", device.process("C2:BSWV?"))
+        device.process("C1:OUTP LOAD,50")
+        self.assertIn("AMP,2V", device.process("C1:BSWV?"))
+        self.assertIn("LOAD,50", device.process("C1:OUTP?"))
+        device.process("C1:BSWV OFST,ABC")
+        self.assertIn("OFST,0V", device.process("C1:BSWV?"))
+        device.process("C1:BSWV WVTP,SQUARE")
+        self.assertIn("WVTP,SQUARE", device.process("C1:BSWV?"))
+
+    def test_2_query_cache(self) -> None:
+        """Copying and resetting settings or changing CHDR drops kept responses."""
+        device = sdg1032x.new()
+        device.process("C2:BSWV FRQ,5")
+        device.process("C1:BSWV?")
+        device.process("PACP C1,C2")
+        self.assertIn("FRQ,5HZ", device.process("C1:BSWV?"))
+        device.process("*RST")
+        self.assertIn("FRQ,1000HZ", device.process("C1:BSWV?"))
+        device.dvals["CHDR"] = "OFF"
+        self.assertTrue(str(device.process("C1:BSWV?")).startswith("WVTP,SINE"))
+
+    def test_0_wave_data(self) -> None:
+        """Uploaded waveforms are kept as sent and listed."""
+        device = sdg1032x.new()
+        data = memoryview(bytearray(b"\x00\x80\xff\x7f"))
+        device.process("C1:WVDT WVNM,RAMP1,FREQ,2000,WAVEDATA,", data=data)
+        self.assertEqual(device.process("STL? USER"), "STL WVNM,RAMP1")
+        response = device.process("WVDT? USER,RAMP1")
+        assert isinstance(response, framing.Block)
+        self.assertEqual(
+            response.text,
+            b"WVDT WVNM,RAMP1,LENGTH,4B,FREQ,2000,AMPL,4,OFST,0,PHASE,0,WAVEDATA,",
+        )
+        self.assertEqual(response.data, data)
+        self.assertTrue(response.data.readonly)
+
+    def test_1_wave_data(self) -> None:
+        """Malformed uploads and unknown waveforms are ignored."""
+        device = sdg1032x.new()
+        self.assertEqual(device.process("C1:WVDT WVNM,RAMP1,WAVEDATA,"), "")
+        data = memoryview(b"\x00\x00")
+        self.assertEqual(device.process("C1:WVDT FREQ,1,WAVEDATA,", data=data), "")
+        self.assertEqual(device.process("C1:BSWV?", data=data), "")
+        self.assertEqual(device.process("WVDT? USER,RAMP1"), "")
+        self.assertEqual(device.process("STL? USER"), "STL WVNM")
+
+    def test_2_wave_data(self) -> None:
+        """Built-in waveforms are returned by their STL index."""
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ["SIGLENT_EMULATOR_CACHE"] = directory
+            try:
+                response = sdg1032x.new().process("WVDT? M10")
+            finally:
+                del os.environ["SIGLENT_EMULATOR_CACHE"]
+            assert isinstance(response, framing.Block)
+            self.assertEqual(
+                response.text, b"WVDT POS,M10,WVNM,ExpFal,LENGTH,32768B,WAVEDATA,"
+            )
+            self.assertEqual(len(response.data), 32768)
+
+    def test_0_arwv(self) -> None:
+        """Arbitrary waveforms are selected by index or name."""
+        device = sdg1032x.new()
+        self.assertEqual(device.process("C1:ARWV?"), "C1:ARWV INDEX,2,NAME,STAIRUP")
+        device.process("C1:ARWV INDEX,10")
+        self.assertEqual(device.process("C1:ARWV?"), "C1:ARWV INDEX,10,NAME,EXPFAL")
+        device.process("C2:ARWV NAME,SINC")
+        self.assertEqual(device.process("C2:ARWV?"), "C2:ARWV INDEX,18,NAME,SINC")
+        device.process("C2:ARWV NAME,NOSUCHWAVE")
+        device.process("C2:ARWV INDEX,999")
+        self.assertEqual(device.process("C2:ARWV?"), "C2:ARWV INDEX,18,NAME,SINC")
+
+    def test_1_arwv(self) -> None:
+        """Uploading selects the waveform, copying and resetting carry it along."""
+        device = sdg1032x.new()
+        data = memoryview(b"\x00\x00")
+        device.process("C1:WVDT WVNM,WAVE1,WAVEDATA,", data=data)
+        self.assertEqual(device.process("C1:ARWV?"), "C1:ARWV NAME,WAVE1")
+        device.process("PACP C2,C1")
+        self.assertEqual(device.process("C2:ARWV?"), "C2:ARWV NAME,WAVE1")
+        device.process("*RST")
+        self.assertEqual(device.process("C2:ARWV?"), "C2:ARWV INDEX,2,NAME,STAIRUP")
+
+    def test_0_snapshot(self) -> None:
+        """Restoring puts back settings, selections and waveforms."""
+        device = sdg1032x.new()
+        device.process("C1:BSWV FRQ,5")
+        device.process("C2:ARWV INDEX,10")
+        device.process("C2:WVDT WVNM,WAVE1,WAVEDATA,", data=memoryview(b"\x00\x00"))
+        device.process("BUZZ OFF")
+        snapshot = device.snapshot()
+        self.assertIn("FRQ,5HZ", device.process("C1:BSWV?"))
+        device.process("*RST")
+        device.process("C1:BSWV FRQ,7")
+        device.process("C1:WVDT WVNM,WAVE2,WAVEDATA,", data=memoryview(b"\x00\x00"))
+        device.process("BUZZ ON")
+        for _ in range(2):
+            device.restore(snapshot)
+            self.assertIn("FRQ,5HZ", device.process("C1:BSWV?"))
+            self.assertEqual(device.process("C1:ARWV?"), "C1:ARWV INDEX,2,NAME,STAIRUP")
+            self.assertEqual(device.process("C2:ARWV?"), "C2:ARWV NAME,WAVE1")
+            self.assertEqual(device.process("STL? USER"), "STL WVNM,WAVE1")
+            self.assertEqual(device.process("BUZZ?"), "BUZZ OFF")
+            device.process("C1:BSWV FRQ,9")
+        self.assertEqual(snapshot.channels[0].cvals.frq, 5)
+        self.assertIs(device.channels[1].waves, device.waves)
+
+    def test_1_snapshot(self) -> None:
+        """Snapshots are saved and restored over the wire, by name."""
+        device = sdg1032x.new()
+        device.process("EMU:SNAP")
+        device.process("C1:OUTP ON")
+        device.process("EMU:SNAP ON")
+        device.process("C1:OUTP OFF")
+        device.process("EMU:REST ON")
+        self.assertIn("OUTP ON", device.process("C1:OUTP?"))
+        device.process("EMU:REST")
+        self.assertIn("OUTP OFF", device.process("C1:OUTP?"))
+        self.assertEqual(device.process("EMU:REST NOSUCHSNAPSHOT"), "")
+        for i in range(sdg_common.MAX_SNAPSHOTS):
+            device.process(f"EMU:SNAP S{i}")
+        self.assertEqual(len(device.snapshots), sdg_common.MAX_SNAPSHOTS)
+        device.process("EMU:SNAP ONE_TOO_MANY")
+        self.assertNotIn("ONE_TOO_MANY", device.snapshots)
+        device.process("EMU:SNAP ON")
+        self.assertEqual(device.snapshots["ON"].channels[0].cvals.output, "OFF")
+
+    def test_0_lock(self) -> None:
+        """Channels are locked apart, exclusive commands wait for every channel."""
+        device = sdg1032x.new()
+        with device.channels[0].lock:
+            other = threading.Thread(target=device.process, args=["C2:BSWV FRQ,5"])
+            other.start()
+            other.join(timeout=10.0)
+            self.assertFalse(other.is_alive())
+            copy = threading.Thread(target=device.process, args=["PACP C1,C2"])
+            copy.start()
+            copy.join(timeout=0.1)
+            self.assertTrue(copy.is_alive())
+            self.assertIn("FRQ,1000HZ", device.process("C1:BSWV?"))
+        copy.join(timeout=10.0)
+        self.assertIn("FRQ,5HZ", device.process("C1:BSWV?"))
+
+    def test_1_lock(self) -> None:
+        """Commands from many threads at once are each applied as a whole."""
+        device = sdg1032x.new()
+        failures: List[str] = []
+        done = threading.Event()
+        # Switch threads as often as possible, to interleave commands
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+        def amplitude(amp: str) -> None:
+            while not done.is_set():
+                device.process(f"C1:BSWV AMP,{amp}")
+
+        def query() -> None:
+            while not done.is_set():
+                response = str(device.process("C1:BSWV?"))
+                if not consistent(response):
+                    failures.append(response)
+                device.process("C2:BSWV FRQ,7")
+
+        def copy() -> None:
+            for i in range(20000):
+                # Copies every setting, one at a time
+                device.process("PACP C2,C1")
+                response = str(device.process("C2:BSWV?"))
+                if not consistent(response):
+                    failures.append(response)
+                if i % 1000 == 0:
+                    device.process("*RST")
+            done.set()
+
+        threads = [threading.Thread(target=amplitude, args=[amp]) for amp in "13"]
+        threads += [threading.Thread(target=query), threading.Thread(target=copy)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(failures, [])
+
+    def test_2_lock(self) -> None:
+        """Constant queries and channel copies do not wait for the device lock."""
+        device = sdg1032x.new()
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold() -> None:
+            with device.lock:
+                held.set()
+                release.wait(timeout=10.0)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait(timeout=10.0)
+        try:
+            self.assertTrue(str(device.process("*IDN?")).startswith("SIGLENT"))
+            device.process("C1:BSWV FRQ,5")
+            device.process("PACP C2,C1")
+            self.assertIn("FRQ,5HZ", device.process("C2:BSWV?"))
+        finally:
+            release.set()
+            holder.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Tests."""
+
+import logging
+import unittest
+
+from siglent_emulator import framing
+from siglent_emulator.oscilloscope import sds1104xe
+from siglent_emulator.oscilloscope import sds1202xe
+from siglent_emulator.oscilloscope import sds_common
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_from_engineering(self) -> None:
+        """Values are parsed with or without a prefix and unit."""
+        self.assertEqual(sds_common.from_engineering("500MV"), 0.5)
+        self.assertEqual(sds_common.from_engineering("1.00E-03S"), 0.001)
+        self.assertEqual(sds_common.from_engineering("2"), 2.0)
+        with self.assertRaises(ValueError):
+            sds_common.from_engineering("ABC")
+
+    def test_0_dispatch(self) -> None:
+        """Device and channel commands reach their handlers."""
+        device = sds1104xe.new()
+        self.assertTrue(str(device.process("*IDN?")).startswith("SIGLENT TECHNOLOGIES"))
+        device.process("C4:VDIV 500MV")
+        self.assertEqual(device.process("C4:VDIV?"), "C4:VDIV 5.00E-01V")
+        device.process("TDIV 1US")
+        self.assertEqual(device.process("TDIV?"), "TDIV 1.00E-06S")
+        self.assertEqual(device.process("C5:VDIV?"), "")
+        device.process("*RST")
+        self.assertEqual(device.process("C4:VDIV?"), "C4:VDIV 1.00E+00V")
+
+    def test_0_acquisition(self) -> None:
+        """The sample rate is limited by the memory depth and the timebase."""
+        device = sds1202xe.new()
+        self.assertEqual(device.process("SARA?"), "SARA 1.00E+09SA/S")
+        self.assertEqual(device.process("SANU? C1"), "SANU 1.40E+07")
+        device.process("TDIV 1S")
+        self.assertEqual(device.process("SARA?"), "SARA 1.00E+06SA/S")
+        device.process("MSIZ 7K")
+        self.assertEqual(device.process("SANU? C2"), "SANU 7.00E+03")
+
+    def test_0_waveform(self) -> None:
+        """Waveforms are returned as a block, one byte per point."""
+        device = sds1202xe.new()
+        device.process("MSIZ 70K")
+        response = device.process("C1:WF? DAT2")
+        assert isinstance(response, framing.Block)
+        self.assertEqual(response.text, b"C1:WF DAT2,")
+        self.assertEqual(len(response.data), 70_000)
+        # Every read of an unchanged acquisition sends the same memory
+        again = device.process("C2:WF? DAT2")
+        assert isinstance(again, framing.Block)
+        self.assertIs(again.data.obj, response.data.obj)
+
+    def test_1_waveform(self) -> None:
+        """WFSU selects the points returned."""
+        device = sds1202xe.new()
+        device.process("MSIZ 7K")
+        device.process("WFSU SP,4,NP,100,FP,8")
+        self.assertEqual(device.process("WFSU?"), "WFSU SP,4,NP,100,FP,8")
+        response = device.process("C1:WF? DAT2")
+        assert isinstance(response, framing.Block)
+        self.assertEqual(len(response.data), 100)
+        device.process("WFSU SP,0,NP,0,FP,6990")
+        response = device.process("C1:WF? DAT2")
+        assert isinstance(response, framing.Block)
+        self.assertEqual(len(response.data), 10)
+
+    def test_2_waveform(self) -> None:
+        """Hidden traces and other formats return nothing."""
+        device = sds1202xe.new()
+        self.assertEqual(device.process("C1:WF? DESC"), "")
+        device.process("C1:TRA OFF")
+        self.assertEqual(device.process("C1:TRA?"), "C1:TRA OFF")
+        self.assertEqual(device.process("C1:WF? DAT2"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
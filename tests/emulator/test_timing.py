@@ -0,0 +1,174 @@
+"""Tests."""
+
+import logging
+import socket
+import threading
+import time
+import unittest
+from types import MappingProxyType
+from typing import List
+
+from siglent_emulator import emulator
+from siglent_emulator import farm
+from siglent_emulator import timing
+from siglent_emulator.function_generator import util
+
+logging.basicConfig(level=logging.CRITICAL)
+
+PROFILE = timing.Profile(
+    query=0.01,
+    command=0.001,
+    service=MappingProxyType({"*RST": 0.5, "OUTP LOAD": 0.1, "OUTP": 0.02}),
+)
+
+# Queries slow enough to time over a socket
+SLOW = timing.Profile(query=0.2)
+
+# A reset that keeps the instrument busy long after the queries are done
+SETTLE = timing.Profile(query=0.05, service=MappingProxyType({"*RST": 0.5}))
+
+
+def receive(sock: socket.socket, count: int) -> List[float]:
+    """Wait for count responses. Return how long each took to arrive."""
+    began = time.monotonic()
+    arrived: List[float] = []
+    received = b""
+    while len(arrived) < count:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        received += chunk
+        arrived += [time.monotonic() - began] * (received.count(b"\n") - len(arrived))
+    return arrived
+
+
+def pipeline(port: int, commands: bytes, count: int, results: List[float]) -> None:
+    """Send commands at once, collect how long their count responses took."""
+    with socket.create_connection(("127.0.0.1", port), timeout=10.0) as sock:
+        sock.sendall(commands)
+        results += receive(sock, count)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_schedule(self) -> None:
+        """Commands start when they arrive or when the one before is done."""
+        timeline = timing.Timeline(PROFILE)
+        self.assertAlmostEqual(timeline.schedule(b"*RST", now=10.0), 10.5)
+        self.assertAlmostEqual(timeline.schedule(b"c1:outp?", now=10.1), 10.51)
+        self.assertAlmostEqual(timeline.schedule(b"C1:OUTP ON", now=10.2), 10.53)
+        self.assertAlmostEqual(timeline.schedule(b"C1:OUTPUT LOAD,50", now=11), 11.1)
+        self.assertAlmostEqual(timeline.schedule(b"BUZZ OFF", now=12.0), 12.001)
+
+    def test_1_schedule(self) -> None:
+        """Jitter adds up to its bound, the same for the same seed."""
+        profile = PROFILE._replace(jitter=0.01)
+        done = [timing.Timeline(profile, seed=1).schedule(b"*IDN?", 0) for _ in "ab"]
+        self.assertEqual(done[0], done[1])
+        self.assertTrue(0.01 <= done[0] <= 0.02)
+
+    def test_0_profiles(self) -> None:
+        """Every model has a profile."""
+        self.assertEqual(sorted(timing.PROFILES), sorted(emulator.EMULATORS))
+        parsed = util.parse_command("*RST")
+        self.assertGreater(timing.PROFILES["sdg1032x"].service_time(parsed), 0.1)
+
+    def test_0_asyncio(self) -> None:
+        """A connection waits for commands on the device, not on other devices."""
+        bench = farm.Farm()
+        port = bench.add("SDG1032X")
+        other_port = bench.add("SDG1032X")
+        bench[port].timing = SLOW
+        bench[other_port].timing = SLOW
+        busy: List[float] = []
+        other: List[float] = []
+        same: List[float] = []
+        first = threading.Thread(
+            target=pipeline, args=(port, b"C1:OUTP?\n" * 5, 5, busy)
+        )
+        first.start()
+        time.sleep(0.05)
+        pipeline(other_port, b"*IDN?\n", 1, other)
+        pipeline(port, b"*IDN?\n", 1, same)
+        first.join()
+        self.assertEqual(len(busy), 5)
+        self.assertGreater(busy[-1], 0.9)
+        self.assertEqual(sorted(busy), busy)
+        self.assertTrue(0.15 < other[0] < 0.6)
+        # Waits for the OUTP? queries still to be done on the device
+        self.assertGreater(same[0], 0.6)
+        bench.close()
+
+    def test_1_asyncio(self) -> None:
+        """*RST on one connection delays the commands on another."""
+        bench = farm.Farm()
+        port = bench.add("SDG1032X")
+        bench[port].timing = SETTLE
+        delayed: List[float] = []
+        with socket.create_connection(("127.0.0.1", port), timeout=10.0) as sock:
+            sock.sendall(b"*RST\n")
+            time.sleep(0.05)
+            pipeline(port, b"*IDN?\n", 1, delayed)
+        self.assertTrue(0.35 < delayed[0] < 1.5)
+        bench.close()
+
+    def test_0_thread(self) -> None:
+        """As on the asyncio engine, connections wait on their own thread."""
+        instance = emulator.Emulator(device="SDG1032X")
+        instance.timing = SETTLE
+        server_socket = instance.bind(port=0, retry=False)
+        server_socket.listen()
+        port = server_socket.getsockname()[1]
+        threading.Thread(
+            target=instance.run, kwargs={"server_socket": server_socket}, daemon=True
+        ).start()
+        busy: List[float] = []
+        delayed: List[float] = []
+        first = threading.Thread(
+            target=pipeline, args=(port, b"*RST\n*IDN?\n", 1, busy)
+        )
+        first.start()
+        time.sleep(0.05)
+        pipeline(port, b"*IDN?\n", 1, delayed)
+        first.join()
+        self.assertGreater(busy[-1], 0.5)
+        # Waits for the *RST, then for its own query
+        self.assertTrue(0.35 < delayed[0] < 1.5)
+
+    def test_0_input_buffer(self) -> None:
+        """A client stops being read from once the input buffer is full."""
+        bench = farm.Farm()
+        port = bench.add("SDG1032X")
+        bench[port].timing = timing.Profile(command=10.0, input_buffer=64)
+        data = b"C1:OUTP ON\n" * 1_000_000
+        sent = 0
+        with socket.create_connection(("127.0.0.1", port), timeout=10.0) as sock:
+            sock.setblocking(False)
+            # Until sending has been blocked for a while
+            blocked = time.monotonic()
+            while sent < len(data) and time.monotonic() < blocked + 0.5:
+                try:
+                    sent += sock.send(data[sent:])
+                    blocked = time.monotonic()
+                except BlockingIOError:
+                    time.sleep(0.01)
+        self.assertLess(sent, len(data))
+        bench.close()
+
+    def test_0_ended(self) -> None:
+        """Commands sent before the client stopped sending are still answered."""
+        bench = farm.Farm()
+        port = bench.add("SDG1032X")
+        bench[port].timing = timing.Profile(query=0.05)
+        with socket.create_connection(("127.0.0.1", port), timeout=10.0) as sock:
+            sock.sendall(b"C1:OUTP ON\nC1:OUTP?\n")
+            sock.shutdown(socket.SHUT_WR)
+            self.assertEqual(len(receive(sock, 1)), 1)
+            self.assertEqual(sock.recv(4096), b"")
+        self.assertIn(b"OUTP ON", bench[port].respond(b"C1:OUTP?"))
+        bench.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
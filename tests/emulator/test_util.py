@@ -9,7 +9,7 @@ from siglent_emulator.function_generator import util
 logging.basicConfig(level=logging.CRITICAL)
 
 
-class Test(unittest.TestCase):
+class Test(unittest.TestCase):  # pylint: disable=too-many-public-methods
     """Test cases."""
 
     def test_0_channel_to_index(self) -> None:
@@ -102,6 +102,46 @@ class Test(unittest.TestCase):
             "SYSTEM:COMMUNICATE:LAN:IPADDRESS 1,2",
         )
 
+    def test_0_round_sig(self) -> None:
+        """Rounds to what float_to_str() displays."""
+        for val in [0.0, 1.0, 3.3 * 0.3535, 123456.789, -0.000123456789, 1e-9 / 7]:
+            self.assertEqual(util.round_sig(val), float(util.float_to_str(val)))
+
+    def test_0_divide(self) -> None:
+        """Rounds to what float_to_str() displays, a zero divisor gives infinity."""
+        self.assertEqual(util.divide(1, 3), 0.333333)
+        self.assertEqual(util.divide(1, 0), float("inf"))
+
+    def test_0_float_to_str(self) -> None:
+        """Integral values have no fraction, and there is no negative zero."""
+        self.assertEqual(util.float_to_str(1000.0), "1000")
+        self.assertEqual(util.float_to_str(-0.0), "0")
+        self.assertEqual(util.float_to_str(float("inf")), "inf")
+
+    def test_0_parse_command(self) -> None:
+        """Channel command with params."""
+        parsed = util.parse_command("c1:OutPUT LOAD,hz")
+        self.assertEqual(parsed.command, "C1:OUTP LOAD,HZ")
+        self.assertEqual(parsed.channel, "C1:")
+        self.assertEqual(parsed.body, "OUTP LOAD,HZ")
+        self.assertEqual(parsed.header, "OUTP")
+        self.assertEqual(parsed.params, ("LOAD", "HZ"))
+
+    def test_1_parse_command(self) -> None:
+        """Multi-verb device query."""
+        parsed = util.parse_command("SYSTem:COMMunicate:LAN:IPADdress?")
+        self.assertEqual(parsed.channel, "")
+        self.assertEqual(parsed.header, "SYST:COMM:LAN:IPAD?")
+        self.assertEqual(parsed.params, ())
+
+    def test_2_parse_command(self) -> None:
+        """Repeated commands are served from the cache."""
+        util.parse_command.cache_clear()
+        util.parse_command("*IDN?")
+        util.parse_command("*IDN?")
+        info = util.parse_command.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
 
 if __name__ == "__main__":
     unittest.main()
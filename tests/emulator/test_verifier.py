@@ -0,0 +1,106 @@
+"""Tests."""
+
+import logging
+import os
+import tempfile
+import unittest
+from typing import List
+
+import siglent_emulator_verifier as verifier
+from siglent_emulator import farm
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+def target(bench: farm.Farm, name: str, device: str) -> verifier.Target:
+    """Emulate a device on a free port and return it as a verifier target."""
+    port = bench.add(device=device)
+    return verifier.Target(name, verifier.open_socket(ip_addr=bench.ip_addr, port=port))
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    bench: farm.Farm
+    first: verifier.Target
+    second: verifier.Target
+    other: verifier.Target
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Start two identical devices and a different one."""
+        cls.bench = farm.Farm()
+        cls.first = target(cls.bench, "first", "SDG1032X")
+        cls.second = target(cls.bench, "second", "SDG1032X")
+        cls.other = target(cls.bench, "other", "SDG1062X")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Disconnect from the devices."""
+        for device in [cls.first, cls.second, cls.other]:
+            device.sock.close()
+        cls.bench.close()
+
+    def test_0_run(self) -> None:
+        """Pipelined responses come back in order, one per command."""
+        responses = self.first.run(["C1:BSWV FRQ,5", "C1:BSWV?", "*IDN?"], depth=2)
+        self.assertEqual(responses[0], "No response expected")
+        self.assertIn("FRQ,5HZ", responses[1])
+        self.assertTrue(responses[2].endswith("\\n"))
+        self.assertEqual(self.first.latency.count, 2)
+
+    def test_0_run_suite(self) -> None:
+        """Identical devices pass every test, pipelined or not."""
+        for depth in [1, verifier.PIPELINE_DEPTH]:
+            verifier.reset_state(self.first)
+            verifier.reset_state(self.second)
+            self.assertEqual(
+                verifier.rounding_tests_amp(self.first, self.second, depth), (220, 0)
+            )
+            self.assertEqual(
+                verifier.run_tests(self.first, self.second, depth), (28, 0)
+            )
+
+    def test_1_run_suite(self) -> None:
+        """Mismatched responses are counted, a state mismatch stops the suite."""
+        self.assertFalse(verifier.run_test(self.first, self.other, "*IDN?"))
+        tests: List[verifier.Test] = [("*IDN?", []), ("C1:BSWV FRQ,7", ["C1:BSWV?"])]
+        verifier.run_test(self.other, self.other, "C1:BSWV AMP,3")
+        self.assertEqual(verifier.run_suite(self.first, self.other, tests), (2, 2))
+
+    def test_0_transcript(self) -> None:
+        """A recording replays against the emulator without any device."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sdg1032x.json.gz")
+            verifier.save_transcript(path, verifier.record(self.second))
+            transcript = verifier.load_transcript(path)
+        self.assertIn("SDG1032X", transcript.identification)
+        self.assertEqual(list(transcript.suites), list(verifier.suites))
+        self.assertEqual(verifier.replay(transcript), (1244, 0))
+
+    def test_1_transcript(self) -> None:
+        """Replaying emulates the recorded model, and finds responses that differ."""
+        transcript = verifier.record(self.other)
+        tests, responses = transcript.suites["run_tests"]
+        self.assertEqual(verifier.replay(transcript), (1244, 0))
+        # The C1:OUTP? check that follows C1:OUTP ON
+        commands = verifier.flatten(tests)
+        start = commands.index("C1:OUTP ON")
+        responses[commands.index("C1:OUTP?", start)] = "C1:OUTP\\n"
+        self.assertEqual(verifier.replay(transcript)[1], 1)
+
+    def test_2_transcript(self) -> None:
+        """A recording of a model that is not emulated is refused."""
+        self.assertEqual(
+            verifier.emulated_model("Siglent Technologies,SDS1104X-E,SDS,8.2\\n"),
+            "sds1104xe",
+        )
+        transcript = verifier.Transcript(
+            identification="Siglent Technologies,SDG6022X,SDG6X,1.0\\n", suites={}
+        )
+        with self.assertRaisesRegex(ValueError, "SDG6022X"):
+            verifier.replay(transcript)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Tests."""
+
+import logging
+import unittest
+
+import numpy as np
+
+from siglent_emulator.function_generator import sdg1032x
+from siglent_emulator.function_generator import waveform
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def test_0_render(self) -> None:
+        """A sine is rendered from the channel settings."""
+        device = sdg1032x.new()
+        device.process("C1:BSWV FRQ,1000")
+        device.process("C1:BSWV AMP,2")
+        device.process("C1:BSWV OFST,0.5")
+        generator = waveform.Generator(device.channels[0], sample_rate=100_000)
+        samples = generator.render(200)
+        expected = 0.5 + np.sin(2 * np.pi * 1000 * np.arange(200) / 100_000)
+        np.testing.assert_allclose(samples, expected, atol=1e-3)
+
+    def test_1_render(self) -> None:
+        """Consecutive renders continue the signal where the last one stopped."""
+        device = sdg1032x.new()
+        whole = waveform.Generator(device.channels[0]).render(3000)
+        generator = waveform.Generator(device.channels[0])
+        parts = np.concatenate([generator.render(1000) for _ in range(3)])
+        np.testing.assert_array_equal(parts, whole)
+
+    def test_2_render(self) -> None:
+        """Square, ramp, pulse and DC swing between the expected levels."""
+        device = sdg1032x.new()
+        device.process("C1:BSWV AMP,4")
+        generator = waveform.Generator(device.channels[0], sample_rate=100_000)
+        device.process("C1:BSWV WVTP,SQUARE")
+        samples = generator.render(100)
+        self.assertEqual(set(samples.tolist()), {2.0, -2.0})
+        self.assertEqual(np.count_nonzero(samples > 0), 50)
+        device.process("C1:BSWV WVTP,PULSE")
+        self.assertEqual(set(generator.render(100).tolist()), {2.0, -2.0})
+        device.process("C1:BSWV WVTP,RAMP")
+        samples = generator.render(100)
+        self.assertAlmostEqual(samples.max(), 2.0, places=2)
+        self.assertAlmostEqual(samples.min(), -2.0, places=2)
+        device.process("C1:BSWV WVTP,DC")
+        device.process("C1:BSWV OFST,1.5")
+        self.assertEqual(set(generator.render(100).tolist()), {1.5})
+
+    def test_3_render(self) -> None:
+        """Noise is centered on the offset and repeatable with a seed."""
+        device = sdg1032x.new()
+        device.process("C1:BSWV WVTP,NOISE")
+        device.process("C1:BSWV OFST,1")
+        first = waveform.Generator(device.channels[0], seed=1).render(10000)
+        second = waveform.Generator(device.channels[0], seed=1).render(10000)
+        np.testing.assert_array_equal(first, second)
+        self.assertAlmostEqual(float(first.mean()), 1.0, places=1)
+
+    def test_4_render(self) -> None:
+        """Unsupported waveform types are rejected."""
+        device = sdg1032x.new()
+        device.process("C1:BSWV WVTP,ARB")
+        generator = waveform.Generator(device.channels[0])
+        with self.assertRaises(ValueError):
+            generator.render(10)
+
+    def test_0_period(self) -> None:
+        """The period table is kept until amplitude, offset or type change."""
+        device = sdg1032x.new()
+        generator = waveform.Generator(device.channels[0])
+        table = generator.period()
+        device.process("C1:BSWV FRQ,5000")
+        device.process("C1:BSWV PHSE,90")
+        self.assertIs(generator.period(), table)
+        device.process("C1:BSWV AMP,1")
+        self.assertIsNot(generator.period(), table)
+        self.assertAlmostEqual(float(generator.period().max()), 0.5)
+
+    def test_0_stream(self) -> None:
+        """Streams yield fixed size chunks up to the total."""
+        device = sdg1032x.new()
+        generator = waveform.Generator(device.channels[0])
+        chunks = list(generator.stream(chunk_size=1000, total=2500))
+        self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+        whole = waveform.Generator(device.channels[0]).render(2500)
+        np.testing.assert_array_equal(np.concatenate(chunks), whole)
+
+
+if __name__ == "__main__":
+    unittest.main()
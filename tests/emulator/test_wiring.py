@@ -0,0 +1,97 @@
+"""Tests."""
+
+import logging
+import unittest
+
+import numpy as np
+
+from siglent_emulator import framing
+from siglent_emulator import wiring
+from siglent_emulator.function_generator import sdg1032x
+from siglent_emulator.oscilloscope import sds1202xe
+
+logging.basicConfig(level=logging.CRITICAL)
+
+
+def read(scope: sds1202xe.SDS1202XE) -> np.ndarray:  # type: ignore[type-arg]
+    """Return the codes C1 of the scope reads."""
+    response = scope.process("C1:WF? DAT2")
+    assert isinstance(response, framing.Block)
+    return np.frombuffer(response.data, dtype=np.int8)
+
+
+class Test(unittest.TestCase):
+    """Test cases."""
+
+    def setUp(self) -> None:
+        """Cable generator C1 to scope C1, 500 points per generator period."""
+        self.generator = sdg1032x.new()
+        self.scope = sds1202xe.new()
+        self.scope.process("MSIZ 7K")
+        self.cable = wiring.Cable(self.generator.channels[0], self.scope.channels[0])
+
+    def test_0_acquire(self) -> None:
+        """The scope sees nothing until the output is turned on."""
+        self.assertEqual(read(self.scope).tolist(), [0] * 7000)
+        self.generator.process("C1:OUTP ON")
+        codes = read(self.scope)
+        # 2 V peak at 1 V per division is 50 codes
+        self.assertEqual((codes.max(), codes.min()), (50, -50))
+        self.assertEqual(codes[125], 50)
+
+    def test_1_acquire(self) -> None:
+        """LOAD, PLRT, coupling and scope settings change what is seen."""
+        self.generator.process("C1:OUTP ON,LOAD,50")
+        # Still 4 Vpp open circuit, half of it into a 50 ohm input
+        self.assertEqual(read(self.scope).max(), 50)
+        self.scope.process("C1:CPL D50")
+        self.assertEqual(read(self.scope).max(), 25)
+        self.generator.process("C1:OUTP PLRT,INVT")
+        self.assertEqual(read(self.scope)[125], -25)
+        self.scope.process("C1:CPL GND")
+        self.assertEqual(read(self.scope).tolist(), [0] * 7000)
+        self.scope.process("C1:CPL D1M")
+        self.scope.process("C1:VDIV 4V")
+        self.scope.process("C1:OFST 1V")
+        self.assertEqual(read(self.scope)[375], 19)
+
+    def test_2_acquire(self) -> None:
+        """AC coupling blocks the offset, codes saturate at the screen edges."""
+        self.generator.process("C1:OUTP ON")
+        self.generator.process("C1:BSWV OFST,1")
+        self.assertEqual(read(self.scope).max(), 75)
+        self.scope.process("C1:CPL A1M")
+        self.assertEqual(read(self.scope).max(), 50)
+        self.scope.process("C1:VDIV 10MV")
+        self.assertEqual((read(self.scope).max(), read(self.scope).min()), (127, -128))
+
+    def test_3_acquire(self) -> None:
+        """An unchanged acquisition is not rendered again."""
+        self.generator.process("C1:OUTP ON")
+        first = self.scope.process("C1:WF? DAT2")
+        second = self.scope.process("C1:WF? DAT2")
+        assert isinstance(first, framing.Block) and isinstance(second, framing.Block)
+        self.assertIs(first.data.obj, second.data.obj)
+        self.generator.process("C1:BSWV FRQ,2000")
+        third = self.scope.process("C1:WF? DAT2")
+        assert isinstance(third, framing.Block)
+        self.assertIsNot(third.data.obj, first.data.obj)
+        self.assertEqual(bytes(first.data), bytes(second.data))
+
+    def test_4_acquire(self) -> None:
+        """A VDIV of zero or less is rejected, acquisitions still scale."""
+        self.generator.process("C1:OUTP ON")
+        for vdiv in ["0", "-1V"]:
+            self.scope.process(f"C1:VDIV {vdiv}")
+            self.assertEqual(self.scope.process("C1:VDIV?"), "C1:VDIV 1.00E+00V")
+            self.assertEqual(read(self.scope).max(), 50)
+
+    def test_0_unplug(self) -> None:
+        """An unplugged input reads as disconnected."""
+        self.generator.process("C1:OUTP ON")
+        self.cable.unplug()
+        self.assertEqual(read(self.scope).max(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -41,7 +41,7 @@ class Amplitude:
             # The status was not what we expected it to be
             return -1
         status = status[index + 4 :]
-        status = status.split(",")[0]
+        status = status.split(",", maxsplit=1)[0]
         # Strip the 'V' off
         status = status[:-1]
         result = float(status)
@@ -6,21 +6,22 @@ from siglent_emulator import emulator
 
 from . import siglent_device
 
-IP_ADDR = "127.0.0.1"
-PORT = 21111
-
 
 class Test(unittest.TestCase):
     """Test cases."""
 
+    ip_addr: str
+    port: int
+
     @classmethod
     def setUpClass(cls) -> None:
-        emulator.start(device="SDG1032x", port=PORT, daemon=True)
+        # Port 0 listens on any free port, start() returns the one it got
+        cls.ip_addr, cls.port = emulator.start(device="SDG1032x", port=0, daemon=True)
 
     def test_set_amplitude(self) -> None:
         """Confirm the amplitude we set was actually set."""
         device = siglent_device.Amplitude()
-        device.connect(ip_addr=IP_ADDR, port=PORT)
+        device.connect(ip_addr=self.ip_addr, port=self.port)
         device.set_amplitude(channel=1, amplitude=13.67)
         self.assertEqual(device.get_amplitude(channel=1), 13.67)
         device.close()